@@ -0,0 +1,116 @@
+"""
+Cache of the moves chosen by the cpu players, keyed by position.
+
+Positions repeat often (undo, reloaded games, cpu vs cpu games from the same
+opening), so the move found for a position is kept and handed back straight
+away the next time the same backend is asked with the same limits.
+
+The most recently used entries are kept in memory. If a path is given, entries
+are also stored in a sqlite database so they survive restarts.
+"""
+
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Optional
+import chess
+import chess.polyglot
+from helpers.log import LOGGER
+
+
+class MoveCache:
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        path: Optional[str] = None,
+        max_disk_entries: int = 100000,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.entries: "OrderedDict[str, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        self.db: Optional[sqlite3.Connection] = None
+        if path:
+            self.db = sqlite3.connect(path)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS moves "
+                "(key TEXT PRIMARY KEY, move TEXT NOT NULL, used REAL NOT NULL)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS moves_used ON moves (used)")
+            self.db.commit()
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    @staticmethod
+    def make_key(board: chess.Board, backend: str, limits: str) -> str:
+        """
+        Zobrist hash of the position, plus what was used to find the move
+        """
+        return f"{chess.polyglot.zobrist_hash(board):016x}:{backend}:{limits}"
+
+    def get(
+        self, board: chess.Board, backend: str, limits: str
+    ) -> Optional[chess.Move]:
+        """
+        Return the cached move for the position, None if there is none
+        """
+        key = self.make_key(board, backend, limits)
+        uci = self.entries.get(key)
+        if uci is not None:
+            self.entries.move_to_end(key)
+        elif self.db:
+            row = self.db.execute(
+                "SELECT move FROM moves WHERE key = ?", (key,)
+            ).fetchone()
+            if row:
+                uci = row[0]
+                self._remember(key, uci)
+
+        move = chess.Move.from_uci(uci) if uci else None
+        if move is None or not board.is_legal(move):
+            # hash collisions are possible, never hand back an illegal move
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        if self.db:
+            # entries are evicted from disk least recently used first
+            self.db.execute(
+                "UPDATE moves SET used = ? WHERE key = ?", (time.time(), key)
+            )
+            self.db.commit()
+        LOGGER.info("Move cache hit %s (hit ratio %.0f%%)", move, self.hit_ratio * 100)
+        return move
+
+    def put(
+        self, board: chess.Board, backend: str, limits: str, move: chess.Move
+    ) -> None:
+        key = self.make_key(board, backend, limits)
+        self._remember(key, move.uci())
+        if self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO moves (key, move, used) VALUES (?, ?, ?)",
+                (key, move.uci(), time.time()),
+            )
+            self.db.execute(
+                "DELETE FROM moves WHERE key IN (SELECT key FROM moves "
+                "ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_entries,),
+            )
+            self.db.commit()
+
+    def _remember(self, key: str, uci: str) -> None:
+        self.entries[key] = uci
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def close(self) -> None:
+        if self.db:
+            self.db.close()
+            self.db = None
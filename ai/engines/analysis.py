@@ -0,0 +1,254 @@
+"""
+Batch analysis of PGN archives with the piece squares v2 engine or stockfish.
+
+Games are streamed from the PGN file one at a time and the positions of each
+game are fanned out to a pool of worker processes. Every move is annotated
+with the engine's best move and evaluation, and inaccuracies, mistakes and
+blunders are marked with the usual ?!, ? and ?? NAGs. Only a few games are
+held in memory at once, whatever the size of the file.
+
+Annotated games are appended to the output as soon as they are finished, in
+the order they were read. The byte offset of the next game to read is kept in
+a progress file next to the output, so an interrupted run carries on where it
+stopped when started again with the same arguments.
+
+Usage: python -m ai.engines.analysis games.pgn annotated.pgn [--depth N]
+       [--engine piece_squares2|stockfish] [--stockfish PATH] [--workers N]
+"""
+
+import argparse
+import json
+import multiprocessing.util
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Iterator, List, Optional, Tuple
+import chess
+import chess.engine
+import chess.pgn
+from ai.engines import piece_squares2
+from ai.engines.piece_squares2 import MATE_SCORE
+from helpers.log import LOGGER
+
+# centipawns lost by a move to mark it
+INACCURACY = 50
+MISTAKE = 100
+BLUNDER = 300
+
+# (best move, score of the best move, score of the played move), side to move
+PositionResult = Tuple[Optional[str], int, int]
+
+# per process engine, created by init_worker
+worker_engine = None
+worker_depth = 3
+
+
+def init_worker(engine: str, depth: int, stockfish_path: Optional[str]) -> None:
+    global worker_engine, worker_depth
+    worker_depth = depth
+    if engine == "stockfish":
+        from ai.engines.stockfish import StockFishEngine
+
+        worker_engine = StockFishEngine(stockfish_path or "assets/engines/stockfish")
+        # the engine's thread would keep the worker from exiting
+        multiprocessing.util.Finalize(None, worker_engine.quit, exitpriority=10)
+
+
+def engine_search(
+    board: chess.Board, depth: int, root_moves: Optional[List[chess.Move]] = None
+) -> Tuple[Optional[chess.Move], int]:
+    """
+    Best move and score of the position, from the side to move. root_moves
+    limits the search to these moves.
+    """
+    if board.is_checkmate():
+        return None, -MATE_SCORE
+    if board.is_game_over():
+        return None, 0
+
+    if worker_engine is not None:
+        info = worker_engine.analyse(board, chess.engine.Limit(depth=depth), root_moves)
+        score = info["score"].relative.score(mate_score=MATE_SCORE)
+        pv = info.get("pv") or [None]
+        return pv[0], score
+
+    move, stats = piece_squares2.search(board, depth, root_moves=root_moves)
+    return move, stats.score
+
+
+def analyse_position(fen: str, played: str) -> PositionResult:
+    """
+    Score the best move and the played move of the position, in a worker
+    """
+    board = chess.Board(fen)
+    played_move = chess.Move.from_uci(played)
+    best, best_score = engine_search(board, worker_depth)
+
+    if best == played_move:
+        played_score = best_score
+    else:
+        # searched from the same position to the same depth as the best move,
+        # so the scores can be compared
+        _, played_score = engine_search(board, worker_depth, [played_move])
+
+    return best.uci() if best else None, best_score, played_score
+
+
+def read_games(path: str, offset: int) -> Iterator[Tuple[int, chess.pgn.Game]]:
+    """
+    Stream the games from offset, with the offset just after each game
+    """
+    with open(path, "r", encoding="utf-8", errors="replace") as handle:
+        handle.seek(offset)
+        while True:
+            game = chess.pgn.read_game(handle)
+            if game is None:
+                break
+            yield handle.tell(), game
+
+
+def format_score(score: int) -> str:
+    if abs(score) >= MATE_SCORE - 200:
+        return "#" if score > 0 else "#-"
+    return f"{score / 100:+.2f}"
+
+
+def annotate(game: chess.pgn.Game, results: List[PositionResult]) -> None:
+    """
+    Comment each move with its evaluation, from white's point of view as is
+    usual in PGN, and the best move when the played one loses too much
+    """
+    node: chess.pgn.GameNode = game
+    for (best, best_score, played_score), child in zip(results, game.mainline()):
+        sign = 1 if node.turn() == chess.WHITE else -1
+        loss = best_score - played_score
+        if best and best != child.move.uci() and loss >= INACCURACY:
+            if loss >= BLUNDER:
+                child.nags.add(chess.pgn.NAG_BLUNDER)
+            elif loss >= MISTAKE:
+                child.nags.add(chess.pgn.NAG_MISTAKE)
+            else:
+                child.nags.add(chess.pgn.NAG_DUBIOUS_MOVE)
+            san = node.board().san(chess.Move.from_uci(best))
+            child.comment = (
+                f"{format_score(sign * played_score)}, "
+                f"best {san} {format_score(sign * best_score)}"
+            )
+        else:
+            child.comment = format_score(sign * played_score)
+        node = child
+
+
+def load_progress(progress_path: str, output_path: str) -> Tuple[int, int]:
+    """
+    Offset of the next game to read and number of games done. Output written
+    after the last recorded game, by an interrupted run, is dropped.
+    """
+    if not os.path.exists(progress_path):
+        # a new run appends to the output, anything already in it is kept
+        output_size = os.path.getsize(output_path) if os.path.exists(output_path) else 0
+        save_progress(progress_path, 0, 0, output_size)
+        return 0, 0
+
+    with open(progress_path, "r") as file:
+        progress = json.load(file)
+    with open(output_path, "a") as file:
+        file.truncate(progress["output_size"])
+    return progress["offset"], progress["games"]
+
+
+def save_progress(progress_path: str, offset: int, games: int, output_size: int):
+    tmp_path = progress_path + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump({"offset": offset, "games": games, "output_size": output_size}, file)
+    os.replace(tmp_path, progress_path)
+
+
+def run_analysis(
+    pgn_path: str,
+    output_path: str,
+    engine: str = "piece_squares2",
+    depth: int = 3,
+    workers: Optional[int] = None,
+    stockfish_path: Optional[str] = None,
+) -> int:
+    """
+    Annotate the games of pgn_path into output_path, return the number of
+    games annotated by this run
+    """
+    progress_path = output_path + ".progress"
+    offset, done = load_progress(progress_path, output_path)
+    if done:
+        LOGGER.info("Resuming after %d games", done)
+
+    workers = workers or os.cpu_count() or 1
+    # games being analysed, at most a couple per worker
+    pending: Deque[Tuple[int, chess.pgn.Game, List[Future]]] = deque()
+    annotated = 0
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(
+        workers, initializer=init_worker, initargs=(engine, depth, stockfish_path)
+    ) as executor, open(output_path, "a") as output:
+
+        def write_oldest() -> None:
+            nonlocal done, annotated
+            next_offset, game, futures = pending.popleft()
+            annotate(game, [future.result() for future in futures])
+            game.headers["Annotator"] = f"KnightFight {engine} depth {depth}"
+            print(game, file=output, end="\n\n")
+            output.flush()
+            done += 1
+            annotated += 1
+            save_progress(progress_path, next_offset, done, output.tell())
+            LOGGER.info(
+                "Annotated game %d: %s - %s",
+                done,
+                game.headers.get("White"),
+                game.headers.get("Black"),
+            )
+
+        for next_offset, game in read_games(pgn_path, offset):
+            board = game.board()
+            futures = []
+            for move in game.mainline_moves():
+                futures.append(
+                    executor.submit(analyse_position, board.fen(), move.uci())
+                )
+                board.push(move)
+            pending.append((next_offset, game, futures))
+
+            while len(pending) > 2 * workers:
+                write_oldest()
+
+        while pending:
+            write_oldest()
+
+    elapsed = time.perf_counter() - start
+    LOGGER.info("Annotated %d games in %.1fs", annotated, elapsed)
+    return annotated
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Annotate the games of a PGN file")
+    parser.add_argument("pgn", help="PGN file to analyse")
+    parser.add_argument("output", help="annotated PGN file, appended to")
+    parser.add_argument(
+        "--engine", choices=["piece_squares2", "stockfish"], default="piece_squares2"
+    )
+    parser.add_argument("--depth", type=int, default=3, help="search depth")
+    parser.add_argument(
+        "--workers", type=int, default=None, help="worker processes (default: cpus)"
+    )
+    parser.add_argument("--stockfish", default=None, help="path to stockfish")
+    args = parser.parse_args()
+
+    annotated = run_analysis(
+        args.pgn, args.output, args.engine, args.depth, args.workers, args.stockfish
+    )
+    print(f"{annotated} games annotated, written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
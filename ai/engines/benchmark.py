@@ -0,0 +1,122 @@
+"""
+Fixed position benchmark for the piece squares v2 search.
+
+Searches a set of positions to a fixed depth with each combination of search
+enhancements and reports the time to depth, the main search and quiescence
+node counts, and whether the move found agrees with the plain alpha-beta
+search.
+
+Usage: python -m ai.engines.benchmark [--depth N]
+"""
+
+import argparse
+import time
+from typing import List, NamedTuple
+import chess
+from ai.engines import piece_squares2
+from ai.engines.piece_squares2 import SearchOptions
+
+BENCHMARK_POSITIONS = [
+    # starting position
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    # kiwipete
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    # italian game
+    "r1bqk1nr/pppp1ppp/2n5/2b1p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4",
+    # scholar's mate threat
+    "r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4",
+    # back rank mate
+    "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1",
+    # rook and pawns endgame
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+]
+
+NO_QUIESCENCE_PRUNING = dict(see_pruning=False, delta_pruning=False)
+
+BENCHMARK_CONFIGS = [
+    (
+        "alphabeta",
+        SearchOptions(pvs=False, null_move=False, lmr=False, **NO_QUIESCENCE_PRUNING),
+    ),
+    (
+        "pvs",
+        SearchOptions(pvs=True, null_move=False, lmr=False, **NO_QUIESCENCE_PRUNING),
+    ),
+    (
+        "pvs+null",
+        SearchOptions(pvs=True, null_move=True, lmr=False, **NO_QUIESCENCE_PRUNING),
+    ),
+    (
+        "pvs+null+lmr",
+        SearchOptions(pvs=True, null_move=True, lmr=True, **NO_QUIESCENCE_PRUNING),
+    ),
+    ("all", SearchOptions()),
+]
+
+
+class BenchmarkResult(NamedTuple):
+    name: str
+    times: List[float]
+    nodes: List[int]
+    qnodes: List[int]
+    moves: List[chess.Move]
+
+
+def run_benchmark(
+    depth: int, positions: List[str] = BENCHMARK_POSITIONS
+) -> List[BenchmarkResult]:
+    """
+    Search every position with every config, return the time taken, node
+    counts and move found per position for each config
+    """
+    results = []
+    for name, options in BENCHMARK_CONFIGS:
+        result = BenchmarkResult(name, [], [], [], [])
+        for fen in positions:
+            board = chess.Board(fen)
+            piece_squares2.clear_hash()
+            start = time.perf_counter()
+            move, stats = piece_squares2.search(board, depth, options)
+            result.times.append(time.perf_counter() - start)
+            result.nodes.append(stats.nodes)
+            result.qnodes.append(stats.qnodes)
+            result.moves.append(move)
+        results.append(result)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--depth", type=int, default=3, help="search depth")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.depth)
+    baseline_moves = results[0].moves
+
+    print(f"depth {args.depth}, {len(BENCHMARK_POSITIONS)} positions")
+    print(
+        f"{'config':<16}{'time (s)':>10}{'nodes':>10}{'qnodes':>10}"
+        f"{'nps':>10}{'agree':>8}"
+    )
+    for result in results:
+        agree = sum(1 for a, b in zip(result.moves, baseline_moves) if a == b)
+        total_nodes = sum(result.nodes) + sum(result.qnodes)
+        nps = int(total_nodes / sum(result.times)) if sum(result.times) else 0
+        print(
+            f"{result.name:<16}{sum(result.times):>10.2f}{sum(result.nodes):>10}"
+            f"{sum(result.qnodes):>10}{nps:>10}{agree:>5}/{len(result.moves)}"
+        )
+
+    print()
+    for index, fen in enumerate(BENCHMARK_POSITIONS):
+        print(fen)
+        for result in results:
+            print(
+                f"  {result.name:<16}{result.times[index]:>8.2f}s"
+                f"{result.nodes[index]:>10}{result.qnodes[index]:>10}"
+                f"  {result.moves[index].uci()}"
+            )
+
+
+if __name__ == "__main__":
+    main()
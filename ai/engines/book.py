@@ -0,0 +1,213 @@
+"""
+Build a polyglot opening book from local PGN files.
+
+Games are streamed from the PGN files one at a time and every move played in
+the first plies of a game is counted against the Zobrist key of the position
+it was played from. Counts are gathered in a small in-memory buffer that is
+merged into a temporary sqlite database whenever it fills up, so the memory
+used does not depend on the size of the collection.
+
+Moves seen fewer than --min-count times are dropped and the rest are written
+as polyglot entries sorted by key, with the weight of each move proportional
+to the number of times it was played. The output can be loaded with
+chess.polyglot.MemoryMappedReader, which is how the engines use
+assets/books/human.bin.
+
+Usage: python -m ai.engines.book games.pgn [more.pgn ...]
+       [--output assets/books/human.bin] [--max-ply N] [--min-count N]
+"""
+
+import argparse
+import itertools
+import os
+import sqlite3
+import tempfile
+import time
+from typing import Dict, Iterator, List, Tuple
+import chess
+import chess.pgn
+import chess.polyglot
+from helpers.log import LOGGER
+
+MAX_PLY = 24
+MIN_COUNT = 2
+# (key, move) pairs held in memory before merging into the database
+BUFFER_SIZE = 100_000
+
+MAX_WEIGHT = 0xFFFF
+# sqlite integers are signed, shifting keeps them in polyglot order
+KEY_OFFSET = 1 << 63
+
+BookCounts = Dict[Tuple[int, int], int]
+
+
+def encode_move(board: chess.Board, move: chess.Move) -> int:
+    """
+    Polyglot encoding of a move, castling is written as the king taking its rook
+    """
+    move = board._to_chess960(move)
+    promotion = move.promotion - 1 if move.promotion else 0
+    return move.to_square | move.from_square << 6 | promotion << 12
+
+
+def game_moves(game: chess.pgn.Game, max_ply: int) -> Iterator[Tuple[int, int]]:
+    """
+    (Zobrist key, polyglot move) of the first max_ply moves of a game
+    """
+    board = game.board()
+    for move in itertools.islice(game.mainline_moves(), max_ply):
+        yield chess.polyglot.zobrist_hash(board), encode_move(board, move)
+        board.push(move)
+
+
+def read_games(path: str) -> Iterator[chess.pgn.Game]:
+    with open(path, encoding="utf-8", errors="replace") as handle:
+        while True:
+            game = chess.pgn.read_game(handle)
+            if game is None:
+                return
+            if game.errors:
+                LOGGER.warning("Skipping game with errors: %s", game.errors[0])
+                continue
+            yield game
+
+
+def scale_weights(counts: List[int]) -> List[int]:
+    """
+    Weights of the moves of one position, scaled down to fit polyglot's 16 bits
+    """
+    most = max(counts)
+    if most <= MAX_WEIGHT:
+        return counts
+    return [max(1, count * MAX_WEIGHT // most) for count in counts]
+
+
+class BookBuilder:
+    def __init__(self, db_path: str = "", buffer_size: int = BUFFER_SIZE):
+        self.conn = sqlite3.connect(db_path or ":memory:")
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS moves ("
+            "key INTEGER NOT NULL, move INTEGER NOT NULL, count INTEGER NOT NULL, "
+            "PRIMARY KEY (key, move)) WITHOUT ROWID"
+        )
+        self.buffer: BookCounts = {}
+        self.buffer_size = buffer_size
+        self.games = 0
+
+    def add_game(self, game: chess.pgn.Game, max_ply: int = MAX_PLY) -> None:
+        for entry in game_moves(game, max_ply):
+            self.buffer[entry] = self.buffer.get(entry, 0) + 1
+        self.games += 1
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Merge the buffered counts into the database
+        """
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO moves (key, move, count) VALUES (?, ?, ?) "
+                "ON CONFLICT (key, move) DO UPDATE SET count = count + excluded.count",
+                (
+                    (key - KEY_OFFSET, move, count)
+                    for (key, move), count in self.buffer.items()
+                ),
+            )
+        self.buffer.clear()
+
+    def entries(self, min_count: int = MIN_COUNT) -> Iterator[bytes]:
+        """
+        Packed polyglot entries in key order, most played move first
+        """
+        self.flush()
+        rows = self.conn.execute(
+            "SELECT key, move, count FROM moves WHERE count >= ? "
+            "ORDER BY key, count DESC, move",
+            (min_count,),
+        )
+        for key, group in itertools.groupby(rows, key=lambda row: row[0]):
+            moves = list(group)
+            weights = scale_weights([count for _, _, count in moves])
+            for (_, move, _), weight in zip(moves, weights):
+                yield chess.polyglot.ENTRY_STRUCT.pack(
+                    key + KEY_OFFSET, move, weight, 0
+                )
+
+    def write(self, path: str, min_count: int = MIN_COUNT) -> int:
+        """
+        Write the book to path and return the number of entries
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        written = 0
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as handle:
+            for entry in self.entries(min_count):
+                handle.write(entry)
+                written += 1
+        os.replace(tmp_path, path)
+        return written
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def build_book(
+    pgn_paths: List[str],
+    output: str,
+    max_ply: int = MAX_PLY,
+    min_count: int = MIN_COUNT,
+    buffer_size: int = BUFFER_SIZE,
+) -> int:
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        builder = BookBuilder(os.path.join(tmp_dir, "book.db"), buffer_size)
+        try:
+            for path in pgn_paths:
+                for game in read_games(path):
+                    builder.add_game(game, max_ply)
+                    if builder.games % 1000 == 0:
+                        print(f"{builder.games} games read")
+            entries = builder.write(output, min_count)
+        finally:
+            builder.close()
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"{entries} entries from {builder.games} games written to {output} "
+        f"in {elapsed:.1f}s"
+    )
+    return entries
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Build a polyglot opening book from PGN files"
+    )
+    parser.add_argument("pgn", nargs="+", help="PGN files to read")
+    parser.add_argument("--output", "-o", default="assets/books/human.bin")
+    parser.add_argument(
+        "--max-ply", type=int, default=MAX_PLY, help="moves counted per game"
+    )
+    parser.add_argument(
+        "--min-count",
+        type=int,
+        default=MIN_COUNT,
+        help="times a move must be played to go in the book",
+    )
+    parser.add_argument(
+        "--buffer",
+        type=int,
+        default=BUFFER_SIZE,
+        help="moves counted in memory before merging to disk",
+    )
+    args = parser.parse_args()
+    build_book(args.pgn, args.output, args.max_ply, args.min_count, args.buffer)
+
+
+if __name__ == "__main__":
+    main()
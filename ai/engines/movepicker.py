@@ -0,0 +1,105 @@
+"""
+Move generation for the piece squares searches.
+
+Instead of generating every legal move up front, moves are produced in stages
+so that the search can stop generating as soon as it gets a cutoff -
+
+1. the hash move from the transposition table
+2. captures and promotions, most valuable victim / least valuable attacker
+3. killer moves, quiet moves that caused a cutoff at the same ply
+4. the remaining quiet moves
+
+Quiescence only needs captures and promotions, which are generated without
+touching the quiet moves at all.
+"""
+
+from typing import Iterator, List, Optional, Sequence
+import chess
+
+
+def mvv_lva(board: chess.Board, move: chess.Move) -> int:
+    """
+    Most valuable victim, least valuable attacker ordering score
+    """
+    if board.is_en_passant(move):
+        victim = chess.PAWN
+    else:
+        victim = board.piece_type_at(move.to_square) or 0
+    attacker = board.piece_type_at(move.from_square) or 0
+    return victim * 10 - attacker + (move.promotion or 0) * 10
+
+
+def generate_promotions(
+    board: chess.Board, queen_only: bool = False
+) -> Iterator[chess.Move]:
+    """
+    Generate legal non capturing promotions
+    """
+    seventh_rank = chess.BB_RANK_7 if board.turn == chess.WHITE else chess.BB_RANK_2
+    pawns = board.pawns & board.occupied_co[board.turn] & seventh_rank
+    if not pawns:
+        return
+
+    for move in board.generate_legal_moves(pawns, ~board.occupied):
+        if not queen_only or move.promotion == chess.QUEEN:
+            yield move
+
+
+def generate_noisy_moves(
+    board: chess.Board, queen_only: bool = False
+) -> List[chess.Move]:
+    """
+    Legal captures and promotions, the only moves searched in quiescence
+    """
+    moves = list(board.generate_legal_captures())
+    if queen_only:
+        moves = [
+            move
+            for move in moves
+            if not move.promotion or move.promotion == chess.QUEEN
+        ]
+    moves.extend(generate_promotions(board, queen_only))
+    return moves
+
+
+def pick_moves(
+    board: chess.Board,
+    hash_move: Optional[chess.Move] = None,
+    killers: Sequence[Optional[chess.Move]] = (),
+) -> Iterator[chess.Move]:
+    """
+    Yield the legal moves of the position in stages, see module docstring
+    """
+    searched = []
+
+    # hash move
+    if hash_move and board.is_legal(hash_move):
+        searched.append(hash_move)
+        yield hash_move
+
+    # captures and promotions
+    noisy = generate_noisy_moves(board)
+    noisy.sort(key=lambda move: mvv_lva(board, move), reverse=True)
+    for move in noisy:
+        if move not in searched:
+            yield move
+
+    # killer moves
+    for move in killers:
+        if (
+            move
+            and move not in searched
+            and board.is_legal(move)
+            and not board.is_capture(move)
+            and not move.promotion
+        ):
+            searched.append(move)
+            yield move
+
+    # quiet moves, only generated if none of the above caused a cutoff
+    for move in board.generate_legal_moves(
+        chess.BB_ALL, ~board.occupied_co[not board.turn]
+    ):
+        if board.is_capture(move) or move.promotion or move in searched:
+            continue
+        yield move
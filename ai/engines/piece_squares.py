@@ -1,3 +1,4 @@
+import time
 import chess
 import chess.polyglot
 from ai.engines.piece_tables import (
@@ -8,6 +9,11 @@ from ai.engines.piece_tables import (
     queenstable,
     kingstable,
 )
+from ai.engines.movepicker import generate_noisy_moves
+from ai.engines.see import PIECE_VALUES, captured_value, see
+from ai.engines.stats import SearchStats
+from ai.engines import tablebase
+from helpers.log import LOGGER
 
 """
 See piece_squares2.py for an improved version of this technique.
@@ -42,6 +48,11 @@ The endgame needs a different table. I will do this in a future enhancement of t
 
 movehistory = []
 
+DELTA_MARGIN = 200
+
+# statistics of the last search
+stats = SearchStats()
+
 
 def evaluate_board(board: chess.Board) -> int:
     if board.is_checkmate():
@@ -123,15 +134,22 @@ def evaluate_board(board: chess.Board) -> int:
         return -eval
 
 
-def alphabeta(alpha, beta, depthleft, board):
+def alphabeta(alpha, beta, depthleft, board, ply=1):
     bestscore = -9999
     if depthleft == 0:
-        return quiesce(alpha, beta, board)
-    for move in board.legal_moves:
+        return quiesce(alpha, beta, board, ply)
+
+    stats.nodes += 1
+    if ply > stats.seldepth:
+        stats.seldepth = ply
+    for index, move in enumerate(board.legal_moves):
         board.push(move)
-        score = -alphabeta(-beta, -alpha, depthleft - 1, board)
+        score = -alphabeta(-beta, -alpha, depthleft - 1, board, ply + 1)
         board.pop()
         if score >= beta:
+            stats.cutoffs += 1
+            if index == 0:
+                stats.first_move_cutoffs += 1
             return score
         if score > bestscore:
             bestscore = score
@@ -140,36 +158,73 @@ def alphabeta(alpha, beta, depthleft, board):
     return bestscore
 
 
-def quiesce(alpha, beta, board):
+def quiesce(alpha, beta, board, ply=0):
+    stats.qnodes += 1
+    if ply > stats.seldepth:
+        stats.seldepth = ply
+
     stand_pat = evaluate_board(board)
     if stand_pat >= beta:
         return beta
+    # delta pruning, not even winning a queen would bring the score up to alpha
+    if stand_pat + PIECE_VALUES[chess.QUEEN] + DELTA_MARGIN < alpha:
+        return alpha
     if alpha < stand_pat:
         alpha = stand_pat
 
-    for move in board.legal_moves:
-        if board.is_capture(move):
-            board.push(move)
-            score = -quiesce(-beta, -alpha, board)
-            board.pop()
+    # best exchanges first, drop the ones that lose material
+    exchanges = [
+        (see(board, move), move)
+        for move in generate_noisy_moves(board, queen_only=True)
+    ]
+    exchanges.sort(key=lambda exchange: exchange[0], reverse=True)
+
+    for value, move in exchanges:
+        if value < 0:
+            break
+
+        # delta pruning, this capture cannot bring the score up to alpha
+        if (
+            not move.promotion
+            and stand_pat + captured_value(board, move) + DELTA_MARGIN <= alpha
+        ):
+            continue
 
-            if score >= beta:
-                return beta
-            if score > alpha:
-                alpha = score
+        board.push(move)
+        score = -quiesce(-beta, -alpha, board, ply + 1)
+        board.pop()
+
+        if score >= beta:
+            return beta
+        if score > alpha:
+            alpha = score
     return alpha
 
 
 def get_informed_move(board: chess.Board, depth: int):
+    global stats
+
     try:
         move = (
             chess.polyglot.MemoryMappedReader("bookfish.bin")
             .weighted_choice(board)
             .move
         )
+        stats = SearchStats(pv=[move])
         movehistory.append(move)
         return move
     except:
+        stats = SearchStats()
+        start = time.perf_counter()
+
+        # perfect play straight from the tablebase
+        tablebase_move = tablebase.probe_root(board)
+        if tablebase_move:
+            stats.tb_hits += 1
+            stats.pv = [tablebase_move]
+            movehistory.append(tablebase_move)
+            return tablebase_move
+
         bestMove = chess.Move.null()
         bestValue = -99999
         alpha = -100000
@@ -183,5 +238,12 @@ def get_informed_move(board: chess.Board, depth: int):
             if boardValue > alpha:
                 alpha = boardValue
             board.pop()
+
+        stats.depth = depth
+        stats.score = bestValue
+        stats.time = time.perf_counter() - start
+        stats.pv = [bestMove]
+        LOGGER.info("piece_squares search: %s", stats)
+
         movehistory.append(bestMove)
         return bestMove
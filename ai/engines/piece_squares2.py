@@ -1,10 +1,40 @@
 """
 Tweaked version of -
 https://medium.datadriveninvestor.com/an-incremental-evaluation-function-and-a-testsuite-for-computer-chess-6fde22aac137
+
+The search is a negamax alpha-beta with the following enhancements, each of
+which can be switched off through SearchOptions (cpu section of config.yml) -
+
+Principal variation search (pvs)
+    The first move of every node is searched with the full window, the rest
+    with a null window. Only moves that beat alpha are re-searched in full.
+
+Null move pruning (null_move)
+    The side to move passes. If a reduced search still fails high, the node is
+    pruned. Skipped when in check or when the side to move has only pawns left,
+    as zugzwang makes the null move observation unsound there.
+
+Late move reductions (lmr)
+    Quiet moves ordered late are searched one ply shallower and re-searched at
+    full depth only if they beat alpha.
+
+Moves are generated in stages (see movepicker.py), starting with the best
+move stored in the transposition table, so quiet moves are not generated at
+all when a capture or killer move already causes a cutoff.
+
+Positions covered by the syzygy tablebases (see tablebase.py) are looked up
+instead of searched, with the root move taken straight from the tables.
+
+Quiescence search only looks at captures and queen promotions, ordered by
+static exchange evaluation. Captures that lose material are pruned (see_pruning) as are
+captures that cannot raise the score up to alpha (delta_pruning).
+In check every evasion is searched instead, so a mate at the horizon is seen.
 """
-from typing import Optional
+from dataclasses import dataclass
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
 import chess
-import chess.svg
 from ai.engines.piece_tables import (
     pawntable,
     knightstable,
@@ -13,9 +43,59 @@ from ai.engines.piece_tables import (
     queenstable,
     kingstable,
 )
+from ai.engines.movepicker import generate_noisy_moves, mvv_lva, pick_moves
+from ai.engines.see import captured_value, see
+from ai.engines.stats import SearchStats
+from ai.engines import tablebase
+from helpers.log import LOGGER
 
 movehistory = []
 
+MATE_SCORE = 9999
+NULL_MOVE_REDUCTION = 2
+LMR_MIN_DEPTH = 3
+LMR_MIN_MOVES = 3
+DELTA_MARGIN = 200
+MAX_PLY = 64
+TB_WIN_SCORE = MATE_SCORE - 2 * MAX_PLY
+# mate and tablebase win scores are beyond this, they depend on the ply
+WIN_BOUND = TB_WIN_SCORE - MAX_PLY
+
+# the search state below is module global, search() holds this lock so that
+# only one search (e.g. pondering and the game's own search) runs at a time
+search_lock = threading.Lock()
+
+# statistics of the last search
+stats = SearchStats()
+
+# set to stop the running search, see search()
+stop_event: Optional[threading.Event] = None
+
+# transposition table, position key -> (depth, score, flag, best move)
+# kept between searches, so the previous move's search helps the next one
+TT_EXACT = 0
+TT_LOWER = 1
+TT_UPPER = 2
+TT_MAX_ENTRIES = 1000000
+TT_ENTRIES_PER_MB = 5000
+transposition_table = {}
+
+# two quiet moves per ply that caused a beta cutoff
+killers = [[None, None] for _ in range(MAX_PLY)]
+
+
+@dataclass
+class SearchOptions:
+    """
+    Switches for the search enhancements
+    """
+
+    pvs: bool = True
+    null_move: bool = True
+    lmr: bool = True
+    see_pruning: bool = True
+    delta_pruning: bool = True
+
 
 def init_evaluate_board(board: chess.Board):
     global boardvalue
@@ -89,10 +169,8 @@ def init_evaluate_board(board: chess.Board):
 
 def evaluate_board(board: chess.Board):
     if board.is_checkmate():
-        if board.turn:
-            return -9999
-        else:
-            return 9999
+        # side to move has been mated
+        return -MATE_SCORE
     if board.is_stalemate():
         return 0
     if board.is_insufficient_material():
@@ -118,149 +196,541 @@ piecevalues = [100, 320, 330, 500, 900]
 boardvalue = 0
 
 
-def update_eval(
-    board: chess.Board, mov: chess.Move, side: chess.Color
-) -> Optional[chess.Move]:
-    global boardvalue
+def update_eval(board: chess.Board, mov: chess.Move) -> int:
+    """
+    Return the change in boardvalue (from white's point of view) caused by mov.
+    The board must be in the position before mov is played.
+    """
+    if not mov:
+        # null move
+        return 0
 
-    # update piecequares
     movingpiece = board.piece_type_at(mov.from_square)
-    if movingpiece:
-        if side:
-            boardvalue = boardvalue - tables[movingpiece - 1][mov.from_square]
-            # update castling
-            if (mov.from_square == chess.E1) and (mov.to_square == chess.G1):
-                boardvalue = boardvalue - rookstable[chess.H1]
-                boardvalue = boardvalue + rookstable[chess.F1]
-            elif (mov.from_square == chess.E1) and (mov.to_square == chess.C1):
-                boardvalue = boardvalue - rookstable[chess.A1]
-                boardvalue = boardvalue + rookstable[chess.D1]
-        else:
-            boardvalue = boardvalue + tables[movingpiece - 1][mov.from_square]
-            # update castling
-            if (mov.from_square == chess.E8) and (mov.to_square == chess.G8):
-                boardvalue = boardvalue + rookstable[chess.H8]
-                boardvalue = boardvalue - rookstable[chess.F8]
-            elif (mov.from_square == chess.E8) and (mov.to_square == chess.C8):
-                boardvalue = boardvalue + rookstable[chess.A8]
-                boardvalue = boardvalue - rookstable[chess.D8]
-
-        if side:
-            boardvalue = boardvalue + tables[movingpiece - 1][mov.to_square]
+    if not movingpiece:
+        return 0
+
+    side = board.turn
+
+    # piece square tables are from white's point of view, mirror for black
+    def own(square: chess.Square) -> chess.Square:
+        return square if side == chess.WHITE else chess.square_mirror(square)
+
+    def their(square: chess.Square) -> chess.Square:
+        return chess.square_mirror(square) if side == chess.WHITE else square
+
+    # update piecesquares
+    value = (
+        tables[movingpiece - 1][own(mov.to_square)]
+        - tables[movingpiece - 1][own(mov.from_square)]
+    )
+
+    # update castling
+    if board.is_castling(mov):
+        rank = chess.square_rank(mov.from_square)
+        if chess.square_file(mov.to_square) > chess.square_file(mov.from_square):
+            rook_from, rook_to = chess.square(7, rank), chess.square(5, rank)
         else:
-            boardvalue = boardvalue - tables[movingpiece - 1][mov.to_square]
+            rook_from, rook_to = chess.square(0, rank), chess.square(3, rank)
+        value += rookstable[own(rook_to)] - rookstable[own(rook_from)]
+
+    # update promotion
+    if mov.promotion:
+        value += (
+            piecevalues[mov.promotion - 1]
+            - piecevalues[movingpiece - 1]
+            + tables[mov.promotion - 1][own(mov.to_square)]
+            - tables[movingpiece - 1][own(mov.to_square)]
+        )
 
-        # update material
-        if mov.drop != None:
-            if side:
-                boardvalue = boardvalue + piecevalues[mov.drop - 1]
-            else:
-                boardvalue = boardvalue - piecevalues[mov.drop - 1]
-
-        # update promotion
-        if mov.promotion != None:
-            if side:
-                boardvalue = (
-                    boardvalue
-                    + piecevalues[mov.promotion - 1]
-                    - piecevalues[movingpiece - 1]
-                )
-                boardvalue = (
-                    boardvalue
-                    - tables[movingpiece - 1][mov.to_square]
-                    + tables[mov.promotion - 1][mov.to_square]
-                )
-            else:
-                boardvalue = (
-                    boardvalue
-                    - piecevalues[mov.promotion - 1]
-                    + piecevalues[movingpiece - 1]
-                )
-                boardvalue = (
-                    boardvalue
-                    + tables[movingpiece - 1][mov.to_square]
-                    - tables[mov.promotion - 1][mov.to_square]
-                )
+    # update material
+    if board.is_en_passant(mov):
+        captured_square = chess.square(
+            chess.square_file(mov.to_square), chess.square_rank(mov.from_square)
+        )
+        captured = chess.PAWN
+    else:
+        captured_square = mov.to_square
+        captured = board.piece_type_at(mov.to_square)
+    if captured:
+        value += (
+            piecevalues[captured - 1] + tables[captured - 1][their(captured_square)]
+        )
 
-        return mov
+    return value if side == chess.WHITE else -value
 
 
 def make_move(mov: chess.Move, board: chess.Board):
-    update_eval(board, mov, board.turn)
+    global boardvalue
+
+    boardvalue = boardvalue + update_eval(board, mov)
     board.push(mov)
 
     return mov
 
 
 def unmake_move(board: chess.Board):
+    global boardvalue
+
     mov = board.pop()
-    update_eval(board, mov, not board.turn)
+    boardvalue = boardvalue - update_eval(board, mov)
 
     return mov
 
 
-def quiesce(board: chess.Board, alpha: int, beta: int):
-    stand_pat = evaluate_board(board)
-    if stand_pat >= beta:
-        return beta
-    if alpha < stand_pat:
-        alpha = stand_pat
+def has_non_pawn_material(board: chess.Board, color: chess.Color) -> bool:
+    """
+    Check if color has any pieces apart from pawns and the king
+    """
+    return bool(board.occupied_co[color] & ~(board.pawns | board.kings))
 
-    for move in board.legal_moves:
-        if board.is_capture(move):
+
+def static_eval(board: chess.Board) -> int:
+    """
+    Evaluation from the side to move's point of view without looking for
+    checkmate or stalemate, which would need the full legal move list
+    """
+    if board.is_insufficient_material():
+        return 0
+    return boardvalue if board.turn else -boardvalue
+
+
+class SearchAborted(Exception):
+    """
+    Raised inside the search when it has been asked to stop
+    """
+
+
+def check_stop() -> None:
+    """
+    Abort the search if it has been asked to stop. The first iteration is
+    always completed so that there is a move to play.
+    """
+    if stop_event is not None and stats.depth > 0 and stop_event.is_set():
+        raise SearchAborted()
+
+
+def set_hash_size(megabytes: int) -> None:
+    """
+    Limit the transposition table to roughly the given size
+    """
+    global TT_MAX_ENTRIES
+
+    TT_MAX_ENTRIES = max(1, megabytes) * TT_ENTRIES_PER_MB
+    transposition_table.clear()
+
+
+def clear_hash() -> None:
+    """
+    Clear the transposition table, call between unrelated searches
+    """
+    transposition_table.clear()
+
+
+def score_to_tt(score: int, ply: int) -> int:
+    """
+    Mate and tablebase win scores are stored relative to the node rather
+    than the root
+    """
+    if score >= WIN_BOUND:
+        return score + ply
+    if score <= -WIN_BOUND:
+        return score - ply
+    return score
+
+
+def score_from_tt(score: int, ply: int) -> int:
+    if score >= WIN_BOUND:
+        return score - ply
+    if score <= -WIN_BOUND:
+        return score + ply
+    return score
+
+
+def store_hash(
+    board: chess.Board,
+    depth: int,
+    score: int,
+    flag: int,
+    move: Optional[chess.Move],
+    ply: int,
+) -> None:
+    if len(transposition_table) >= TT_MAX_ENTRIES:
+        transposition_table.clear()
+    transposition_table[board._transposition_key()] = (
+        depth,
+        score_to_tt(score, ply),
+        flag,
+        move,
+    )
+
+
+def store_killer(move: chess.Move, ply: int) -> None:
+    if ply < MAX_PLY and killers[ply][0] != move:
+        killers[ply][1] = killers[ply][0]
+        killers[ply][0] = move
+
+
+def quiesce(
+    board: chess.Board,
+    alpha: int,
+    beta: int,
+    options: SearchOptions = SearchOptions(),
+    ply: int = 0,
+):
+    stats.qnodes += 1
+    if ply > stats.seldepth:
+        stats.seldepth = ply
+    if stats.qnodes & 1023 == 0:
+        check_stop()
+
+    if board.is_check():
+        # no standing pat in check, every evasion is searched and having none
+        # is checkmate
+        evasions = sorted(board.legal_moves, key=board.is_capture, reverse=True)
+        if not evasions:
+            return -MATE_SCORE + ply
+        for move in evasions:
             make_move(move, board)
-            score = -quiesce(board, -beta, -alpha)
+            score = -quiesce(board, -beta, -alpha, options, ply + 1)
             unmake_move(board)
 
             if score >= beta:
                 return beta
             if score > alpha:
                 alpha = score
+        return alpha
+
+    stand_pat = static_eval(board)
+    if stand_pat >= beta:
+        return beta
+    # delta pruning, not even winning a queen would bring the score up to alpha
+    if options.delta_pruning and stand_pat + piecevalues[-1] + DELTA_MARGIN < alpha:
+        return alpha
+    if alpha < stand_pat:
+        alpha = stand_pat
+
+    captures = generate_noisy_moves(board, queen_only=True)
+    if options.see_pruning:
+        # best exchanges first, drop the ones that lose material
+        exchanges = [(see(board, move), move) for move in captures]
+        exchanges.sort(key=lambda exchange: exchange[0], reverse=True)
+        captures = [move for value, move in exchanges if value >= 0]
+    else:
+        captures.sort(key=lambda move: mvv_lva(board, move), reverse=True)
+
+    for move in captures:
+        # delta pruning, this capture cannot bring the score up to alpha
+        if (
+            options.delta_pruning
+            and not move.promotion
+            and stand_pat + captured_value(board, move) + DELTA_MARGIN <= alpha
+        ):
+            continue
+
+        make_move(move, board)
+        score = -quiesce(board, -beta, -alpha, options, ply + 1)
+        unmake_move(board)
+
+        if score >= beta:
+            return beta
+        if score > alpha:
+            alpha = score
     return alpha
 
 
-def alphabeta(board: chess.Board, alpha: int, beta: int, depthleft: int):
-    bestscore = -9999
-    if depthleft == 0:
-        return quiesce(board, alpha, beta)
-    for move in board.legal_moves:
+def alphabeta(
+    board: chess.Board,
+    alpha: int,
+    beta: int,
+    depthleft: int,
+    options: SearchOptions = SearchOptions(),
+    ply: int = 1,
+    null_allowed: bool = True,
+):
+    if depthleft <= 0:
+        return quiesce(board, alpha, beta, options, ply)
+
+    stats.nodes += 1
+    if ply > stats.seldepth:
+        stats.seldepth = ply
+    if stats.nodes & 255 == 0:
+        check_stop()
+
+    # transposition table lookup
+    hash_move = None
+    entry = transposition_table.get(board._transposition_key())
+    if entry:
+        stats.tt_hits += 1
+        tt_depth, tt_score, tt_flag, hash_move = entry
+        if tt_depth >= depthleft:
+            tt_score = score_from_tt(tt_score, ply)
+            if (
+                tt_flag == TT_EXACT
+                or (tt_flag == TT_LOWER and tt_score >= beta)
+                or (tt_flag == TT_UPPER and tt_score <= alpha)
+            ):
+                return tt_score
+
+    # endgame tablebase, max_pieces is 0 when no tables are loaded
+    if (
+        chess.popcount(board.occupied) <= tablebase.max_pieces
+        and ply > 0
+        and not board.castling_rights
+    ):
+        wdl = tablebase.probe_wdl(board)
+        if wdl is not None:
+            stats.tb_hits += 1
+            if wdl > 1:
+                score = TB_WIN_SCORE - ply
+            elif wdl < -1:
+                score = -TB_WIN_SCORE + ply
+            else:
+                # cursed wins and blessed losses are drawn by the fifty move rule
+                score = 0
+            store_hash(board, MAX_PLY, score, TT_EXACT, None, ply)
+            return score
+
+    in_check = board.is_check()
+
+    # null move pruning, give the opponent a free move and see if we still fail high
+    if (
+        options.null_move
+        and null_allowed
+        and not in_check
+        and depthleft > NULL_MOVE_REDUCTION
+        and has_non_pawn_material(board, board.turn)
+    ):
+        make_move(chess.Move.null(), board)
+        score = -alphabeta(
+            board,
+            -beta,
+            -beta + 1,
+            depthleft - 1 - NULL_MOVE_REDUCTION,
+            options,
+            ply + 1,
+            False,
+        )
+        unmake_move(board)
+        if score >= beta:
+            return beta
+
+    original_alpha = alpha
+    bestscore = -MATE_SCORE
+    bestmove = None
+    index = -1
+    ply_killers = killers[ply] if ply < MAX_PLY else ()
+    for index, move in enumerate(pick_moves(board, hash_move, ply_killers)):
+        quiet = not move.promotion and not board.is_capture(move)
         make_move(move, board)
-        score = -alphabeta(board, -beta, -alpha, depthleft - 1)
+        if index == 0:
+            score = -alphabeta(board, -beta, -alpha, depthleft - 1, options, ply + 1)
+        else:
+            # late move reductions for quiet moves that do not give check
+            reduction = 0
+            if (
+                options.lmr
+                and quiet
+                and index >= LMR_MIN_MOVES
+                and depthleft >= LMR_MIN_DEPTH
+                and not in_check
+                and not board.is_check()
+            ):
+                reduction = 1
+
+            # principal variation search, null window for all but the first move
+            window = -alpha - 1 if options.pvs else -beta
+            score = -alphabeta(
+                board, window, -alpha, depthleft - 1 - reduction, options, ply + 1
+            )
+            if reduction and score > alpha:
+                score = -alphabeta(
+                    board, window, -alpha, depthleft - 1, options, ply + 1
+                )
+            if options.pvs and alpha < score < beta:
+                score = -alphabeta(
+                    board, -beta, -alpha, depthleft - 1, options, ply + 1
+                )
         unmake_move(board)
+
         if score >= beta:
+            stats.cutoffs += 1
+            if index == 0:
+                stats.first_move_cutoffs += 1
+            if quiet:
+                store_killer(move, ply)
+            store_hash(board, depthleft, score, TT_LOWER, move, ply)
             return score
         if score > bestscore:
             bestscore = score
+            bestmove = move
         if score > alpha:
             alpha = score
+
+    if index < 0:
+        # checkmate (prefer the quickest mate) or stalemate
+        return -MATE_SCORE + ply if in_check else 0
+
+    flag = TT_EXACT if bestscore > original_alpha else TT_UPPER
+    store_hash(board, depthleft, bestscore, flag, bestmove, ply)
     return bestscore
 
 
+def principal_variation(board: chess.Board, depth: int) -> List[chess.Move]:
+    """
+    Follow the best moves stored in the transposition table from the root
+    """
+    pv = []
+    seen = set()
+    for _ in range(depth):
+        key = board._transposition_key()
+        entry = transposition_table.get(key)
+        if not entry or not entry[3] or key in seen or not board.is_legal(entry[3]):
+            break
+        seen.add(key)
+        pv.append(entry[3])
+        board.push(entry[3])
+
+    for _ in pv:
+        board.pop()
+    return pv
+
+
+def search_root(
+    board: chess.Board,
+    depth: int,
+    options: SearchOptions,
+    root_moves: Optional[List[chess.Move]] = None,
+) -> Tuple[chess.Move, int]:
+    """
+    Search all root moves, or only root_moves if given, to the given depth,
+    return the best move and its score
+    """
+    hash_move = None
+    entry = transposition_table.get(board._transposition_key())
+    if entry:
+        hash_move = entry[3]
+
+    bestMove = chess.Move.null()
+    bestValue = -99999
+    alpha = -100000
+    beta = 100000
+    index = 0
+    for move in pick_moves(board, hash_move):
+        if root_moves is not None and move not in root_moves:
+            continue
+        make_move(move, board)
+        if index == 0 or not options.pvs:
+            boardValue = -alphabeta(board, -beta, -alpha, depth - 1, options)
+        else:
+            boardValue = -alphabeta(board, -alpha - 1, -alpha, depth - 1, options)
+            if boardValue > alpha:
+                boardValue = -alphabeta(board, -beta, -alpha, depth - 1, options)
+        unmake_move(board)
+
+        if boardValue > bestValue:
+            bestValue = boardValue
+            bestMove = move
+        if boardValue > alpha:
+            alpha = boardValue
+        index += 1
+
+    # the score of a restricted search is not the score of the position
+    if bestMove and root_moves is None:
+        store_hash(board, depth, bestValue, TT_EXACT, bestMove, 0)
+    return bestMove, bestValue
+
+
+def search(
+    board: chess.Board,
+    depth: int,
+    options: SearchOptions = SearchOptions(),
+    stop: Optional[threading.Event] = None,
+    on_iteration: Optional[Callable[[SearchStats], None]] = None,
+    root_moves: Optional[List[chess.Move]] = None,
+) -> Tuple[chess.Move, SearchStats]:
+    """
+    Search the position with iterative deepening up to the given depth,
+    return the best move and the statistics of the search.
+    root_moves limits the search to these moves, e.g. to score a played move.
+
+    Setting stop (from another thread) ends the search early with the best
+    move of the last completed depth. on_iteration is called with the
+    statistics after each completed depth. A search started while another
+    one is running waits for it to finish.
+    """
+    with search_lock:
+        return _search(board, depth, options, stop, on_iteration, root_moves)
+
+
+def _search(
+    board: chess.Board,
+    depth: int,
+    options: SearchOptions,
+    stop: Optional[threading.Event],
+    on_iteration: Optional[Callable[[SearchStats], None]],
+    root_moves: Optional[List[chess.Move]],
+) -> Tuple[chess.Move, SearchStats]:
+    global stats, killers, stop_event
+    stats = SearchStats()
+    start = time.perf_counter()
+
+    # perfect play straight from the tablebase
+    tablebase_move = None if root_moves else tablebase.probe_root(board)
+    if tablebase_move:
+        stats.tb_hits += 1
+        stats.time = time.perf_counter() - start
+        stats.pv = [tablebase_move]
+        LOGGER.info("piece_squares2 tablebase move: %s", tablebase_move)
+        return tablebase_move, stats
+
+    killers = [[None, None] for _ in range(MAX_PLY)]
+    stop_event = stop
+    init_evaluate_board(board)
+
+    root_ply = len(board.move_stack)
+    bestMove = chess.Move.null()
+    try:
+        for current_depth in range(1, depth + 1):
+            bestMove, stats.score = search_root(
+                board, current_depth, options, root_moves
+            )
+            stats.depth = current_depth
+            if on_iteration:
+                stats.time = time.perf_counter() - start
+                stats.pv = principal_variation(board, current_depth) or [bestMove]
+                on_iteration(stats)
+    except SearchAborted:
+        # unwind the moves of the interrupted iteration
+        while len(board.move_stack) > root_ply:
+            board.pop()
+        init_evaluate_board(board)
+    finally:
+        stop_event = None
+    stats.time = time.perf_counter() - start
+    stats.pv = principal_variation(board, stats.depth) or [bestMove]
+
+    LOGGER.info("piece_squares2 search: %s", stats)
+    return bestMove, stats
+
+
 import chess.polyglot
 
 
-def get_informed_move(board: chess.Board, depth: int):
+def get_informed_move(
+    board: chess.Board, depth: int, options: SearchOptions = SearchOptions()
+):
+    global stats
+
     try:
         move = (
             chess.polyglot.MemoryMappedReader("assets/books/human.bin")
             .weighted_choice(board)
             .move
         )
+        stats = SearchStats(pv=[move])
         movehistory.append(move)
         return move
     except:
-        bestMove = chess.Move.null()
-        bestValue = -99999
-        alpha = -100000
-        beta = 100000
-        for move in board.legal_moves:
-            make_move(move, board)
-            boardValue = -alphabeta(board, -beta, -alpha, depth - 1)
-            if boardValue > bestValue:
-                bestValue = boardValue
-                bestMove = move
-            if boardValue > alpha:
-                alpha = boardValue
-            unmake_move(board)
+        bestMove, _ = search(board, depth, options)
         movehistory.append(bestMove)
         return bestMove
@@ -0,0 +1,182 @@
+"""
+Pool of warm engine processes shared by many games in one process.
+
+Starting an engine process costs far more than a search at the cpu's move time,
+so a fixed number of engines are started up front and lent out per move. An
+engine is reset with new_game() when it is checked out, and checked with
+ping() so a crashed process is replaced instead of handed out. The pool's
+stats are written to the log every STATS_INTERVAL seconds while it is used,
+and can be read at any time with get_stats().
+
+    pool = EnginePool(lambda: StockFishEngine(path), size=4)
+    with pool.engine(timeout=5) as engine:
+        move = engine.get_informed_move(board)
+"""
+
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional
+from helpers import metrics
+from helpers.log import LOGGER
+from knightfight.types import Engine
+
+STATS_INTERVAL = 60.0
+
+
+class PoolTimeout(Exception):
+    """
+    No engine became free within the checkout timeout
+    """
+
+
+@dataclass
+class PoolStats:
+    size: int = 0
+    in_use: int = 0
+    waiting: int = 0
+    checkouts: int = 0
+    timeouts: int = 0
+    replaced: int = 0
+    wait_time: float = 0.0  # seconds spent waiting for a free engine
+    busy_time: float = 0.0  # seconds engines spent checked out
+    uptime: float = 0.0
+
+    @property
+    def utilisation(self) -> float:
+        """
+        Share of the pool's engine time spent checked out
+        """
+        capacity = self.size * self.uptime
+        return self.busy_time / capacity if capacity else 0.0
+
+    @property
+    def average_wait(self) -> float:
+        return self.wait_time / self.checkouts if self.checkouts else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"size {self.size} in use {self.in_use} waiting {self.waiting} "
+            f"checkouts {self.checkouts} timeouts {self.timeouts} "
+            f"replaced {self.replaced} wait {self.average_wait * 1000:.1f}ms "
+            f"utilisation {self.utilisation:.0%}"
+        )
+
+
+class EnginePool:
+    def __init__(
+        self,
+        factory: Callable[[], Engine],
+        size: int = 1,
+        stats_interval: float = STATS_INTERVAL,
+    ) -> None:
+        self.factory = factory
+        self.size = size
+        self.free: "queue.LifoQueue[Engine]" = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.checked_out: dict[int, float] = {}
+        self.closed = False
+        self.created = time.monotonic()
+        self.stats = PoolStats(size=size)
+        self.stats_interval = stats_interval
+        self.stats_logged = self.created
+
+        # start all engines now, so the first moves do not pay for it
+        for _ in range(size):
+            self.free.put(factory())
+
+    def checkout(self, timeout: Optional[float] = None) -> Engine:
+        """
+        Take a free engine, waiting up to timeout seconds (forever if None).
+        Raises PoolTimeout if none became free in time.
+        """
+        if self.closed:
+            raise RuntimeError("Engine pool is closed")
+
+        start = time.monotonic()
+        with self.lock:
+            self.stats.waiting += 1
+        try:
+            engine = self.free.get(timeout=timeout)
+        except queue.Empty:
+            with self.lock:
+                self.stats.timeouts += 1
+            raise PoolTimeout(f"No engine free after {timeout}s")
+        finally:
+            with self.lock:
+                self.stats.waiting -= 1
+
+        if not engine.ping():
+            LOGGER.warning("Engine did not respond, starting a new one")
+            engine = self.replace(engine)
+        engine.new_game()
+
+        now = time.monotonic()
+        with self.lock:
+            self.checked_out[id(engine)] = now
+            self.stats.in_use += 1
+            self.stats.checkouts += 1
+            self.stats.wait_time += now - start
+        return engine
+
+    def checkin(self, engine: Engine, healthy: bool = True) -> None:
+        """
+        Return an engine to the pool. An engine that failed while checked out
+        is replaced by a new one.
+        """
+        now = time.monotonic()
+        with self.lock:
+            self.stats.busy_time += now - self.checked_out.pop(id(engine))
+            self.stats.in_use -= 1
+            log_stats = now - self.stats_logged >= self.stats_interval
+            if log_stats:
+                self.stats_logged = now
+        if log_stats:
+            LOGGER.info("Engine pool: %s", self.get_stats())
+
+        if self.closed:
+            engine.quit()
+            return
+        if not healthy:
+            engine = self.replace(engine)
+        self.free.put(engine)
+
+    @contextmanager
+    def engine(self, timeout: Optional[float] = None) -> Iterator[Engine]:
+        """
+        Check out an engine for the duration of the with block
+        """
+        engine = self.checkout(timeout)
+        healthy = False
+        try:
+            yield engine
+            healthy = True
+        finally:
+            self.checkin(engine, healthy)
+
+    def replace(self, engine: Engine) -> Engine:
+        engine.quit()
+        with self.lock:
+            self.stats.replaced += 1
+        if metrics.METRICS:
+            metrics.METRICS.inc("engine_restarts_total")
+        return self.factory()
+
+    def get_stats(self) -> PoolStats:
+        with self.lock:
+            self.stats.uptime = time.monotonic() - self.created
+            return PoolStats(**vars(self.stats))
+
+    def close(self) -> None:
+        """
+        Quit the free engines, engines still checked out quit on checkin
+        """
+        self.closed = True
+        LOGGER.info("Engine pool: %s", self.get_stats())
+        while True:
+            try:
+                self.free.get_nowait().quit()
+            except queue.Empty:
+                break
@@ -0,0 +1,97 @@
+"""
+Static exchange evaluation (SEE).
+
+Works out the material balance of the sequence of captures on a single square
+that follows a capture, with both sides always recapturing with their least
+valuable attacker and free to stop when continuing would lose material.
+Used by the quiescence searches to order captures and prune losing ones.
+
+https://www.chessprogramming.org/Static_Exchange_Evaluation
+"""
+
+import chess
+
+PIECE_VALUES = {
+    chess.PAWN: 100,
+    chess.KNIGHT: 320,
+    chess.BISHOP: 330,
+    chess.ROOK: 500,
+    chess.QUEEN: 900,
+    chess.KING: 20000,
+}
+
+
+def captured_value(board: chess.Board, move: chess.Move) -> int:
+    """
+    Material value of the piece captured by move, 0 for quiet moves
+    """
+    if board.is_en_passant(move):
+        return PIECE_VALUES[chess.PAWN]
+    captured = board.piece_type_at(move.to_square)
+    return PIECE_VALUES[captured] if captured else 0
+
+
+def see(board: chess.Board, move: chess.Move) -> int:
+    """
+    Static exchange evaluation of move from the point of view of the side to
+    move. Positive values win material, negative values lose material.
+    Pins are ignored.
+    """
+    to_square = move.to_square
+    attacker = board.piece_type_at(move.from_square)
+    if attacker is None:
+        return 0
+
+    occupied = board.occupied ^ chess.BB_SQUARES[move.from_square]
+    gain = [captured_value(board, move)]
+    if board.is_en_passant(move):
+        occupied ^= chess.BB_SQUARES[
+            chess.square(
+                chess.square_file(to_square), chess.square_rank(move.from_square)
+            )
+        ]
+    if move.promotion:
+        gain[0] += PIECE_VALUES[move.promotion] - PIECE_VALUES[chess.PAWN]
+        attacker = move.promotion
+
+    side = not board.turn
+    while True:
+        # attackers with the current occupancy, so that x-ray attackers behind
+        # pieces that have already captured are revealed
+        side_attackers = (
+            board._attackers_mask(side, to_square, occupied)
+            & board.occupied_co[side]
+            & occupied
+        )
+        if not side_attackers:
+            break
+
+        # recapture with the least valuable attacker
+        for piece_type in chess.PIECE_TYPES:
+            candidates = side_attackers & board.pieces_mask(piece_type, side)
+            if candidates:
+                break
+
+        # the king may not capture into a defended square
+        if piece_type == chess.KING and (
+            board._attackers_mask(not side, to_square, occupied)
+            & board.occupied_co[not side]
+            & occupied
+            & ~chess.BB_SQUARES[to_square]
+        ):
+            break
+
+        gain.append(PIECE_VALUES[attacker] - gain[-1])
+        if max(-gain[-2], gain[-1]) < 0:
+            # neither side can improve by continuing
+            break
+
+        occupied ^= chess.BB_SQUARES[chess.lsb(candidates)]
+        attacker = piece_type
+        side = not side
+
+    # negamax the swap list back to the first capture
+    while len(gain) > 1:
+        score = gain.pop()
+        gain[-1] = -max(-gain[-1], score)
+    return gain[0]
@@ -0,0 +1,54 @@
+"""
+Statistics collected by an engine search.
+"""
+
+from dataclasses import dataclass, field
+from typing import List
+import chess
+
+
+@dataclass
+class SearchStats:
+    """
+    What a single search did, filled in by the engine while it searches
+    """
+
+    nodes: int = 0  # main search nodes
+    qnodes: int = 0  # quiescence nodes
+    depth: int = 0  # last fully searched depth
+    seldepth: int = 0  # deepest ply reached, including quiescence
+    tt_hits: int = 0  # transposition table probes that found an entry
+    tb_hits: int = 0  # endgame tablebase probes that found the position
+    cutoffs: int = 0  # beta cutoffs in the main search
+    first_move_cutoffs: int = 0  # beta cutoffs caused by the first move searched
+    time: float = 0.0  # seconds
+    score: int = 0  # centipawns from the side to move's point of view
+    pv: List[chess.Move] = field(default_factory=list)
+
+    @property
+    def nps(self) -> int:
+        """
+        Nodes (main search and quiescence) per second
+        """
+        if self.time <= 0:
+            return 0
+        return int((self.nodes + self.qnodes) / self.time)
+
+    @property
+    def first_move_cutoff_rate(self) -> float:
+        """
+        Fraction of cutoffs that happened at the first move, a measure of how
+        good the move ordering is
+        """
+        if not self.cutoffs:
+            return 0.0
+        return self.first_move_cutoffs / self.cutoffs
+
+    def __str__(self) -> str:
+        pv = " ".join(move.uci() for move in self.pv)
+        return (
+            f"depth {self.depth} seldepth {self.seldepth} score {self.score} "
+            f"nodes {self.nodes} qnodes {self.qnodes} nps {self.nps} "
+            f"tt hits {self.tt_hits} tb hits {self.tb_hits} first move cutoffs "
+            f"{self.first_move_cutoff_rate:.0%} time {self.time:.2f}s pv {pv}"
+        )
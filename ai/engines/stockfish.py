@@ -1,21 +1,160 @@
-from typing import Optional
+import asyncio
+from typing import List, Optional
 import chess
 import chess.engine
+from ai.engines.stats import SearchStats
+from helpers import metrics
+from helpers.log import LOGGER
 from knightfight.types import Engine
 
+# seconds stockfish is given per move
+MOVE_TIME = 0.1
+
 
 class StockFishEngine(Engine):
     def __init__(self, engine_path: str) -> None:
         self.engine = chess.engine.SimpleEngine.popen_uci(engine_path)
+        if metrics.METRICS:
+            metrics.METRICS.inc("engine_starts_total", engine="stockfish")
+        self.last_stats: Optional[SearchStats] = None
+        # a new game key makes python-chess send ucinewgame before the search
+        self.game = object()
 
     def get_informed_move(self, board: chess.Board) -> Optional[chess.Move]:
         # Get the move
-        result = self.engine.play(board, chess.engine.Limit(time=0.1))
+        result = self.engine.play(
+            board,
+            chess.engine.Limit(time=MOVE_TIME),
+            game=self.game,
+            info=chess.engine.INFO_ALL,
+        )
+
+        # Keep what the engine reported about its search
+        self.last_stats = info_to_stats(result.info)
+        LOGGER.info("stockfish search: %s", self.last_stats)
 
         # Return the move
         if result:
             return result.move
         return None
 
+    def analyse(
+        self,
+        board: chess.Board,
+        limit: Optional[chess.engine.Limit] = None,
+        root_moves: Optional[List[chess.Move]] = None,
+    ) -> chess.engine.InfoDict:
+        """
+        Analyse the position, the info of the principal variation. root_moves
+        limits the search to these moves.
+        """
+        return self.engine.analyse(
+            board,
+            limit or chess.engine.Limit(time=MOVE_TIME),
+            game=self.game,
+            root_moves=root_moves,
+        )
+
+    def new_game(self) -> None:
+        self.game = object()
+
+    def ping(self) -> bool:
+        try:
+            self.engine.ping()
+        except (chess.engine.EngineError, TimeoutError):
+            return False
+        return True
+
     def quit(self) -> None:
-        self.engine.quit()
+        try:
+            self.engine.quit()
+        except (chess.engine.EngineError, TimeoutError):
+            pass
+
+
+class AsyncStockFishEngine:
+    """
+    Stockfish driven by coroutines on the caller's event loop, so one loop can
+    run many engines and games without a thread per engine. Create it with
+    `await AsyncStockFishEngine.open(engine_path)`.
+    """
+
+    def __init__(
+        self,
+        transport: asyncio.SubprocessTransport,
+        engine: chess.engine.UciProtocol,
+    ) -> None:
+        self.transport = transport
+        self.engine = engine
+        self.last_stats: Optional[SearchStats] = None
+        self.game = object()
+
+    @classmethod
+    async def open(cls, engine_path: str) -> "AsyncStockFishEngine":
+        transport, engine = await chess.engine.popen_uci(engine_path)
+        if metrics.METRICS:
+            metrics.METRICS.inc("engine_starts_total", engine="stockfish")
+        return cls(transport, engine)
+
+    async def get_informed_move(
+        self, board: chess.Board, limit: Optional[chess.engine.Limit] = None
+    ) -> Optional[chess.Move]:
+        result = await self.engine.play(
+            board,
+            limit or chess.engine.Limit(time=MOVE_TIME),
+            game=self.game,
+            info=chess.engine.INFO_ALL,
+        )
+
+        self.last_stats = info_to_stats(result.info)
+        LOGGER.info("stockfish search: %s", self.last_stats)
+
+        return result.move
+
+    async def analyse(
+        self,
+        board: chess.Board,
+        limit: Optional[chess.engine.Limit] = None,
+        multipv: int = 1,
+    ) -> List[chess.engine.InfoDict]:
+        """
+        Analyse the position, one info dict per principal variation
+        """
+        return await self.engine.analyse(
+            board,
+            limit or chess.engine.Limit(time=MOVE_TIME),
+            multipv=multipv,
+            game=self.game,
+        )
+
+    def new_game(self) -> None:
+        self.game = object()
+
+    async def ping(self) -> bool:
+        try:
+            await self.engine.ping()
+        except chess.engine.EngineError:
+            return False
+        return True
+
+    async def quit(self) -> None:
+        try:
+            await self.engine.quit()
+        except chess.engine.EngineError:
+            pass
+
+
+def info_to_stats(info: chess.engine.InfoDict) -> SearchStats:
+    """
+    Convert the info reported by a UCI engine to search statistics
+    """
+    score = info.get("score")
+    return SearchStats(
+        nodes=info.get("nodes", 0),
+        depth=info.get("depth", 0),
+        seldepth=info.get("seldepth", 0),
+        tb_hits=info.get("tbhits", 0),
+        time=info.get("time", 0.0),
+        score=score.relative.score(mate_score=9999) if score else 0,
+        pv=info.get("pv", []),
+    )
@@ -0,0 +1,115 @@
+"""
+Syzygy endgame tablebase probing for the piece squares engines.
+
+Tablebases are opened once at startup from the directory configured as
+cpu.syzygy_path in config.yml. If the directory is missing or contains no
+tables, probing stays disabled and costs nothing during the search.
+
+Tablebase files can be downloaded from https://syzygy-tables.info/
+"""
+
+import os
+from typing import Optional
+import chess
+import chess.syzygy
+from helpers.log import LOGGER
+
+tablebase: Optional[chess.syzygy.Tablebase] = None
+
+# largest number of pieces (kings included) covered by the loaded tables
+max_pieces = 0
+
+
+def open_tablebase(path: Optional[str]) -> bool:
+    """
+    Open the tablebase files in path, return True if probing is enabled
+    """
+    global tablebase, max_pieces
+
+    close_tablebase()
+    if not path:
+        LOGGER.info("No syzygy tablebase directory configured, probing disabled")
+        return False
+    if not os.path.isdir(path):
+        LOGGER.info("Syzygy tablebase directory '%s' not found, probing disabled", path)
+        return False
+
+    tb = chess.syzygy.Tablebase()
+    if not tb.add_directory(path) or not tb.wdl:
+        tb.close()
+        LOGGER.info("No syzygy tablebase files in '%s', probing disabled", path)
+        return False
+
+    tablebase = tb
+    max_pieces = max(len(name.replace("v", "")) for name in tb.wdl)
+    LOGGER.info("Syzygy tablebases loaded from '%s', up to %d pieces", path, max_pieces)
+    return True
+
+
+def close_tablebase() -> None:
+    global tablebase, max_pieces
+
+    if tablebase:
+        tablebase.close()
+    tablebase = None
+    max_pieces = 0
+
+
+def can_probe(board: chess.Board) -> bool:
+    """
+    Check if the position is covered by the loaded tables
+    """
+    return (
+        tablebase is not None
+        and chess.popcount(board.occupied) <= max_pieces
+        and not board.castling_rights
+    )
+
+
+def probe_wdl(board: chess.Board) -> Optional[int]:
+    """
+    Win (2), cursed win (1), draw (0), blessed loss (-1) or loss (-2) for the
+    side to move, None if the position is not in the tables
+    """
+    if not can_probe(board):
+        return None
+    return tablebase.get_wdl(board)
+
+
+def probe_root(board: chess.Board) -> Optional[chess.Move]:
+    """
+    Return the move that keeps the best tablebase result, winning as fast as
+    possible or losing as slowly as possible. None if any of the positions
+    after the legal moves is missing from the tables.
+    """
+    if not can_probe(board):
+        return None
+
+    best_move = None
+    best_rank = None
+    for move in board.legal_moves:
+        board.push(move)
+        if board.is_checkmate():
+            board.pop()
+            return move
+        wdl = tablebase.get_wdl(board)
+        dtz = tablebase.get_dtz(board)
+        board.pop()
+        if wdl is None or dtz is None:
+            return None
+
+        # wdl and dtz are from the opponent's point of view
+        if wdl < 0:
+            # winning, fewer moves to a zeroing move is better
+            rank = (-wdl, -abs(dtz))
+        elif wdl > 0:
+            # losing, hold out as long as possible
+            rank = (-wdl, abs(dtz))
+        else:
+            rank = (0, 0)
+
+        if best_rank is None or rank > best_rank:
+            best_rank = rank
+            best_move = move
+
+    return best_move
@@ -0,0 +1,310 @@
+"""
+UCI front end for the piece squares v2 engine.
+
+Lets the engine be driven by standard chess tools (GUIs, cutechess-cli,
+chess.engine) over stdin/stdout. The search runs on its own thread so that
+stop and quit are honoured while it is thinking.
+
+Usage: python -m ai.engines.uci
+"""
+
+import sys
+import threading
+from typing import Dict, List, Optional, TextIO
+import chess
+from ai.engines import piece_squares2, tablebase
+from ai.engines.piece_squares2 import MATE_SCORE, MAX_PLY, SearchOptions
+from ai.engines.stats import SearchStats
+from helpers.log import LOGGER
+
+ENGINE_NAME = "KnightFight piece_squares2"
+ENGINE_AUTHOR = "KnightFight"
+
+DEFAULT_HASH_MB = 64
+MAX_HASH_MB = 1024
+
+# share of the remaining clock used when the number of moves is unknown
+DEFAULT_MOVES_TO_GO = 30
+MOVE_OVERHEAD = 0.05  # seconds kept back for communication
+
+# UCI check options mapped to SearchOptions fields
+CHECK_OPTIONS = {
+    "PVS": "pvs",
+    "NullMove": "null_move",
+    "LMR": "lmr",
+    "SEEPruning": "see_pruning",
+    "DeltaPruning": "delta_pruning",
+}
+
+
+class UCIEngine:
+    def __init__(self, output: TextIO = sys.stdout) -> None:
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.board = chess.Board()
+        self.options = SearchOptions()
+        self.search_thread: Optional[threading.Thread] = None
+        self.stop_event = threading.Event()
+        self.timer: Optional[threading.Timer] = None
+        # set when bestmove may be sent, held back by go infinite and go ponder
+        # until stop or ponderhit
+        self.release = threading.Event()
+        self.ponder_seconds: Optional[float] = None
+        # the transposition table is resized when no search is using it
+        self.hash_lock = threading.Lock()
+        self.searching = False
+        self.pending_hash_mb: Optional[int] = None
+        piece_squares2.set_hash_size(DEFAULT_HASH_MB)
+
+    def send(self, line: str) -> None:
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def run(self, input: TextIO = sys.stdin) -> None:
+        """
+        Read and handle commands until quit or end of input
+        """
+        for line in input:
+            if not self.handle(line.strip()):
+                break
+        self.stop()
+
+    def handle(self, line: str) -> bool:
+        """
+        Handle a single command, return False on quit
+        """
+        tokens = line.split()
+        if not tokens:
+            return True
+
+        command, args = tokens[0], tokens[1:]
+        if command == "uci":
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send(
+                f"option name Hash type spin default {DEFAULT_HASH_MB} "
+                f"min 1 max {MAX_HASH_MB}"
+            )
+            self.send("option name Threads type spin default 1 min 1 max 1")
+            self.send("option name SyzygyPath type string default <empty>")
+            for name, field in CHECK_OPTIONS.items():
+                default = str(getattr(self.options, field)).lower()
+                self.send(f"option name {name} type check default {default}")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.set_option(args)
+        elif command == "ucinewgame":
+            self.stop()
+            piece_squares2.clear_hash()
+            self.board = chess.Board()
+        elif command == "position":
+            self.stop()
+            self.set_position(args)
+        elif command == "go":
+            self.stop()
+            self.go(args)
+        elif command == "stop":
+            self.stop()
+        elif command == "ponderhit":
+            self.ponder_hit()
+        elif command == "quit":
+            return False
+        return True
+
+    def set_option(self, args: List[str]) -> None:
+        """
+        setoption name <name> [value <value>]
+        """
+        if "name" not in args:
+            return
+        if "value" in args:
+            name = " ".join(args[args.index("name") + 1 : args.index("value")])
+            value = " ".join(args[args.index("value") + 1 :])
+        else:
+            name = " ".join(args[args.index("name") + 1 :])
+            value = ""
+
+        if name == "Hash":
+            try:
+                megabytes = int(value)
+            except ValueError:
+                LOGGER.error("Ignoring setoption Hash with value %r", value)
+                return
+            self.set_hash_size(min(megabytes, MAX_HASH_MB))
+        elif name == "Threads":
+            # the search is single threaded, python threads would not help
+            pass
+        elif name == "SyzygyPath":
+            tablebase.open_tablebase(None if value == "<empty>" else value)
+        elif name in CHECK_OPTIONS:
+            setattr(self.options, CHECK_OPTIONS[name], value.lower() == "true")
+
+    def set_hash_size(self, megabytes: int) -> None:
+        """
+        Resize the transposition table now, or when the running search ends
+        """
+        with self.hash_lock:
+            if self.searching:
+                self.pending_hash_mb = megabytes
+            else:
+                piece_squares2.set_hash_size(megabytes)
+
+    def set_position(self, args: List[str]) -> None:
+        """
+        position [startpos | fen <fen>] [moves <move> ...]
+        """
+        moves = []
+        if "moves" in args:
+            moves = args[args.index("moves") + 1 :]
+            args = args[: args.index("moves")]
+
+        # a bad fen or move leaves the current position as it was
+        try:
+            if args and args[0] == "fen":
+                board = chess.Board(" ".join(args[1:]))
+            else:
+                board = chess.Board()
+            for uci in moves:
+                board.push_uci(uci)
+        except ValueError as e:
+            LOGGER.error("Ignoring position %s: %s", " ".join(args), e)
+            return
+        self.board = board
+
+    def go(self, args: List[str]) -> None:
+        """
+        go [depth N] [movetime ms] [wtime ms] [btime ms] [winc ms] [binc ms]
+           [movestogo N] [infinite] [ponder]
+        """
+        params: Dict[str, int] = {}
+        for name, value in zip(args, args[1:]):
+            if name in [
+                "depth",
+                "movetime",
+                "wtime",
+                "btime",
+                "winc",
+                "binc",
+                "movestogo",
+            ]:
+                try:
+                    params[name] = int(value)
+                except ValueError:
+                    LOGGER.error("Ignoring go %s %r", name, value)
+
+        depth = min(params.get("depth", MAX_PLY - 1), MAX_PLY - 1)
+        self.stop_event = threading.Event()
+
+        self.release = threading.Event()
+        seconds = None if "infinite" in args else self.allot_time(params)
+        if "ponder" in args:
+            # the clock starts on ponderhit
+            self.ponder_seconds = seconds
+        elif "infinite" not in args:
+            self.release.set()
+            self.start_timer(seconds)
+
+        self.searching = True
+        self.search_thread = threading.Thread(
+            target=self.search,
+            args=(self.board.copy(), depth, self.stop_event, self.release),
+            daemon=True,
+        )
+        self.search_thread.start()
+
+    def start_timer(self, seconds: Optional[float]) -> None:
+        if seconds is not None:
+            self.timer = threading.Timer(seconds, self.stop_event.set)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def ponder_hit(self) -> None:
+        """
+        The opponent played the pondered move, search on with the clock running
+        """
+        if self.search_thread and not self.release.is_set():
+            self.release.set()
+            self.start_timer(self.ponder_seconds)
+
+    def allot_time(self, params: Dict[str, int]) -> Optional[float]:
+        """
+        Seconds to spend on this move, None to search to the given depth
+        """
+        if "movetime" in params:
+            return max(params["movetime"] / 1000 - MOVE_OVERHEAD, 0.01)
+
+        time_left = params.get("wtime" if self.board.turn else "btime")
+        if time_left is None:
+            return None
+
+        increment = params.get("winc" if self.board.turn else "binc", 0)
+        moves_to_go = params.get("movestogo", DEFAULT_MOVES_TO_GO)
+        budget = time_left / max(moves_to_go, 1) + increment * 0.75
+        budget = min(budget, time_left * 0.5)
+        return max(budget / 1000 - MOVE_OVERHEAD, 0.01)
+
+    def search(
+        self,
+        board: chess.Board,
+        depth: int,
+        stop: threading.Event,
+        release: threading.Event,
+    ) -> None:
+        try:
+            if board.is_game_over():
+                uci = "0000"
+            else:
+                move, _ = piece_squares2.search(
+                    board, depth, self.options, stop, self.send_info
+                )
+                uci = (move or next(iter(board.legal_moves))).uci()
+
+            # a search that ends by itself in go infinite or go ponder must not
+            # send bestmove before stop or ponderhit
+            release.wait()
+            self.send(f"bestmove {uci}")
+        finally:
+            with self.hash_lock:
+                self.searching = False
+                if self.pending_hash_mb is not None:
+                    piece_squares2.set_hash_size(self.pending_hash_mb)
+                    self.pending_hash_mb = None
+
+    def send_info(self, stats: SearchStats) -> None:
+        if abs(stats.score) >= MATE_SCORE - MAX_PLY:
+            plies = MATE_SCORE - abs(stats.score)
+            moves = (plies + 1) // 2
+            score = f"mate {moves if stats.score > 0 else -moves}"
+        else:
+            score = f"cp {stats.score}"
+
+        pv = " ".join(move.uci() for move in stats.pv)
+        self.send(
+            f"info depth {stats.depth} seldepth {stats.seldepth} score {score} "
+            f"nodes {stats.nodes + stats.qnodes} nps {stats.nps} "
+            f"time {int(stats.time * 1000)} tbhits {stats.tb_hits} pv {pv}"
+        )
+
+    def stop(self) -> None:
+        """
+        Stop the running search, its bestmove is sent before this returns
+        """
+        if self.search_thread:
+            self.stop_event.set()
+            self.release.set()
+            self.search_thread.join()
+            self.search_thread = None
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+
+
+def main() -> None:
+    UCIEngine().run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,12 @@
 import re
+import asyncio
+import random
+import time
+import aiohttp
 import openai
+import openai.error
 import chess
+from ai.openai.cache import ResponseCache
 from helpers.log import LOGGER
 from typing import Optional
 
@@ -11,13 +17,57 @@ still encounter some inaccuracies in the results. For optimal performance,
 consider using a dedicated chess engine like Stockfish.
 """
 
+# errors worth another attempt, anything else (bad key, bad request) is final
+RETRY_ERRORS = (
+    openai.error.Timeout,
+    openai.error.APIConnectionError,
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.APIError,
+)
+
 
 class OpenAIAPIWrapper:
-    def __init__(self, api_key):
+    def __init__(
+        self,
+        api_key,
+        api_base=None,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 15.0,
+        max_retries: int = 2,
+        backoff: float = 0.5,
+        move_budget: float = 30.0,
+        candidates: int = 3,
+        model: str = "text-davinci-002",
+        temperature: float = 1.0,
+        cache: Optional[ResponseCache] = None,
+    ):
+        """
+        Client for the Completion endpoint, create it once and reuse it.
+        The key and base url are passed with each request instead of being set
+        globally, so a local stub server can stand in for the real api.
+        move_budget is the total time in seconds allowed for one move,
+        including retries. candidates is the number of completions asked for
+        per request, the first legal one is played. Replies are kept in cache,
+        if given, so positions seen before cost no request.
+        get_next_chess_move runs on one event loop with one aiohttp session,
+        so connections are reused between moves. Call close() when done.
+        """
         self.api_key = api_key
-        openai.api_key = self.api_key
+        self.api_base = api_base or None
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.move_budget = move_budget
+        self.candidates = candidates
+        self.model = model
+        self.temperature = temperature
+        self.cache = cache
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.session: Optional[aiohttp.ClientSession] = None
 
-    def _generate_text(
+    async def _generate_texts(
         self,
         prompt,
         engine="text-davinci-002",
@@ -25,46 +75,149 @@ class OpenAIAPIWrapper:
         n=1,
         stop=None,
         temperature=1.0,
-    ):
+        deadline: Optional[float] = None,
+    ) -> list[str]:
         """
-        Generate text using OpenAI.
+        Generate n texts using OpenAI in one request. Failed requests are
+        retried with jittered exponential backoff until max_retries or the
+        deadline is reached, returns an empty list if no reply was received.
         """
-        response = openai.Completion.create(
-            engine=engine,
-            prompt=prompt,
-            max_tokens=max_tokens,
-            n=n,
-            stop=stop,
-            temperature=temperature,
-        )
+        if deadline is None:
+            deadline = time.monotonic() + self.move_budget
+
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
 
-        LOGGER.info(f"OpenAPI Response: {response.choices[0].text.strip()}")  # type: ignore
+            try:
+                response = await openai.Completion.acreate(
+                    engine=engine,
+                    prompt=prompt,
+                    max_tokens=max_tokens,
+                    n=n,
+                    stop=stop,
+                    temperature=temperature,
+                    api_key=self.api_key,
+                    api_base=self.api_base,
+                    request_timeout=(
+                        min(self.connect_timeout, remaining),
+                        min(self.read_timeout, remaining),
+                    ),
+                )
+            except RETRY_ERRORS as e:
+                LOGGER.warning("OpenAPI request %d failed: %s", attempt + 1, e)
+                if attempt == self.max_retries:
+                    break
+                # full jitter, so two players never retry in lockstep
+                delay = random.uniform(0, self.backoff * 2**attempt)
+                await asyncio.sleep(max(0.0, min(delay, deadline - time.monotonic())))
+                continue
+            except openai.error.OpenAIError as e:
+                LOGGER.error("OpenAPI request failed: %s", e)
+                return []
 
-        return response.choices[0].text.strip()  # type: ignore
+            texts = [choice.text.strip() for choice in response.choices]  # type: ignore
+            LOGGER.info("OpenAPI Response: %s", texts)
+
+            return texts
+
+        LOGGER.warning("OpenAPI gave no reply within the move budget")
+        return []
 
     def get_next_chess_move(
         self, legal_moves: list[chess.Move], old_fen: str, color: chess.Color
     ) -> Optional[chess.Move]:
         """
         Given a chess position in FEN notation, return the next chess move.
+        Returns None if there was no reply or no reply is a legal move.
+        """
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+        return self.loop.run_until_complete(
+            self._with_session(self.aget_next_chess_move(legal_moves, old_fen, color))
+        )
+
+    async def _with_session(self, coro):
+        """
+        Run coro with the client's session, openai takes it from aiosession
+        """
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+        openai.aiosession.set(self.session)
+        return await coro
+
+    def close(self) -> None:
         """
-        prompt = ""
-        colorstr = ""
-        if color == chess.WHITE:
-            colorstr = "white"
+        Close the session and event loop of get_next_chess_move
+        """
+        if self.loop is None:
+            return
+        if self.session:
+            self.loop.run_until_complete(self.session.close())
+            self.session = None
+        self.loop.close()
+        self.loop = None
+
+    async def aget_next_chess_move(
+        self, legal_moves: list[chess.Move], old_fen: str, color: chess.Color
+    ) -> Optional[chess.Move]:
+        """
+        Async version of get_next_chess_move. Asks for several candidate
+        replies in one request and returns the first legal one, so a
+        malformed or illegal reply does not cost another round trip. Requests
+        use openai.aiosession if set, otherwise a session per request.
+        """
+        cached = None
+        if self.cache:
+            cached = self.cache.get(old_fen, color, self.model, self.temperature)
+
+        if cached is not None:
+            resps = cached
         else:
-            colorstr = "black"
+            prompt = self.build_prompt(legal_moves, old_fen, color)
+            resps = await self._generate_texts(
+                prompt,
+                engine=self.model,
+                max_tokens=10,
+                n=self.candidates,
+                temperature=self.temperature,
+            )
 
-        prompt += (
-            f"Given the chess board position in FEN notation: {old_fen}, "
-            f"what is the next best move for the {colorstr} player? "
-            f"Please reply in UCI string of 4 characters."
-            f"Please select one of the following moves: {str(legal_moves)}\n"
-        )
+        for resp in resps:
+            move = self.parse_move(resp, legal_moves)
+            if move:
+                # only replies that gave a legal move are worth keeping
+                if cached is None and self.cache:
+                    self.cache.put(old_fen, color, self.model, self.temperature, resps)
+                return move
 
-        # convert uci string to chess.Move
-        resp = self._generate_text(prompt)
+        if resps:
+            LOGGER.warning("OpenAPI replies are not legal moves: %s", resps)
+        return None
+
+    def build_prompt(
+        self, legal_moves: list[chess.Move], fen: str, color: chess.Color
+    ) -> str:
+        """
+        Short prompt, the FEN once and the legal moves as plain UCI strings.
+        Fewer tokens make the request cheaper and faster.
+        """
+        colorstr = "white" if color == chess.WHITE else "black"
+        moves = " ".join(move.uci() for move in legal_moves)
+        return (
+            f"Chess position (FEN): {fen}\n"
+            f"Legal moves for {colorstr}: {moves}\n"
+            f"Reply with the best move in UCI, e.g. e2e4.\n"
+            f"Move:"
+        )
 
+    def parse_move(
+        self, resp: str, legal_moves: list[chess.Move]
+    ) -> Optional[chess.Move]:
+        """
+        Convert a reply to a chess.Move, None if it is not one of legal_moves.
+        """
         resp_uci = ""
         # sometimes OpenAI responds as a sentence instead of a UCI move string
         if len(resp) > 5:
@@ -73,7 +226,12 @@ class OpenAIAPIWrapper:
             resp_uci = resp
 
         if resp_uci and len(resp_uci) < 5:
-            return chess.Move.from_uci(resp_uci)
+            try:
+                move = chess.Move.from_uci(resp_uci)
+            except ValueError:
+                return None
+            if move in legal_moves:
+                return move
 
         return None
 
@@ -0,0 +1,102 @@
+"""
+Cache of the replies from the OpenAI api, keyed by position.
+
+A request costs seconds of network time, and the same positions come up again
+and again (openings, replays, undo). The replies for a position are kept with
+the model and temperature that produced them and handed back instead of asking
+again, until they are older than the ttl.
+
+Entries are stored in a sqlite database. With no path the database is kept in
+memory and lost on exit.
+"""
+
+import json
+import sqlite3
+import time
+from typing import Optional
+import chess
+from helpers.log import LOGGER
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_entries: int = 5000,
+        ttl: float = 30 * 24 * 3600,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        self.db: Optional[sqlite3.Connection] = sqlite3.connect(path or ":memory:")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, "
+            "texts TEXT NOT NULL, created REAL NOT NULL, used REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_used ON responses (used)")
+        self.db.commit()
+
+    @staticmethod
+    def make_key(fen: str, color: chess.Color, model: str, temperature: float) -> str:
+        colorstr = "white" if color == chess.WHITE else "black"
+        return f"{fen}:{colorstr}:{model}:{temperature}"
+
+    def get(
+        self, fen: str, color: chess.Color, model: str, temperature: float
+    ) -> Optional[list[str]]:
+        """
+        Return the cached replies for the position, None if there are none or
+        they have expired
+        """
+        if not self.db:
+            return None
+
+        key = self.make_key(fen, color, model, temperature)
+        now = time.time()
+        row = self.db.execute(
+            "SELECT texts FROM responses WHERE key = ? AND created > ?",
+            (key, now - self.ttl),
+        ).fetchone()
+        if not row:
+            self.misses += 1
+            return None
+
+        self.db.execute("UPDATE responses SET used = ? WHERE key = ?", (now, key))
+        self.db.commit()
+        self.hits += 1
+        LOGGER.info("OpenAI response cache hit for %s", fen)
+        return json.loads(row[0])
+
+    def put(
+        self,
+        fen: str,
+        color: chess.Color,
+        model: str,
+        temperature: float,
+        texts: list[str],
+    ) -> None:
+        if not self.db:
+            return
+
+        key = self.make_key(fen, color, model, temperature)
+        now = time.time()
+        self.db.execute(
+            "INSERT OR REPLACE INTO responses (key, texts, created, used) "
+            "VALUES (?, ?, ?, ?)",
+            (key, json.dumps(texts), now, now),
+        )
+        # drop expired entries, then the least recently used over the limit
+        self.db.execute("DELETE FROM responses WHERE created <= ?", (now - self.ttl,))
+        self.db.execute(
+            "DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+            "ORDER BY used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        self.db.commit()
+
+    def close(self) -> None:
+        if self.db:
+            self.db.close()
+            self.db = None
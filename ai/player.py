@@ -1,11 +1,37 @@
+import concurrent.futures
 import random
+import threading
+import time
+from typing import TYPE_CHECKING, List, Optional, Tuple
 import chess
-from ai.lookup import CHESS_SQUARE_TO_POS
+import chess.engine
+from helpers import metrics, profiling
 from helpers.log import LOGGER
-from knightfight.board import Board
+from knightfight.types import GridPosition
 from sound.playback import play_sound
-from ai.engines import piece_squares, piece_squares2, stockfish
-from ai.openai.api import OpenAIAPIWrapper
+from ai.engines import piece_squares, piece_squares2
+from ai.engines.piece_squares2 import SearchOptions
+from ai.engines.stats import SearchStats
+from ai.cache import MoveCache
+
+# stockfish and openai are imported on first use, they are slow to import
+if TYPE_CHECKING:
+    from ai.engines.pool import EnginePool
+    from ai.openai.api import OpenAIAPIWrapper
+    from knightfight.board import Board
+
+# seconds to wait for a free stockfish engine before playing a local move
+ENGINE_CHECKOUT_TIMEOUT = 5.0
+
+# backends whose moves are kept in the move cache
+CACHED_BACKENDS = [
+    "piece_squares",
+    "piecesquares",
+    "piece_squares2",
+    "piecesquares2",
+    "stockfish",
+    "openai",
+]
 
 
 class AIPlayer:
@@ -17,6 +43,11 @@ class AIPlayer:
         complexity: int = 1,
         engine_path: str = "",
         openai_api_key: str = "",
+        search_options: SearchOptions = SearchOptions(),
+        ponder: bool = False,
+        move_cache: Optional[MoveCache] = None,
+        openai_client: Optional["OpenAIAPIWrapper"] = None,
+        engine_pool: Optional["EnginePool"] = None,
     ):
         self.color = color
         self.sound_vol = sound_vol
@@ -27,68 +58,291 @@ class AIPlayer:
         self.engine_path = engine_path
         self.engine = None
         self.openai_api_key = openai_api_key
+        self.search_options = search_options
+        self.move_cache = move_cache
 
-    def move(self, board: Board) -> bool:
-        legal_moves = list(board.state.engine_state.legal_moves)
-        if len(legal_moves) > 0:
-            if self.ai == "piece_squares" or self.ai == "piecesquares":
-                move = piece_squares.get_informed_move(
-                    board.state.engine_state, self.complexity
-                )
-            if self.ai == "piece_squares2" or self.ai == "piecesquares2":
-                move = piece_squares2.get_informed_move(
-                    board.state.engine_state, self.complexity
+        # one long lived client, created on first use if none was given
+        self.openai_client = openai_client
+
+        # warm stockfish engines shared with other players, one per move if None
+        self.engine_pool = engine_pool
+
+        # statistics of the last engine search, for the debug overlay
+        self.last_stats: Optional[SearchStats] = None
+        # the backend gave no move and another engine's was played instead
+        self.fell_back = False
+
+        # pondering, search on the opponent's time (piece_squares2 only)
+        self.ponder = ponder
+        self.ponder_thread: Optional[threading.Thread] = None
+        self.ponder_stop = threading.Event()
+        self.ponder_fen = ""
+        self.ponder_predicted = False
+        self.ponder_result: Optional[Tuple[chess.Move, SearchStats]] = None
+
+    def move(self, board: "Board") -> bool:
+        start = time.perf_counter()
+        engine_state = board.state.engine_state
+        if profiling.PROFILER:
+            label = f"ply{engine_state.ply()}-{self.ai}"
+            move = profiling.PROFILER.profile_move(
+                label, self.choose_move, engine_state
+            )
+        else:
+            move = self.choose_move(engine_state)
+        if metrics.METRICS:
+            self.record_metrics(time.perf_counter() - start)
+        if move:
+            moved_piece = board.model.piece_at(move.from_square)
+            if moved_piece:
+                # move piece and update position
+                self.original_pos = moved_piece.grid_pos
+                piece_moved = board.play_move(move, True)
+                self.new_pos = GridPosition(
+                    chess.square_rank(move.to_square), chess.square_file(move.to_square)
                 )
-            elif self.ai == "stockfish":
-                sfengine = stockfish.StockFishEngine(self.engine_path)
-                self.engine = sfengine
-                move = sfengine.get_informed_move(board.state.engine_state)
-                sfengine.quit()
-            elif self.ai == "openai":
-                openai = OpenAIAPIWrapper(self.openai_api_key)
-                fen = board.state.engine_state.board_fen()
-                move = openai.get_next_chess_move(legal_moves, fen, self.color)
-            else:
-                move = random.choice(legal_moves)
-
-            # update board with move
-            if move and move in legal_moves:
-                # get piece
-                to_square = move.to_square
-                from_square = move.from_square
-
-                # get piece
-                board.state.engine_state.piece_at(move.from_square)
-                moved_piece = None
-                for piece in board.state.pieces:
-                    if piece.square == from_square:
-                        moved_piece = piece
-
-                new_pos = CHESS_SQUARE_TO_POS[to_square]
-                if moved_piece:
-                    # move piece and update position
-                    self.original_pos = moved_piece.grid_pos
-                    piece_moved = board.move_piece(moved_piece, new_pos, True)
-                    self.new_pos = moved_piece.grid_pos
-
-                    if piece_moved:
-                        play_sound("drop.mp3", self.sound_vol)
-                    else:
-                        play_sound("invalid_move.mp3", self.sound_vol)
-                else:
-                    LOGGER.error(f"Piece not found at square {from_square}")
 
-                return True
+                if piece_moved:
+                    play_sound("drop.mp3", self.sound_vol)
+                    self.start_pondering(board.state.engine_state)
+                else:
+                    play_sound("invalid_move.mp3", self.sound_vol)
             else:
-                LOGGER.error("No legal moves found. This should not happen. Game Over?")
-                return False
+                LOGGER.error("Piece not found at square %s", move.from_square)
+
+            return True
         else:
-            LOGGER.info("No legal moves found. This should not happen. Game Over?")
+            LOGGER.error("No legal moves found. This should not happen. Game Over?")
             return False
 
+    def record_metrics(self, elapsed: float) -> None:
+        """
+        Time taken and search statistics of the move just chosen
+        """
+        assert metrics.METRICS
+        metrics.METRICS.inc("moves_total", backend=self.ai)
+        metrics.METRICS.observe("move_seconds", elapsed, backend=self.ai)
+        if self.last_stats:
+            nodes = self.last_stats.nodes + self.last_stats.qnodes
+            metrics.METRICS.inc("search_nodes_total", nodes, backend=self.ai)
+            if self.last_stats.nps:
+                metrics.METRICS.observe(
+                    "search_nps", self.last_stats.nps, backend=self.ai
+                )
+
+    def choose_move(self, engine_state: chess.Board) -> Optional[chess.Move]:
+        """
+        Pick the move to play, from the cache or the backend. Needs no board
+        view, so it can be used headless with a GameModel's engine state.
+        """
+        legal_moves = list(engine_state.legal_moves)
+        if len(legal_moves) == 0:
+            LOGGER.info("No legal moves found. This should not happen. Game Over?")
+            return None
+
+        self.last_stats = None
+        self.fell_back = False
+        move = self.get_cached_move(engine_state)
+        if move:
+            self.cancel_pondering()
+        else:
+            move = self.find_move(engine_state, legal_moves)
+            # a fallback move is not the backend's, do not remember it as such
+            if move and move in legal_moves and not self.fell_back:
+                self.cache_move(engine_state, move)
+
+        return move if move in legal_moves else None
+
+    def find_move(
+        self, engine_state: chess.Board, legal_moves: List[chess.Move]
+    ) -> Optional[chess.Move]:
+        """
+        Ask the configured backend for a move
+        """
+        if self.ai == "piece_squares" or self.ai == "piecesquares":
+            move = piece_squares.get_informed_move(engine_state, self.complexity)
+            self.last_stats = piece_squares.stats
+        elif self.ai == "piece_squares2" or self.ai == "piecesquares2":
+            move = self.take_ponder_move(engine_state)
+            if not move:
+                move = piece_squares2.get_informed_move(
+                    engine_state,
+                    self.complexity,
+                    self.search_options,
+                )
+                self.last_stats = piece_squares2.stats
+        elif self.ai == "stockfish" and self.engine_pool:
+            from ai.engines.pool import PoolTimeout
+
+            try:
+                with self.engine_pool.engine(ENGINE_CHECKOUT_TIMEOUT) as sfengine:
+                    move = sfengine.get_informed_move(engine_state)
+                    self.last_stats = sfengine.last_stats  # type: ignore
+            except (
+                PoolTimeout,
+                chess.engine.EngineError,
+                concurrent.futures.TimeoutError,
+            ) as e:
+                # a failed engine is replaced on checkin, play a local move
+                LOGGER.warning("Stockfish gave no move (%s), using piece_squares2", e)
+                move = self.fallback_move(engine_state)
+        elif self.ai == "stockfish":
+            from ai.engines import stockfish
+
+            sfengine = stockfish.StockFishEngine(self.engine_path)
+            self.engine = sfengine
+            move = sfengine.get_informed_move(engine_state)
+            self.last_stats = sfengine.last_stats
+            sfengine.quit()
+        elif self.ai == "openai":
+            fen = engine_state.fen()
+            move = self.get_openai_client().get_next_chess_move(
+                legal_moves, fen, self.color
+            )
+            if not move:
+                # no usable reply within the move budget, play a local move
+                LOGGER.warning("OpenAI gave no move, using piece_squares2")
+                move = self.fallback_move(engine_state)
+        else:
+            move = random.choice(legal_moves)
+
+        return move
+
+    def fallback_move(self, engine_state: chess.Board) -> Optional[chess.Move]:
+        """
+        Move from piece_squares2, when the configured backend gave none
+        """
+        self.fell_back = True
+        move = piece_squares2.get_informed_move(
+            engine_state,
+            self.complexity,
+            self.search_options,
+        )
+        self.last_stats = piece_squares2.stats
+        return move
+
+    def get_openai_client(self) -> "OpenAIAPIWrapper":
+        if not self.openai_client:
+            from ai.openai.api import OpenAIAPIWrapper
+
+            self.openai_client = OpenAIAPIWrapper(self.openai_api_key)
+        return self.openai_client
+
+    def cache_limits(self) -> str:
+        """
+        Settings that change the move the backend finds, part of the cache key
+        """
+        if self.ai in ["piece_squares", "piecesquares"]:
+            return f"depth={self.complexity}"
+        if self.ai in ["piece_squares2", "piecesquares2"]:
+            return f"depth={self.complexity} {self.search_options}"
+        if self.ai == "stockfish":
+            from ai.engines import stockfish
+
+            return f"time={stockfish.MOVE_TIME}"
+        if self.ai == "openai":
+            client = self.get_openai_client()
+            return f"model={client.model} temperature={client.temperature}"
+        return ""
+
+    def get_cached_move(self, engine_state: chess.Board) -> Optional[chess.Move]:
+        """
+        Return the move found earlier for this position, if any. Random moves
+        are never cached.
+        """
+        if not self.move_cache or self.ai not in CACHED_BACKENDS:
+            return None
+        move = self.move_cache.get(engine_state, self.ai, self.cache_limits())
+        if metrics.METRICS:
+            metrics.METRICS.inc("move_cache_total", result="hit" if move else "miss")
+        return move
+
+    def cache_move(self, engine_state: chess.Board, move: chess.Move) -> None:
+        if not self.move_cache or self.ai not in CACHED_BACKENDS:
+            return
+        self.move_cache.put(engine_state, self.ai, self.cache_limits(), move)
+
+    def start_pondering(self, engine_state: chess.Board) -> None:
+        """
+        Search on the opponent's time. The position after the reply predicted
+        by the last search is searched on a background thread, if there is no
+        prediction the current position is searched to warm up the
+        transposition table.
+        """
+        if not self.ponder or self.ai not in ["piece_squares2", "piecesquares2"]:
+            return
+
+        self.cancel_pondering()
+
+        board = engine_state.copy()
+        if board.is_game_over():
+            return
+
+        pv = self.last_stats.pv if self.last_stats else []
+        self.ponder_predicted = (
+            len(pv) > 1
+            and len(board.move_stack) > 0
+            and board.peek() == pv[0]
+            and board.is_legal(pv[1])
+        )
+        if self.ponder_predicted:
+            board.push(pv[1])
+            if board.is_game_over():
+                return
+
+        self.ponder_fen = board.fen()
+        self.ponder_stop = threading.Event()
+        self.ponder_result = None
+        self.ponder_thread = threading.Thread(
+            target=self._ponder, args=(board, self.ponder_stop), daemon=True
+        )
+        self.ponder_thread.start()
+        LOGGER.info("Pondering on %s", self.ponder_fen)
+
+    def _ponder(self, board: chess.Board, stop: threading.Event) -> None:
+        # only stopped on a miss, the result is then thrown away
+        self.ponder_result = piece_squares2.search(
+            board, self.complexity, self.search_options, stop
+        )
+
+    def take_ponder_move(self, engine_state: chess.Board) -> Optional[chess.Move]:
+        """
+        Return the pondered move if the opponent played the predicted reply,
+        otherwise stop pondering and return None
+        """
+        if not self.ponder_thread:
+            return None
+
+        if not self.ponder_predicted or engine_state.fen() != self.ponder_fen:
+            LOGGER.info("Ponder miss")
+            self.cancel_pondering()
+            return None
+
+        # the search is already under way, let it reach the full depth
+        LOGGER.info("Ponder hit")
+        self.ponder_thread.join()
+        self.ponder_thread = None
+        if not self.ponder_result:
+            return None
+
+        move, self.last_stats = self.ponder_result
+        self.ponder_result = None
+        return move
+
+    def cancel_pondering(self) -> None:
+        """
+        Stop the background search, on a ponder miss, undo or new game
+        """
+        if self.ponder_thread:
+            self.ponder_stop.set()
+            self.ponder_thread.join()
+            self.ponder_thread = None
+        self.ponder_result = None
+
     def quit(self):
         """
         Quit engine
         """
+        self.cancel_pondering()
         if self.engine:
             self.engine.quit()
@@ -23,7 +23,9 @@ def validate_move(board: chess.Board, old_pos: GridPosition, new_pos: GridPositi
     if move in board.legal_moves:
         return True
     else:
-        LOGGER.info(f"Invalid move {from_label} -> {to_label} Result:{board.result()}")
+        LOGGER.info(
+            "Invalid move %s -> %s Result:%s", from_label, to_label, board.result()
+        )
     return False
 
 
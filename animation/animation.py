@@ -11,13 +11,10 @@ import pygame
 
 def display_sprite_animation(
     screen: pygame.surface.Surface,
-    image_name: str,
+    sprite_sheet: pygame.surface.Surface,
     sprite_count: int,
     rect: pygame.rect.Rect,
 ):
-    # Load the sprite sheet image
-    sprite_sheet = pygame.image.load(image_name)
-
     # Get the individual frame dimensions
     frame_width = sprite_sheet.get_width() // sprite_count  # number of frames
     frame_height = sprite_sheet.get_height()
@@ -40,7 +37,6 @@ def display_sprite_animation(
     current_frame = 0
 
     while current_frame < sprite_count:
-
         # Display the current frame
         screen.blit(frames[current_frame], rect)
 
@@ -1,25 +1,296 @@
 """
 Config wrapper for the application
+
+config.yml is read once at startup into frozen dataclasses, one per section.
+Every value is checked against the type and limits of its field, unknown keys
+are rejected and missing keys take the field's default, so a broken config
+fails straight away with a ConfigError instead of part way through a game.
+
+Code reads settings as plain attributes, e.g. config.APP_CONFIG.game.sound.
+Settings are never changed in place: update_config() and reload_config()
+build a new config and tell the listeners added with subscribe().
 """
 
+import dataclasses
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Type, TypeVar, Union
+import typing
 import yaml
+from helpers.log import LOG_LEVELS
+from helpers.metrics import FORMATS as METRICS_FORMATS
+from knightfight.database import DATABASE_PATH
 
-APP_CONFIG = {}
+CONFIG_PATH = "config.yml"
 
+AI_BACKENDS = (
+    "basic",
+    "random",
+    "piece_squares",
+    "piecesquares",
+    "piece_squares2",
+    "piecesquares2",
+    "stockfish",
+    "openai",
+)
+PLAYER_TYPES = ("human", "cpu")
 
-def read_config():
-    """Read config file config.yml and return a dictionary"""
+
+class ConfigError(Exception):
+    pass
+
+
+def setting(default: Any, **checks: Any) -> Any:
+    """
+    Field with limits, min / max for numbers and choices for strings
+    """
+    return field(default=default, metadata=checks)
+
+
+@dataclass(frozen=True)
+class BoardConfig:
+    black_pieces: str = "BlackPieces.png"
+    image: str = "board_plain_02.png"
+    size: int = setting(800, min=100)
+    white_pieces: str = "WhitePieces.png"
+    show_possible_moves: bool = True
+
+
+@dataclass(frozen=True)
+class CpuConfig:
+    ai: str = setting("piece_squares2", choices=AI_BACKENDS)
+    cache: bool = False
+    cache_path: Optional[str] = None
+    cache_size: int = setting(10000, min=1)
+    complexity: int = setting(3, min=1)
+    delay: int = setting(1000, min=0)
+    lmr: bool = True
+    null_move: bool = True
+    pvs: bool = True
+    stockfish_path: str = "assets/engines/stockfish"
+    stockfish_pool_size: int = setting(1, min=1)
+    syzygy_path: Optional[str] = "assets/syzygy"
+    openai_api_key: Optional[str] = None
+    openai_api_base: Optional[str] = None
+    openai_budget: float = setting(30.0, min=0)
+    openai_cache_days: float = setting(30.0, min=0)
+    openai_cache_path: Optional[str] = None
+    openai_cache_size: int = setting(5000, min=1)
+    openai_candidates: int = setting(3, min=1)
+    openai_connect_timeout: float = setting(5.0, min=0)
+    openai_model: str = "text-davinci-002"
+    openai_retries: int = setting(2, min=0)
+    openai_temperature: float = setting(1.0, min=0, max=2)
+    openai_timeout: float = setting(15.0, min=0)
+    ponder: bool = False
+
+
+@dataclass(frozen=True)
+class GameConfig:
+    database: Optional[str] = DATABASE_PATH
+    font_name: str = "clarity.ttf"
+    grid_font_size: int = setting(10, min=1)
+    journal_dir: str = "assets/games"
+    label_font_size: int = setting(20, min=1)
+    log_file: Optional[str] = None
+    log_level: str = setting("info", choices=LOG_LEVELS)
+    log_queue: bool = True
+    metrics_format: str = setting("prometheus", choices=METRICS_FORMATS)
+    metrics_interval: float = setting(10.0, min=0.1)
+    metrics_path: Optional[str] = None
+    music: bool = True
+    music_vol: float = setting(0.4, min=0, max=1)
+    player1: str = setting("human", choices=PLAYER_TYPES)
+    player2: str = setting("cpu", choices=PLAYER_TYPES)
+    profile: bool = False
+    profile_dir: str = "assets/profiles"
+    profile_interval: float = setting(30.0, min=0.1)
+    profile_threshold: float = setting(1.0, min=0)
+    show_debug: bool = False
+    show_grid: bool = False
+    show_labels: bool = True
+    show_positions: bool = False
+    sound: bool = True
+    sound_vol: float = setting(1.0, min=0, max=1)
+    soundtrack: str = "clouds.mp3"
+    undo_last_move_allowed: bool = True
+
+
+@dataclass(frozen=True)
+class PieceConfig:
+    size_x: int = setting(90, min=1)
+    size_y: int = setting(90, min=1)
+
+
+@dataclass(frozen=True)
+class StateConfig:
+    last_fen: str = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+
+@dataclass(frozen=True)
+class AppConfig:
+    board: BoardConfig = field(default_factory=BoardConfig)
+    cpu: CpuConfig = field(default_factory=CpuConfig)
+    game: GameConfig = field(default_factory=GameConfig)
+    piece: PieceConfig = field(default_factory=PieceConfig)
+    state: StateConfig = field(default_factory=StateConfig)
+
+
+Section = TypeVar("Section")
+ConfigListener = Callable[[AppConfig, AppConfig], None]
+
+APP_CONFIG = AppConfig()
+listeners: List[ConfigListener] = []
+
+
+def check_value(name: str, value: Any, expected: Any, checks: Dict[str, Any]) -> Any:
+    """
+    Return the value converted to the field's type, or raise a ConfigError
+    """
+    optional = False
+    if typing.get_origin(expected) is Union:
+        # Optional[X], empty yaml values are None
+        optional = True
+        expected = next(t for t in typing.get_args(expected) if t is not type(None))
+    if value is None or value == "" and optional:
+        if optional:
+            return None
+        raise ConfigError(f"{name} must be set")
+
+    if expected is float and isinstance(value, int) and not isinstance(value, bool):
+        value = float(value)
+    if expected is int and isinstance(value, bool) or not isinstance(value, expected):
+        raise ConfigError(
+            f"{name} should be {expected.__name__}, got {type(value).__name__} "
+            f"{value!r}"
+        )
+
+    if expected is str:
+        value = value.strip()
+        if "choices" in checks:
+            value = value.lower()
+            if value not in checks["choices"]:
+                choices = ", ".join(checks["choices"])
+                raise ConfigError(f"{name} should be one of {choices}, got {value!r}")
+    if "min" in checks and value < checks["min"]:
+        raise ConfigError(f"{name} should be at least {checks['min']}, got {value}")
+    if "max" in checks and value > checks["max"]:
+        raise ConfigError(f"{name} should be at most {checks['max']}, got {value}")
+    return value
+
+
+def make_section(cls: Type[Section], name: str, values: Any) -> Section:
+    """
+    Build and validate one section of the config
+    """
+    if values is None:
+        values = {}
+    if not isinstance(values, dict):
+        raise ConfigError(f"{name} should be a mapping of settings")
+
+    fields = {f.name: f for f in dataclasses.fields(cls)}
+    unknown = sorted(set(values) - set(fields))
+    if unknown:
+        raise ConfigError(f"unknown setting {name}.{unknown[0]}")
+
+    hints = typing.get_type_hints(cls)
+    checked = {
+        key: check_value(f"{name}.{key}", value, hints[key], fields[key].metadata)
+        for key, value in values.items()
+    }
+    return cls(**checked)
+
+
+def make_config(values: Any) -> AppConfig:
+    """
+    Build and validate the config from the contents of config.yml
+    """
+    if values is None:
+        values = {}
+    if not isinstance(values, dict):
+        raise ConfigError("config should be a mapping of sections")
+    sections = {f.name: f for f in dataclasses.fields(AppConfig)}
+    unknown = sorted(set(values) - set(sections))
+    if unknown:
+        raise ConfigError(f"unknown config section {unknown[0]}")
+
+    return AppConfig(
+        **{
+            name: make_section(
+                section.default_factory, name, values.get(name)  # type: ignore
+            )
+            for name, section in sections.items()
+        }
+    )
+
+
+def read_config(path: str = CONFIG_PATH) -> AppConfig:
+    """Read config file config.yml, raises ConfigError if it is not valid"""
     global APP_CONFIG
-    APP_CONFIG = read_config_inner()
+    try:
+        APP_CONFIG = make_config(read_config_inner(path))
+    except ConfigError as e:
+        raise ConfigError(f"{path}: {e}") from None
+    return APP_CONFIG
 
 
-def save_config():
+def save_config(path: str = CONFIG_PATH) -> None:
     """Save config file config.yml"""
-    with open("config.yml", "w") as file:
-        yaml.dump(APP_CONFIG, file)
+    with open(path, "w") as file:
+        yaml.dump(config_dict(), file)
 
 
-def read_config_inner() -> dict:
+def read_config_inner(path: str = CONFIG_PATH) -> dict:
     """Read config file config.yml and return a dictionary"""
-    with open("config.yml", "r") as file:
+    with open(path, "r") as file:
         return yaml.load(file, Loader=yaml.FullLoader)
+
+
+def config_dict() -> dict:
+    """The current config as nested dictionaries, as in config.yml"""
+    return dataclasses.asdict(APP_CONFIG)
+
+
+def subscribe(listener: ConfigListener) -> None:
+    """
+    Call listener(old, new) whenever the config is changed
+    """
+    listeners.append(listener)
+
+
+def unsubscribe(listener: ConfigListener) -> None:
+    if listener in listeners:
+        listeners.remove(listener)
+
+
+def set_config(new_config: AppConfig) -> None:
+    global APP_CONFIG
+    old_config = APP_CONFIG
+    if new_config == old_config:
+        return
+    APP_CONFIG = new_config
+    for listener in list(listeners):
+        listener(old_config, new_config)
+
+
+def update_config(section: str, **values: Any) -> AppConfig:
+    """
+    Change settings of one section, e.g. update_config("game", sound=False)
+    """
+    current = getattr(APP_CONFIG, section, None)
+    if current is None:
+        raise ConfigError(f"unknown config section {section}")
+    updated = make_section(
+        type(current), section, {**dataclasses.asdict(current), **values}
+    )
+    set_config(dataclasses.replace(APP_CONFIG, **{section: updated}))
+    return APP_CONFIG
+
+
+def reload_config(path: str = CONFIG_PATH) -> AppConfig:
+    """
+    Read config.yml again after it was edited. Raises ConfigError if the
+    file is not valid, the current config is left unchanged then.
+    """
+    new_config = make_config(read_config_inner(path))
+    set_config(new_config)
+    return APP_CONFIG
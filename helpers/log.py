@@ -1,7 +1,66 @@
+import atexit
 import logging
+import logging.handlers
+import queue
+from typing import List, Optional
 
-logging.basicConfig(format='%(asctime)s %(message)s',
-                    datefmt='%m/%d/%Y %I:%M:%S %p',
-                    level=logging.DEBUG)
+LOG_FORMAT = "%(asctime)s %(message)s"
+DATE_FORMAT = "%m/%d/%Y %I:%M:%S %p"
+LOG_LEVELS = ("debug", "info", "warning", "error", "critical")
+
+# tools and tests log at INFO, the game sets its level with setup_logging
+logging.basicConfig(format=LOG_FORMAT, datefmt=DATE_FORMAT, level=logging.INFO)
 
 LOGGER = logging.getLogger(__name__)
+
+# writes the queued records on its own thread, if logging through a queue
+listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging(
+    level: str = "info", log_file: Optional[str] = None, use_queue: bool = False
+) -> None:
+    """
+    Set the log level and handlers. Records go to the console and log_file if
+    set. With use_queue the game thread only puts records on a queue and they
+    are formatted and written on a listener thread.
+    """
+    global listener
+    stop_logging()
+
+    formatter = logging.Formatter(LOG_FORMAT, DATE_FORMAT)
+    handlers: List[logging.Handler] = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.setLevel(level.upper())
+
+    if use_queue:
+        records: queue.SimpleQueue = queue.SimpleQueue()
+        root.addHandler(logging.handlers.QueueHandler(records))
+        listener = logging.handlers.QueueListener(records, *handlers)
+        listener.start()
+    else:
+        for handler in handlers:
+            root.addHandler(handler)
+
+
+def stop_logging() -> None:
+    """
+    Write out queued records and stop the listener thread
+    """
+    global listener
+    if listener:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+        listener = None
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,227 @@
+"""
+Counters and histograms for unattended games and AI matches.
+
+Metrics are off unless a path is configured. While they are off METRICS is
+None and every call site checks that first, so the cost is one attribute
+lookup. When enabled, the values are written to the file every few seconds
+and when the game quits, either in the Prometheus text format (the whole file
+is replaced, suitable for node_exporter's textfile collector) or as JSON
+lines (one snapshot per line appended).
+
+    if metrics.METRICS:
+        metrics.METRICS.observe("move_seconds", elapsed, backend="stockfish")
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from helpers.log import LOGGER
+
+PREFIX = "knightfight_"
+FORMATS = ("prometheus", "jsonl")
+INTERVAL = 10.0
+
+# bucket upper bounds, seconds
+MOVE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+FRAME_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.0167, 0.025, 0.05, 0.1, 0.25)
+NPS_BUCKETS = (1e3, 5e3, 1e4, 2.5e4, 5e4, 1e5, 2.5e5, 1e6, 5e6)
+
+# name -> (type, help, buckets for histograms)
+DEFINITIONS: Dict[str, Tuple[str, str, Tuple[float, ...]]] = {
+    "moves_total": ("counter", "CPU moves played", ()),
+    "move_seconds": ("histogram", "Time to choose a CPU move", MOVE_BUCKETS),
+    "search_nodes_total": ("counter", "Nodes searched for CPU moves", ()),
+    "search_nps": ("histogram", "Nodes per second of a CPU search", NPS_BUCKETS),
+    "move_cache_total": ("counter", "Move cache lookups by result", ()),
+    "frame_seconds": ("histogram", "Time to render a frame", FRAME_BUCKETS),
+    "asset_requests_total": ("counter", "Asset requests by kind and result", ()),
+    "engine_starts_total": ("counter", "Engine processes started", ()),
+    "engine_restarts_total": ("counter", "Unhealthy engines replaced", ()),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """
+        (upper bound, observations at or under it), as Prometheus buckets
+        """
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            total += count
+            result.append(("+Inf" if bound == math.inf else f"{bound:g}", total))
+        return result
+
+
+class Metrics:
+    def __init__(
+        self, path: str, format: str = "prometheus", interval: float = INTERVAL
+    ) -> None:
+        if format not in FORMATS:
+            raise ValueError(f"metrics format should be one of {FORMATS}")
+        self.path = path
+        self.format = format
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            values = self.counters.setdefault(name, {})
+            values[key] = values.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            values = self.histograms.setdefault(name, {})
+            histogram = values.get(key)
+            if histogram is None:
+                histogram = values[key] = Histogram(DEFINITIONS[name][2])
+            histogram.observe(value)
+
+    def prometheus(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format
+        """
+        lines = []
+        with self.lock:
+            for name, values in sorted(self.counters.items()):
+                lines += self.header(name)
+                for key, value in values.items():
+                    lines.append(f"{PREFIX}{name}{format_labels(key)} {value:g}")
+            for name, histograms in sorted(self.histograms.items()):
+                lines += self.header(name)
+                for key, histogram in histograms.items():
+                    for bound, count in histogram.cumulative():
+                        labels = format_labels(key + (("le", bound),))
+                        lines.append(f"{PREFIX}{name}_bucket{labels} {count}")
+                    labels = format_labels(key)
+                    lines.append(f"{PREFIX}{name}_sum{labels} {histogram.sum:g}")
+                    lines.append(f"{PREFIX}{name}_count{labels} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def header(self, name: str) -> List[str]:
+        kind, help, _ = DEFINITIONS.get(name, ("untyped", name, ()))
+        return [f"# HELP {PREFIX}{name} {help}", f"# TYPE {PREFIX}{name} {kind}"]
+
+    def snapshot(self) -> dict:
+        """
+        All metrics as one JSON object
+        """
+        with self.lock:
+            metrics: Dict[str, List[dict]] = {}
+            for name, values in self.counters.items():
+                metrics[name] = [
+                    {"labels": dict(key), "value": value}
+                    for key, value in values.items()
+                ]
+            for name, histograms in self.histograms.items():
+                metrics[name] = [
+                    {
+                        "labels": dict(key),
+                        "count": histogram.count,
+                        "sum": histogram.sum,
+                        "buckets": dict(histogram.cumulative()),
+                    }
+                    for key, histogram in histograms.items()
+                ]
+        return {"time": time.time(), "metrics": metrics}
+
+    def dump(self) -> None:
+        """
+        Write the metrics to the file
+        """
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            if self.format == "jsonl":
+                with open(self.path, "a", encoding="utf-8") as file:
+                    file.write(json.dumps(self.snapshot()) + "\n")
+            else:
+                # replaced in one go, so a scraper never reads half a file
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as file:
+                    file.write(self.prometheus())
+                os.replace(tmp_path, self.path)
+        except OSError as e:
+            LOGGER.error("Could not write metrics to %s: %s", self.path, e)
+
+    def start(self) -> None:
+        """
+        Dump the metrics every interval on a background thread
+        """
+        self.thread = threading.Thread(
+            target=self.dump_periodically, name="metrics", daemon=True
+        )
+        self.thread.start()
+
+    def dump_periodically(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            self.dump()
+
+    def close(self) -> None:
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        self.dump()
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels) + "}"
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+METRICS: Optional[Metrics] = None
+
+
+def enable(path: str, format: str = "prometheus", interval: float = INTERVAL) -> None:
+    """
+    Start collecting metrics and writing them to path
+    """
+    global METRICS
+    disable()
+    METRICS = Metrics(path, format, interval)
+    METRICS.start()
+    LOGGER.info("Writing %s metrics to %s every %gs", format, path, interval)
+
+
+def disable() -> None:
+    """
+    Stop collecting metrics, after a last dump
+    """
+    global METRICS
+    if METRICS:
+        METRICS.close()
+        METRICS = None
@@ -0,0 +1,175 @@
+"""
+Profiling of the game loop and of slow CPU moves.
+
+When enabled with main.py --profile or game.profile in config.yml, every
+iteration of the game loop is split into phases with lap(): handling events,
+the game over check, the CPU delay, choosing and animating the CPU move,
+rendering and the display flip. The count, total and slowest time of each
+phase are written to the log every few seconds and when the game quits.
+
+Every CPU move is run under cProfile, and moves that take longer than the
+threshold have their profile written to a .pstats file, so slow turns are
+captured without attaching a profiler by hand. cProfile slows the search
+down, so the threshold is compared with the time taken while profiling.
+
+    python -m pstats assets/profiles/move-20260101-120000-ply12-piece_squares2.pstats
+
+While profiling is off PROFILER is None and lap() returns straight away.
+"""
+
+import cProfile
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+from helpers.log import LOGGER
+
+THRESHOLD = 1.0
+INTERVAL = 30.0
+PROFILE_DIR = "assets/profiles"
+
+Result = TypeVar("Result")
+
+
+class Phase:
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def add(self, elapsed_ns: int) -> None:
+        self.count += 1
+        self.total_ns += elapsed_ns
+        if elapsed_ns > self.max_ns:
+            self.max_ns = elapsed_ns
+
+
+class Profiler:
+    def __init__(
+        self,
+        output_dir: str = PROFILE_DIR,
+        threshold: float = THRESHOLD,
+        interval: float = INTERVAL,
+    ) -> None:
+        self.output_dir = output_dir
+        self.threshold_ns = int(threshold * 1e9)
+        self.interval_ns = int(interval * 1e9)
+        # phases in the order they were first seen, which is loop order
+        self.phases: Dict[str, Phase] = {}
+        self.last_lap = time.perf_counter_ns()
+        self.last_report = self.last_lap
+        self.moves = 0
+        self.saved: List[str] = []
+
+    def lap(self, name: str) -> None:
+        now = time.perf_counter_ns()
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = Phase()
+        phase.add(now - self.last_lap)
+        self.last_lap = now
+        if now - self.last_report >= self.interval_ns:
+            self.report()
+            self.last_report = now
+
+    def reset_lap(self) -> None:
+        """
+        Start timing from now, e.g. after waiting on a menu
+        """
+        self.last_lap = time.perf_counter_ns()
+
+    def profile_move(
+        self, label: str, func: Callable[..., Result], *args: Any
+    ) -> Result:
+        """
+        Call func under cProfile and save the profile if it was slow
+        """
+        profile = cProfile.Profile()
+        start = time.perf_counter_ns()
+        try:
+            return profile.runcall(func, *args)
+        finally:
+            elapsed = time.perf_counter_ns() - start
+            self.moves += 1
+            if elapsed >= self.threshold_ns:
+                self.save(profile, label, elapsed)
+
+    def save(self, profile: cProfile.Profile, label: str, elapsed_ns: int) -> None:
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.output_dir, f"move-{stamp}-{label}.pstats")
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            profile.dump_stats(path)
+        except OSError as e:
+            LOGGER.error("Could not write profile to %s: %s", path, e)
+            return
+        self.saved.append(path)
+        LOGGER.warning(
+            "Slow CPU move %s took %.2fs, profile written to %s",
+            label,
+            elapsed_ns / 1e9,
+            path,
+        )
+
+    def report(self) -> None:
+        if not self.phases:
+            return
+        total_ns = sum(phase.total_ns for phase in self.phases.values())
+        lines = [f"{'phase':<12} {'count':>7} {'mean':>9} {'max':>9} {'share':>6}"]
+        for name, phase in self.phases.items():
+            mean_ms = phase.total_ns / phase.count / 1e6
+            share = phase.total_ns / total_ns * 100 if total_ns else 0.0
+            lines.append(
+                f"{name:<12} {phase.count:>7} {mean_ms:>7.2f}ms "
+                f"{phase.max_ns / 1e6:>7.1f}ms {share:>5.1f}%"
+            )
+        LOGGER.info(
+            "Game loop profile, %d CPU moves profiled, %d slow:\n%s",
+            self.moves,
+            len(self.saved),
+            "\n".join(lines),
+        )
+
+
+PROFILER: Optional[Profiler] = None
+
+
+def enable(
+    output_dir: str = PROFILE_DIR,
+    threshold: float = THRESHOLD,
+    interval: float = INTERVAL,
+) -> None:
+    """
+    Start timing the game loop and profiling CPU moves
+    """
+    global PROFILER
+    PROFILER = Profiler(output_dir, threshold, interval)
+    LOGGER.info(
+        "Profiling, CPU moves over %gs are written to %s", threshold, output_dir
+    )
+
+
+def disable() -> None:
+    """
+    Stop profiling, after a last report
+    """
+    global PROFILER
+    if PROFILER:
+        PROFILER.report()
+        PROFILER = None
+
+
+def lap(name: str) -> None:
+    """
+    End a phase of the game loop, timed from the end of the one before. Does
+    nothing unless profiling.
+    """
+    if PROFILER:
+        PROFILER.lap(name)
+
+
+def reset_lap() -> None:
+    """
+    Time the next phase from now, so waiting on a menu is not counted
+    """
+    if PROFILER:
+        PROFILER.reset_lap()
@@ -1,3 +1,4 @@
+import logging
 import chess
 from typing import Optional, List, Tuple
 from knightfight.types import GridPosition, PieceType, PieceColour
@@ -23,5 +24,6 @@ def add_move_to_engine_state(
     engine_state.push(move)
 
     # Return the engine state
-    LOGGER.debug(f"FEN: {engine_state.fen()}")
+    if LOGGER.isEnabledFor(logging.DEBUG):
+        LOGGER.debug("FEN: %s", engine_state.fen())
     return engine_state
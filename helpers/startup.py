@@ -0,0 +1,194 @@
+"""
+Startup profiling and the time to first frame benchmark.
+
+When enabled with main.py --profile-startup, every module imported from then
+on is timed, and the startup phases of the game (config, window, players,
+title screen) are timed with mark(). The report is printed when the
+first frame is shown.
+
+The benchmark starts the game several times with the dummy SDL drivers, times
+how long it takes to show the title screen and fails if the median is over
+the budget.
+
+Usage: python -m helpers.startup [--budget SECONDS] [--runs N]
+"""
+
+import argparse
+import importlib.machinery
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+BUDGET = 2.0
+RUNS = 5
+FIRST_FRAME = "time to first frame"
+REPORT_MODULES = 15
+
+# loaders that are created for each module, safe to wrap
+TIMED_LOADERS = (
+    importlib.machinery.SourceFileLoader,
+    importlib.machinery.SourcelessFileLoader,
+    importlib.machinery.ExtensionFileLoader,
+)
+
+
+class ImportTimer:
+    """
+    Meta path finder that times the loading of every module, excluding the
+    time spent importing the modules it imports
+    """
+
+    def __init__(self) -> None:
+        # name -> (own time, total time)
+        self.times: Dict[str, Tuple[float, float]] = {}
+        # name, start, time spent in nested imports
+        self.stack: List[List] = []
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+
+        if isinstance(spec.loader, TIMED_LOADERS):
+            spec.loader.exec_module = self.timed(name, spec.loader.exec_module)
+        return spec
+
+    def timed(self, name, exec_module):
+        def timed_exec_module(module):
+            self.stack.append([name, time.perf_counter(), 0.0])
+            try:
+                exec_module(module)
+            finally:
+                _, start, nested = self.stack.pop()
+                total = time.perf_counter() - start
+                self.times[name] = (total - nested, total)
+                if self.stack:
+                    self.stack[-1][2] += total
+
+        return timed_exec_module
+
+
+class StartupProfile:
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.last_mark = self.start
+        self.imports = ImportTimer()
+        self.phases: List[Tuple[str, float]] = []
+        self.reported = False
+
+    def install(self) -> None:
+        sys.meta_path.insert(0, self.imports)
+
+    def uninstall(self) -> None:
+        if self.imports in sys.meta_path:
+            sys.meta_path.remove(self.imports)
+
+    def report(self) -> None:
+        elapsed = time.perf_counter() - self.start
+        imports = sorted(
+            self.imports.times.items(), key=lambda item: item[1][0], reverse=True
+        )
+        import_total = sum(own for own, _ in self.imports.times.values())
+
+        print("Startup profile")
+        print(f"  {'phase':<32} {'time':>9}")
+        for name, duration in self.phases:
+            print(f"  {name:<32} {duration * 1000:>7.1f}ms")
+        print(f"  {len(imports)} modules imported in {import_total * 1000:.1f}ms")
+        print(f"  {'module':<32} {'self':>9} {'total':>9}")
+        for name, (own, total) in imports[:REPORT_MODULES]:
+            print(f"  {name:<32} {own * 1000:>7.1f}ms {total * 1000:>7.1f}ms")
+        print(f"{FIRST_FRAME}: {elapsed:.3f}s", flush=True)
+
+
+PROFILE: Optional[StartupProfile] = None
+
+
+def enable() -> None:
+    """
+    Start profiling, call before the imports to time
+    """
+    global PROFILE
+    if PROFILE is None:
+        PROFILE = StartupProfile()
+        PROFILE.install()
+
+
+def mark(name: str) -> None:
+    """
+    End a startup phase, timed from the end of the one before. Does nothing
+    unless profiling.
+    """
+    if PROFILE is None or PROFILE.reported:
+        return
+    now = time.perf_counter()
+    PROFILE.phases.append((name, now - PROFILE.last_mark))
+    PROFILE.last_mark = now
+
+
+def first_frame() -> None:
+    """
+    Called when a frame is shown, reports the profile after the first one
+    """
+    if PROFILE is None or PROFILE.reported:
+        return
+    mark("title screen")
+    PROFILE.reported = True
+    PROFILE.uninstall()
+    PROFILE.report()
+
+
+def time_first_frame() -> float:
+    """
+    Start the game with the dummy SDL drivers and return the seconds until
+    the title screen is shown
+    """
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy")
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "main.py", "--profile-startup"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        env=env,
+        text=True,
+    )
+    try:
+        assert process.stdout
+        for line in process.stdout:
+            if line.startswith(FIRST_FRAME):
+                return time.perf_counter() - start
+        raise RuntimeError(f"game exited with {process.wait()} before a frame")
+    finally:
+        process.kill()
+        process.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Time to first frame benchmark")
+    parser.add_argument(
+        "--budget", type=float, default=BUDGET, help="seconds allowed, median"
+    )
+    parser.add_argument("--runs", type=int, default=RUNS)
+    args = parser.parse_args()
+
+    times = []
+    for run in range(args.runs):
+        times.append(time_first_frame())
+        print(f"run {run + 1}: {times[-1]:.3f}s")
+
+    median = statistics.median(times)
+    print(f"best {min(times):.3f}s, median {median:.3f}s, budget {args.budget:.3f}s")
+    if median > args.budget:
+        sys.exit(f"time to first frame {median:.3f}s is over the budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Images, sounds, music and fonts from the assets folder, kept in memory.
+
+start() lists the files in assets/ and decodes them on a background thread
+while the title screen is shown. Only converting images to the display format
+has to happen on the main thread, that is done the first time an image is
+used. Anything asked for before the loader got to it is loaded straight away
+on the main thread, everything after that is served from memory.
+
+Music is kept as the encoded file and streamed by pygame.mixer.music, fonts
+are kept as the font file and opened once per size.
+"""
+
+import fnmatch
+import io
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import pygame
+from helpers import metrics
+from helpers.log import LOGGER
+
+ASSETS_DIR = "assets"
+IMAGE_TYPES = (".png", ".jpg")
+SOUND_TYPES = (".mp3", ".ogg", ".wav")
+FONT_TYPES = (".ttf", ".otf")
+
+# screenshots for the README, never shown in the game
+SKIPPED_IMAGES = (
+    "sshot*",
+    "title_screen.png",
+    "openai.jpg",
+    "pygame.png",
+    "stockfish.png",
+)
+
+# streamed rather than decoded, the soundtrack from config.yml is added
+MUSIC = ("title.mp3", "tense.mp3")
+
+# loaded first, the title screen needs them
+TITLE_ASSETS = ("images/logo.png", "sounds/title.mp3")
+
+
+class AssetManager:
+    def __init__(self, root: str = ASSETS_DIR) -> None:
+        self.root = root
+        self.music_files: Set[str] = set(MUSIC)
+
+        # decoded on the loader thread, guarded by the condition
+        self.condition = threading.Condition()
+        self.pending: List[str] = []
+        self.in_progress: Optional[str] = None
+        self.decoded: Dict[str, pygame.surface.Surface] = {}
+        self.sounds: Dict[str, Optional[pygame.mixer.Sound]] = {}
+        self.data: Dict[str, bytes] = {}
+        self.total = 0
+        self.thread: Optional[threading.Thread] = None
+
+        # main thread only
+        self.images: Dict[str, pygame.surface.Surface] = {}
+        self.fonts: Dict[Tuple[str, int], Tuple[pygame.font.Font, io.BytesIO]] = {}
+
+    def list_assets(self) -> List[str]:
+        """
+        Asset paths relative to the assets folder, title screen assets first
+        """
+        paths = []
+        for folder, types in (
+            ("images", IMAGE_TYPES),
+            ("sounds", SOUND_TYPES),
+            ("fonts", FONT_TYPES),
+        ):
+            directory = os.path.join(self.root, folder)
+            if not os.path.isdir(directory):
+                continue
+            for name in sorted(os.listdir(directory)):
+                if not name.lower().endswith(types):
+                    continue
+                if folder == "images" and any(
+                    fnmatch.fnmatch(name, pattern) for pattern in SKIPPED_IMAGES
+                ):
+                    continue
+                paths.append(f"{folder}/{name}")
+
+        first = [path for path in TITLE_ASSETS if path in paths]
+        return first + [path for path in paths if path not in first]
+
+    def start(self, music: Iterable[str] = ()) -> None:
+        """
+        Start decoding every asset on a background thread
+        """
+        if self.thread:
+            return
+        self.music_files.update(music)
+        with self.condition:
+            self.pending = self.list_assets()
+            self.total = len(self.pending)
+        self.thread = threading.Thread(
+            target=self.load_pending, name="asset-loader", daemon=True
+        )
+        self.thread.start()
+
+    def load_pending(self) -> None:
+        start = time.perf_counter()
+        while True:
+            with self.condition:
+                if not self.pending:
+                    break
+                path = self.pending.pop(0)
+                self.in_progress = path
+            try:
+                self.load(path)
+            finally:
+                with self.condition:
+                    self.in_progress = None
+                    self.condition.notify_all()
+        elapsed = time.perf_counter() - start
+        LOGGER.info("Loaded %d assets in %.2fs", self.total, elapsed)
+
+    def load(self, path: str) -> None:
+        """
+        Decode one asset and keep it, errors are logged and the asset skipped
+        """
+        full_path = os.path.join(self.root, path)
+        folder, name = path.split("/", 1)
+        try:
+            if folder == "images":
+                image = pygame.image.load(full_path)
+                with self.condition:
+                    self.decoded[path] = image
+            elif folder == "sounds" and name not in self.music_files:
+                sound = (
+                    pygame.mixer.Sound(full_path) if pygame.mixer.get_init() else None
+                )
+                with self.condition:
+                    self.sounds[path] = sound
+            else:
+                with open(full_path, "rb") as file:
+                    data = file.read()
+                with self.condition:
+                    self.data[path] = data
+        except (pygame.error, OSError) as e:
+            LOGGER.error("Could not load asset %s: %s", path, e)
+
+    def fetch(self, path: str, store: Dict) -> Optional[object]:
+        """
+        An asset from the store, waiting for the loader or loading it here if
+        it has not been loaded yet
+        """
+        result = "hit"
+        with self.condition:
+            while path not in store:
+                if self.in_progress == path:
+                    result = "waited"
+                    self.condition.wait()
+                    continue
+                if path in self.pending:
+                    self.pending.remove(path)
+                break
+            if path in store:
+                self.count(path, result)
+                return store[path]
+        self.load(path)
+        self.count(path, "loaded")
+        return store.get(path)
+
+    def count(self, path: str, result: str) -> None:
+        """
+        Asset request metric, hit when it was already in memory
+        """
+        if metrics.METRICS:
+            kind = path.split("/", 1)[0]
+            metrics.METRICS.inc("asset_requests_total", kind=kind, result=result)
+
+    @property
+    def loading(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def progress(self) -> Tuple[int, int]:
+        """
+        Number of assets loaded and the number to load
+        """
+        with self.condition:
+            return self.total - len(self.pending), self.total
+
+    def image(self, name: str) -> pygame.surface.Surface:
+        """
+        Image from assets/images, converted to the display format when there
+        is a display. The surface is shared, copy it before drawing on it.
+        """
+        path = f"images/{name}"
+        image = self.images.get(path)
+        if image is not None:
+            self.count(path, "hit")
+        else:
+            decoded = self.fetch(path, self.decoded)
+            if decoded is None:
+                raise FileNotFoundError(f"no image {os.path.join(self.root, path)}")
+            image = decoded  # type: ignore
+            if pygame.display.get_surface() is not None:
+                image = image.convert_alpha()
+                self.images[path] = image
+        return image
+
+    def sound(self, name: str) -> Optional[pygame.mixer.Sound]:
+        """
+        Sound effect from assets/sounds, None if there is no audio device
+        """
+        return self.fetch(f"sounds/{name}", self.sounds)  # type: ignore
+
+    def music(self, name: str) -> io.BytesIO:
+        """
+        Music file from assets/sounds, to pass to pygame.mixer.music.load
+        """
+        self.music_files.add(name)
+        data = self.fetch(f"sounds/{name}", self.data)
+        if data is None:
+            raise FileNotFoundError(
+                f"no music {os.path.join(self.root, 'sounds', name)}"
+            )
+        return io.BytesIO(data)  # type: ignore
+
+    def font(self, name: str, size: int) -> pygame.font.Font:
+        """
+        Font from assets/fonts, opened once for each size
+        """
+        cached = self.fonts.get((name, size))
+        if cached is not None:
+            self.count(f"fonts/{name}", "hit")
+        else:
+            data = self.fetch(f"fonts/{name}", self.data)
+            if data is None:
+                raise FileNotFoundError(
+                    f"no font {os.path.join(self.root, 'fonts', name)}"
+                )
+            # the font reads from the file object, so it is kept with it
+            file = io.BytesIO(data)  # type: ignore
+            cached = (pygame.font.Font(file, size), file)
+            self.fonts[(name, size)] = cached
+        return cached[0]
+
+
+ASSETS = AssetManager()
@@ -1,37 +1,41 @@
 """
-The board class to capture the state of the chess board.
+The board class to draw the chess board, the pygame view of a GameModel.
 """
 
+import time
 from typing import Tuple, Optional, List
 import pygame
 import chess
-from helpers.conversions import square_to_position
-from helpers.pychess import add_move_to_engine_state
+from helpers.conversions import grid_position_to_square, square_to_position
 from animation.animation import display_sprite_animation
+from helpers import metrics
 from helpers.log import LOGGER
+from knightfight.assets import ASSETS
+from knightfight.journal import GameJournal
+from knightfight.model import GameModel
 from knightfight.piece import Piece
 from knightfight.state import BoardState
 from config import config
 from knightfight.types import PieceColour, GridPosition, PieceType
-from ai.validation import is_move_valid
 from sound.playback import play_sound
 
 
 class Board:
     def __init__(self, window_surface: pygame.surface.Surface) -> None:
-        board_size = config.APP_CONFIG["board"]["size"]
-        board_image = config.APP_CONFIG["board"]["image"]
+        board_size = config.APP_CONFIG.board.size
+        board_image = config.APP_CONFIG.board.image
 
-        self.sound_vol = config.APP_CONFIG["game"]["sound_vol"]
+        self.sound_vol = config.APP_CONFIG.game.sound_vol
         self.window_surface = window_surface
-        self.board_image = pygame.image.load(f"assets/images/{board_image}")
+        self.board_image = ASSETS.image(board_image)
         self.board_rect = self.board_image.get_rect()
         self.board_rect.topleft = (0, 0)
         self.board_image = pygame.transform.scale(
             self.board_image, (board_size, board_size)
         )
 
-        self.state = BoardState()
+        # pieces and rules, pieces are created with sprites by make_piece
+        self.model = GameModel(piece_factory=self.make_piece)
 
         # initialize the pieces
         self.init_pieces()
@@ -49,70 +53,79 @@ class Board:
         # for possible moves
         self.move_squares: chess.SquareSet = chess.SquareSet()
 
+    @property
+    def state(self) -> BoardState:
+        return self.model.state
+
     def load_last_game(self) -> None:
         """
-        Reset the board to the starting position
+        Continue the last game, replayed from its journal
         """
-        last_fen = config.APP_CONFIG["state"]["last_fen"]
-        self.state.engine_state.reset()
-        self.state = BoardState()
-        self.init_pieces(last_fen)
+        journal_dir = config.APP_CONFIG.game.journal_dir
+        journal = GameJournal.latest(journal_dir)
+        if journal is None:
+            # games saved before the journal only kept the position
+            self.init_pieces(config.APP_CONFIG.state.last_fen)
+            return
+
+        self.close_journal()
+        self.model.load(journal.replay())
+        self.model.journal = journal
+        LOGGER.info("Loaded FEN: %s", self.state.engine_state.fen())
 
     def undo_last_move(self) -> None:
         """
         Undo the last move
         """
-        # save the current state
-        last_state = self.state.engine_state
-
-        # pop the last state - undo
-        last_state.pop()
-
-        # reset the board
-        self.state = BoardState()
-
-        # re-initialize the pieces
-        self.init_pieces(last_state.fen())
+        self.model.undo()
+        self.last_move_arrow = None
 
     def init_pieces(self, last_fen: str = "") -> None:
         """
-        Initialize the pieces on the board
+        Initialize the pieces on the board, a new game with its own journal
         """
 
         # load the last state if requested
-        self.state.engine_state = chess.Board(last_fen) if last_fen else chess.Board()
-        LOGGER.info(f"Starting FEN: {self.state.engine_state.fen()})")
-
-        # iterate through chess pieces and add them to the board
-        board = self.state.engine_state
-        LOGGER.info(f"Board\n{board}")
-
-        for square in board.piece_map():
-            piece = board.piece_at(square)
-            if piece is not None:
-                row, col = 7 - (square // 8), (square % 8)
-                piece_pos_x = 40 + col * 90
-                piece_pos_y = 40 + row * 90
-
-                piece = Piece(
-                    self.window_surface,
-                    PieceType(chess.piece_name(piece.piece_type).capitalize()),
-                    PieceColour("W" if piece.color == chess.WHITE else "B"),
-                    piece_pos_x,  # x pos left
-                    piece_pos_y,  # y pos top
-                    GridPosition(7 - row, col),
-                    square,
-                )
-                self.add_piece(piece)
-
-        return
+        self.model.reset(last_fen)
+        LOGGER.info("Starting FEN: %s", self.state.engine_state.fen())
+        LOGGER.debug("Board\n%s", self.state.engine_state)
+
+        self.close_journal()
+        journal_dir = config.APP_CONFIG.game.journal_dir
+        self.model.journal = GameJournal.new(journal_dir, self.state.engine_state.fen())
+
+    def close_journal(self) -> None:
+        if self.model.journal:
+            self.model.journal.close()
+            self.model.journal = None
+
+    def make_piece(
+        self,
+        piece_type: PieceType,
+        piece_colour: PieceColour,
+        grid_pos: GridPosition,
+        square: int,
+    ) -> Piece:
+        """
+        Create a piece with its sprite, the model's piece factory
+        """
+        piece_pos_x, piece_pos_y = square_to_position(square)
+        return Piece(
+            self.window_surface,
+            piece_type,
+            piece_colour,
+            piece_pos_x,  # x pos left
+            piece_pos_y,  # y pos top
+            grid_pos,
+            square,
+        )
 
     def draw_grid(self) -> None:
         """
         Draw the grid on the board
         """
         # show grid if enabled in config
-        if config.APP_CONFIG["game"]["show_grid"]:
+        if config.APP_CONFIG.game.show_grid:
             for row in range(8):
                 for col in range(8):
                     rect = pygame.Rect(
@@ -128,12 +141,12 @@ class Board:
 
     def draw_debug(self) -> None:
         # draw text with rect.left, rect.top
-        font_name = config.APP_CONFIG["game"]["font_name"]
-        font_size = config.APP_CONFIG["game"]["grid_font_size"]
-        debug_font = pygame.font.Font(f"assets/fonts/{font_name}", font_size)
+        font_name = config.APP_CONFIG.game.font_name
+        font_size = config.APP_CONFIG.game.grid_font_size
+        debug_font = ASSETS.font(font_name, font_size)
 
         # show grid if enabled in config
-        if config.APP_CONFIG["game"]["show_debug"]:
+        if config.APP_CONFIG.game.show_debug:
             for row in range(8):
                 for col in range(8):
                     rect = pygame.Rect(
@@ -150,10 +163,10 @@ class Board:
         Draw the positions on the board
         """
         # show grid position if enabled in config
-        if config.APP_CONFIG["game"]["show_positions"]:
-            font_name = config.APP_CONFIG["game"]["font_name"]
-            font_size = config.APP_CONFIG["game"]["grid_font_size"]
-            grid_font = pygame.font.Font(f"assets/fonts/{font_name}", font_size)
+        if config.APP_CONFIG.game.show_positions:
+            font_name = config.APP_CONFIG.game.font_name
+            font_size = config.APP_CONFIG.game.grid_font_size
+            grid_font = ASSETS.font(font_name, font_size)
             for row in range(8):
                 for col in range(8):
                     x = 40 + col * 90 + 5
@@ -174,10 +187,10 @@ class Board:
         Draw the labels on the board
         """
         # show grid position if enabled in config
-        if config.APP_CONFIG["game"]["show_labels"]:
-            font_name = config.APP_CONFIG["game"]["font_name"]
-            font_size = config.APP_CONFIG["game"]["label_font_size"]
-            grid_font = pygame.font.Font(f"assets/fonts/{font_name}", font_size)
+        if config.APP_CONFIG.game.show_labels:
+            font_name = config.APP_CONFIG.game.font_name
+            font_size = config.APP_CONFIG.game.label_font_size
+            grid_font = ASSETS.font(font_name, font_size)
 
             # draw row numbers
             for row in range(0, 8):
@@ -223,36 +236,15 @@ class Board:
         """
         Populate the move squares for each piece
         """
-        show_moves = config.APP_CONFIG["board"]["show_possible_moves"]
+        show_moves = config.APP_CONFIG.board.show_possible_moves
         if not show_moves:
             return
 
-        # get the square of the piece
         if self.state.dragged_piece:
-            self.move_squares = self.state.engine_state.attacks(
-                self.state.dragged_piece.square
+            self.move_squares = chess.SquareSet(
+                self.model.legal_squares(self.state.dragged_piece.square)
             )
 
-        # manually add moves for pawns
-        if (
-            self.state.dragged_piece
-            and self.state.dragged_piece.piece_type == PieceType.Pawn
-        ):
-            # get the pawn moves
-            pawn_moves = self.state.engine_state.pseudo_legal_moves
-
-            # add the pawn moves to the possible move squares
-            for move in pawn_moves:
-                if move.from_square == self.state.dragged_piece.square:
-                    self.move_squares.add(move.to_square)
-
-        # clear squares which are not legal moves
-        if len(self.move_squares) > 0:
-            for square in self.move_squares:
-                move = chess.Move(self.state.dragged_piece.square, square)
-                if move not in self.state.engine_state.legal_moves:
-                    self.move_squares.remove(square)
-
     def clear_move_squares(self) -> None:
         """
         Clear the move squares
@@ -262,93 +254,64 @@ class Board:
     def move_piece(
         self, piece: Piece, new_pos: Tuple[int, int], animate: bool = False
     ) -> bool:
-        # check if target square is occupied
-        pieces = self.get_piece_at(new_pos)
-        target_sq_piece = None
-        original_pos = piece.grid_pos
-        start_square = piece.square
-        end_square = piece.square
-
-        # if piece gets detected at the target square
-        if len(pieces) > 1:
-            if pieces[0] == piece:
-                target_sq_piece = pieces[1]
-            else:
-                target_sq_piece = pieces[0]
-        else:
-            target_sq_piece = pieces[0] if len(pieces) == 1 else None
-
-        if (
-            target_sq_piece
-            and target_sq_piece != piece
-            and target_sq_piece.piece_colour == piece.piece_colour
-        ):
-            # update position
-            piece.piece_rect.topleft = square_to_position(piece.square)
-
-            return False
-
-        # handle collision, remove the piece
-        self.check_collision_remove(piece, new_pos, target_sq_piece)
-
-        # move piece and update piece position
-        if piece.move_to(self.get_grid_at(new_pos), self.state, animate):
-            self.state.changed_pieces.append(piece)
-
-            # update engine state, only if the move is valid
-            self.state.engine_state = add_move_to_engine_state(
-                self.state.engine_state,
-                original_pos,
-                self.get_grid_at(new_pos),
-                piece.piece_type,
+        """
+        Move a piece to the square at a screen position, the piece goes back
+        to its square if the move is not legal
+        """
+        new_grid_pos = self.get_grid_at(new_pos)
+        move = None
+        if new_grid_pos.row >= 0 and new_grid_pos.col >= 0:
+            move = self.model.find_move(
+                piece.square, grid_position_to_square(new_grid_pos)
             )
 
-            # update end square
-            end_square = piece.square
-
-            # update last move arrow
-            self.last_move_arrow = (start_square, end_square)
-
-            if len(self.state.engine_state.move_stack) > 0:
-                LOGGER.info(
-                    f"Moved {piece.piece_colour.value} {piece.piece_type.value} {self.state.engine_state.move_stack[-1]}"
-                )
-            LOGGER.debug(f"\nBoard:\n{self.state.engine_state}")
-
-            return True
-        else:
-            # reset position
-            piece.piece_rect.topleft = square_to_position(piece.square)
+        if move is None:
+            if new_grid_pos != piece.grid_pos:
+                LOGGER.info("Invalid move %s -> %s", piece.grid_pos, new_grid_pos)
+            piece.reset_position()
+            return False
 
-        return False
+        return self.play_move(move, animate)
 
-    def check_collision_remove(self, piece, new_pos, target_sq_piece):
+    def play_move(self, move: chess.Move, animate: bool = False) -> bool:
         """
-        Handle collision between pieces
+        Play a move on the model and show it
         """
-        if (
-            target_sq_piece
-            and target_sq_piece.piece_colour != piece.piece_colour
-            and is_move_valid(
+        piece = self.model.piece_at(move.from_square)
+        if piece is None or not self.state.engine_state.is_legal(move):
+            return False
+
+        # show piece animation
+        if animate:
+            piece.animate_piece(  # type: ignore
                 piece.grid_pos,
-                self.get_grid_at(new_pos),
-                self.state.engine_state,
+                GridPosition(
+                    chess.square_rank(move.to_square), chess.square_file(move.to_square)
+                ),
+                self.window_surface,
+                piece.piece_image,  # type: ignore
             )
-        ):
-            self.remove_piece(target_sq_piece)
-            self.state.killed_pieces.append(target_sq_piece)
 
+        result = self.model.push(move)
+
+        if result.captured:
             # play explosion animation
             display_sprite_animation(
                 self.window_surface,
-                "assets/images/explosion.png",
+                ASSETS.image("explosion.png"),
                 12,
-                target_sq_piece.piece_rect,
+                result.captured.piece_rect,  # type: ignore
             )
 
             # play explosion sound
             play_sound("explode.mp3", self.sound_vol)
 
+        # update last move arrow
+        self.last_move_arrow = (move.from_square, move.to_square)
+        LOGGER.debug("\nBoard:\n%s", self.state.engine_state)
+
+        return True
+
     def redraw_pieces(self):
         for piece in self.state.pieces:
             piece.render()
@@ -365,6 +328,8 @@ class Board:
         self.state.changed_pieces.clear()
 
     def render(self) -> None:
+        start = time.perf_counter()
+
         # draw the board
         self.window_surface.blit(self.board_image, self.board_rect)
 
@@ -394,6 +359,10 @@ class Board:
         if len(self.highlighted_squares) > 0:
             self.highlight_squares()
 
+        # frame time, without the pause made to show the status text
+        if metrics.METRICS:
+            metrics.METRICS.observe("frame_seconds", time.perf_counter() - start)
+
         # draw status text
         if self.status_text:
             self.draw_status_text()
@@ -455,12 +424,12 @@ class Board:
         Draw the labels on the board
         """
         # show text to indicate cpu is thinking
-        font_name = config.APP_CONFIG["game"]["font_name"]
-        font = pygame.font.Font(f"assets/fonts/{font_name}", 16)
+        font_name = config.APP_CONFIG.game.font_name
+        font = ASSETS.font(font_name, 16)
         text = font.render(self.status_text, True, (0, 0, 0))
         text_rect = text.get_rect()
         text_rect.center = (
-            config.APP_CONFIG["board"]["size"] / 2,
+            config.APP_CONFIG.board.size / 2,
             15,
         )
         self.window_surface.blit(text, text_rect)
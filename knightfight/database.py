@@ -0,0 +1,224 @@
+"""
+Local sqlite database of played games.
+
+Games are stored with their PGN, result, players and the engine settings they
+were played with. Every position of every game is also stored in a positions
+table indexed by its Zobrist hash, so "which games reached this position" and
+the statistics of the moves played from it are an index lookup instead of a
+replay of every PGN.
+
+Writes are committed per call, or once for a whole batch inside
+`with db.batch():`, which is what lets self-play runs log thousands of games a
+minute.
+"""
+
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+import chess
+import chess.polyglot
+
+DATABASE_PATH = "assets/games/games.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    updated REAL NOT NULL,
+    white TEXT NOT NULL,
+    black TEXT NOT NULL,
+    settings TEXT NOT NULL,
+    result TEXT NOT NULL,
+    plies INTEGER NOT NULL,
+    pgn TEXT NOT NULL,
+    source TEXT
+);
+CREATE TABLE IF NOT EXISTS positions (
+    hash INTEGER NOT NULL,
+    game_id INTEGER NOT NULL REFERENCES games (id) ON DELETE CASCADE,
+    ply INTEGER NOT NULL,
+    move TEXT
+);
+CREATE INDEX IF NOT EXISTS positions_hash ON positions (hash);
+CREATE INDEX IF NOT EXISTS positions_game ON positions (game_id);
+CREATE INDEX IF NOT EXISTS games_source ON games (source);
+"""
+
+
+def position_key(board: chess.Board) -> int:
+    """
+    Zobrist hash of the position as a signed 64 bit sqlite integer
+    """
+    key = chess.polyglot.zobrist_hash(board)
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+
+class GameStats:
+    """
+    Results of the games in which a move was played from a position
+    """
+
+    def __init__(self) -> None:
+        self.games = 0
+        self.white_wins = 0
+        self.draws = 0
+        self.black_wins = 0
+
+    def add(self, result: str, count: int) -> None:
+        self.games += count
+        if result == "1-0":
+            self.white_wins += count
+        elif result == "0-1":
+            self.black_wins += count
+        elif result == "1/2-1/2":
+            self.draws += count
+
+    def __repr__(self) -> str:
+        return (
+            f"games {self.games} white {self.white_wins} draws {self.draws} "
+            f"black {self.black_wins}"
+        )
+
+
+class GameDatabase:
+    def __init__(self, path: str = DATABASE_PATH) -> None:
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+        self.in_batch = False
+
+    @contextmanager
+    def batch(self) -> Iterator["GameDatabase"]:
+        """
+        Commit everything written inside the with block in one transaction
+        """
+        self.in_batch = True
+        try:
+            yield self
+            self.db.commit()
+        except BaseException:
+            self.db.rollback()
+            raise
+        finally:
+            self.in_batch = False
+
+    def commit(self) -> None:
+        if not self.in_batch:
+            self.db.commit()
+
+    def add_game(
+        self,
+        board: chess.Board,
+        white: str = "human",
+        black: str = "cpu",
+        settings: Optional[dict] = None,
+        result: Optional[str] = None,
+        source: Optional[str] = None,
+    ) -> int:
+        """
+        Store the game played on board, return its id. The result defaults to
+        the board's result, "*" while the game is in progress. source is where
+        the game came from, e.g. its journal, to find it again.
+        """
+        now = time.time()
+        cursor = self.db.execute(
+            "INSERT INTO games (started, updated, white, black, settings, result, "
+            "plies, pgn, source) VALUES (?, ?, ?, ?, ?, '*', 0, '', ?)",
+            (now, now, white, black, json.dumps(settings or {}), source),
+        )
+        game_id = cursor.lastrowid
+        assert game_id is not None
+        self.write_game(game_id, board, result, now)
+        return game_id
+
+    def update_game(
+        self, game_id: int, board: chess.Board, result: Optional[str] = None
+    ) -> None:
+        """
+        Replace the moves of an in-progress game
+        """
+        self.db.execute("DELETE FROM positions WHERE game_id = ?", (game_id,))
+        self.write_game(game_id, board, result, time.time())
+
+    def write_game(
+        self, game_id: int, board: chess.Board, result: Optional[str], now: float
+    ) -> None:
+        result = result or board.result(claim_draw=True)
+        row = self.db.execute(
+            "SELECT white, black FROM games WHERE id = ?", (game_id,)
+        ).fetchone()
+
+        # chess.pgn pulls in chess.engine, only needed once a game is stored
+        import chess.pgn
+
+        pgn = chess.pgn.Game.from_board(board)
+        pgn.headers["Event"] = "KnightFight"
+        pgn.headers["Date"] = time.strftime("%Y.%m.%d", time.localtime(now))
+        pgn.headers["White"], pgn.headers["Black"] = row
+        pgn.headers["Result"] = result
+
+        # every position before each move, and the final one with no move
+        replay = board.root()
+        positions: List[Tuple[int, int, int, Optional[str]]] = []
+        for ply, move in enumerate(board.move_stack):
+            positions.append((position_key(replay), game_id, ply, move.uci()))
+            replay.push(move)
+        positions.append((position_key(replay), game_id, len(board.move_stack), None))
+
+        self.db.executemany(
+            "INSERT INTO positions (hash, game_id, ply, move) VALUES (?, ?, ?, ?)",
+            positions,
+        )
+        self.db.execute(
+            "UPDATE games SET updated = ?, result = ?, plies = ?, pgn = ? "
+            "WHERE id = ?",
+            (now, result, len(board.move_stack), str(pgn), game_id),
+        )
+        self.commit()
+
+    def game_by_source(self, source: str) -> Optional[int]:
+        row = self.db.execute(
+            "SELECT id FROM games WHERE source = ? ORDER BY id DESC LIMIT 1",
+            (source,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def games_with_position(self, board: chess.Board) -> List[int]:
+        """
+        Ids of the games that reached the position
+        """
+        rows = self.db.execute(
+            "SELECT DISTINCT game_id FROM positions WHERE hash = ? ORDER BY game_id",
+            (position_key(board),),
+        )
+        return [row[0] for row in rows]
+
+    def move_stats(self, board: chess.Board) -> Dict[str, GameStats]:
+        """
+        Moves played from the position and the results of those games, most
+        played first
+        """
+        rows = self.db.execute(
+            "SELECT p.move, g.result, COUNT(*) FROM positions p "
+            "JOIN games g ON g.id = p.game_id "
+            "WHERE p.hash = ? AND p.move IS NOT NULL GROUP BY p.move, g.result",
+            (position_key(board),),
+        )
+        stats: Dict[str, GameStats] = {}
+        for move, result, count in rows:
+            stats.setdefault(move, GameStats()).add(result, count)
+        return dict(sorted(stats.items(), key=lambda item: -item[1].games))
+
+    def get_pgn(self, game_id: int) -> Optional[str]:
+        row = self.db.execute(
+            "SELECT pgn FROM games WHERE id = ?", (game_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def close(self) -> None:
+        self.db.close()
@@ -0,0 +1,136 @@
+"""
+Append-only journal of the moves of a game.
+
+Every move (and undo) is appended to a per-game file as it is played, one json
+object per line with a timestamp. Lines are flushed at once but only fsynced
+every few moves or seconds, so a crash loses at most the last unsynced moves
+and never corrupts the earlier ones. Loading a game replays the journal, so
+the full move stack, and with it undo, is restored.
+
+    {"t": 1697740000.1, "fen": "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"}
+    {"t": 1697740003.6, "move": "e2e4"}
+    {"t": 1697740004.2, "undo": true}
+"""
+
+import datetime
+import glob
+import json
+import os
+import time
+from typing import IO, Optional
+import chess
+from helpers.log import LOGGER
+
+# fsync after this many moves or seconds, whichever comes first
+SYNC_MOVES = 8
+SYNC_INTERVAL = 2.0
+
+
+class GameJournal:
+    def __init__(
+        self,
+        path: str,
+        start_fen: str = chess.STARTING_FEN,
+        sync_moves: int = SYNC_MOVES,
+        sync_interval: float = SYNC_INTERVAL,
+    ) -> None:
+        """
+        Journal for a new game. The file is only created by the first move, so
+        games without moves leave nothing behind.
+        """
+        self.path = path
+        self.start_fen = start_fen
+        self.sync_moves = sync_moves
+        self.sync_interval = sync_interval
+        self.file: Optional[IO[str]] = None
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    @classmethod
+    def new(cls, directory: str, start_fen: str = chess.STARTING_FEN) -> "GameJournal":
+        name = datetime.datetime.now().strftime("game-%Y%m%d-%H%M%S-%f.jsonl")
+        return cls(os.path.join(directory, name), start_fen)
+
+    @classmethod
+    def latest(cls, directory: str) -> Optional["GameJournal"]:
+        """
+        Journal of the most recently played game in directory, None if none
+        """
+        paths = glob.glob(os.path.join(directory, "game-*.jsonl"))
+        if not paths:
+            return None
+        return cls(max(paths, key=os.path.getmtime))
+
+    def replay(self) -> chess.Board:
+        """
+        Rebuild the game, with its move stack, from the journal. A torn last
+        line from a crash ends the replay.
+        """
+        board = chess.Board(self.start_fen)
+        if not os.path.exists(self.path):
+            return board
+
+        with open(self.path, "r") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    LOGGER.warning("Journal %s ends with a partial line", self.path)
+                    break
+
+                if "fen" in entry:
+                    self.start_fen = entry["fen"]
+                    board = chess.Board(self.start_fen)
+                elif "move" in entry:
+                    move = chess.Move.from_uci(entry["move"])
+                    if not board.is_legal(move):
+                        LOGGER.error("Journal %s has illegal move %s", self.path, move)
+                        break
+                    board.push(move)
+                elif entry.get("undo") and board.move_stack:
+                    board.pop()
+
+        LOGGER.info("Replayed %d moves from %s", len(board.move_stack), self.path)
+        return board
+
+    def record_move(self, move: chess.Move) -> None:
+        self.write({"move": move.uci()})
+
+    def record_undo(self) -> None:
+        self.write({"undo": True})
+
+    def write(self, entry: dict) -> None:
+        if self.file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            exists = os.path.exists(self.path)
+            self.file = open(self.path, "a")
+            if not exists:
+                self.file.write(
+                    json.dumps({"t": round(time.time(), 3), "fen": self.start_fen})
+                )
+                self.file.write("\n")
+
+        self.file.write(json.dumps({"t": round(time.time(), 3), **entry}) + "\n")
+        self.file.flush()
+        self.pending += 1
+
+        if (
+            self.pending >= self.sync_moves
+            or time.monotonic() - self.last_sync >= self.sync_interval
+        ):
+            self.sync()
+
+    def sync(self) -> None:
+        """
+        Make the moves written so far durable
+        """
+        if self.file and self.pending:
+            os.fsync(self.file.fileno())
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def close(self) -> None:
+        if self.file:
+            self.sync()
+            self.file.close()
+            self.file = None
@@ -0,0 +1,208 @@
+"""
+The game model, pieces and the rules for moving them, without pygame.
+
+The model keeps the pieces on the board in step with the engine state: moves,
+captures (en passant included), castling, promotion and undo. The pygame board
+is a view over the model, it creates its pieces through piece_factory so they
+carry sprites, and draws whatever the model reports.
+
+Nothing here imports pygame, so the model can be used headless, in tests and
+in worker processes without SDL.
+"""
+
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+import chess
+from helpers.log import LOGGER
+from knightfight.journal import GameJournal
+from knightfight.state import BoardState
+from knightfight.types import GridPosition, PieceColour, PieceType
+
+
+class PieceModel:
+    def __init__(
+        self,
+        piece_type: PieceType,
+        piece_colour: PieceColour,
+        grid_pos: GridPosition,
+        square: int,  # chess engine square
+    ) -> None:
+        self.piece_type = piece_type
+        self.piece_colour = piece_colour
+        self.grid_pos = grid_pos
+        self.square = square
+
+    def __eq__(self, other):
+        """
+        Check if two pieces are equal
+        """
+        return (
+            self.piece_type == other.piece_type
+            and self.piece_colour == other.piece_colour
+            and self.grid_pos == other.grid_pos
+        )
+
+    def place(self, square: int) -> None:
+        """
+        Put the piece on a square
+        """
+        self.square = square
+        self.grid_pos = GridPosition(
+            chess.square_rank(square), chess.square_file(square)
+        )
+
+
+# creates the piece for (type, colour, grid position, square)
+PieceFactory = Callable[[PieceType, PieceColour, GridPosition, int], PieceModel]
+
+
+@dataclass
+class MoveResult:
+    move: chess.Move
+    piece: PieceModel
+    captured: Optional[PieceModel] = None
+    castling_rook: Optional[PieceModel] = None
+    promoted: bool = False
+
+
+class GameModel:
+    def __init__(self, fen: str = "", piece_factory: PieceFactory = PieceModel):
+        self.piece_factory = piece_factory
+        self.state = BoardState()
+        # moves are appended to the journal as they are played, if set
+        self.journal: Optional[GameJournal] = None
+        self.reset(fen)
+
+    @property
+    def board(self) -> chess.Board:
+        return self.state.engine_state
+
+    def reset(self, fen: str = "") -> None:
+        """
+        Start again from fen, the starting position if empty
+        """
+        self.load(chess.Board(fen) if fen else chess.Board())
+
+    def load(self, board: chess.Board) -> None:
+        """
+        Continue the game on board, its move stack is kept for undo
+        """
+        self.state = BoardState()
+        self.state.engine_state = board
+        self.place_pieces()
+
+    def place_pieces(self) -> None:
+        """
+        Create the pieces for the engine state
+        """
+        self.state.pieces = [
+            self.make_piece(piece, square)
+            for square, piece in self.board.piece_map().items()
+        ]
+
+    def make_piece(self, piece: chess.Piece, square: int) -> PieceModel:
+        return self.piece_factory(
+            PieceType(chess.piece_name(piece.piece_type).capitalize()),
+            PieceColour("W" if piece.color == chess.WHITE else "B"),
+            GridPosition(chess.square_rank(square), chess.square_file(square)),
+            square,
+        )
+
+    def piece_at(self, square: int) -> Optional[PieceModel]:
+        for piece in self.state.pieces:
+            if piece.square == square:
+                return piece
+        return None
+
+    def find_move(self, from_square: int, to_square: int) -> Optional[chess.Move]:
+        """
+        The legal move between two squares, None if there is none. Pawns
+        reaching the last rank are promoted to queens.
+        """
+        if from_square == to_square:
+            return None
+
+        move = chess.Move(from_square, to_square)
+        if self.board.piece_type_at(from_square) == chess.PAWN and chess.square_rank(
+            to_square
+        ) in (0, 7):
+            move.promotion = chess.QUEEN
+
+        return move if self.board.is_legal(move) else None
+
+    def push(self, move: chess.Move) -> MoveResult:
+        """
+        Play a legal move, updating the pieces and the engine state
+        """
+        board = self.board
+        piece = self.piece_at(move.from_square)
+        if piece is None:
+            raise ValueError(f"No piece at {chess.square_name(move.from_square)}")
+
+        # the captured pawn is behind the target square for en passant
+        captured_square = move.to_square
+        if board.is_en_passant(move):
+            captured_square += -8 if board.turn == chess.WHITE else 8
+        captured = self.piece_at(captured_square)
+
+        castling_rook = None
+        rook_square = move.to_square
+        if board.is_castling(move):
+            rank = chess.square_rank(move.from_square)
+            kingside = board.is_kingside_castling(move)
+            castling_rook = self.piece_at(chess.square(7 if kingside else 0, rank))
+            rook_square = chess.square(5 if kingside else 3, rank)
+
+        board.push(move)
+        if self.journal:
+            self.journal.record_move(move)
+
+        if captured:
+            self.state.pieces.remove(captured)
+            self.state.killed_pieces.append(captured)
+
+        piece.place(move.to_square)
+        if move.promotion:
+            # the pawn is replaced by a new piece
+            self.state.pieces.remove(piece)
+            piece = self.make_piece(
+                chess.Piece(move.promotion, not board.turn), move.to_square
+            )
+            self.state.pieces.append(piece)
+
+        if castling_rook:
+            castling_rook.place(rook_square)
+            self.state.changed_pieces.append(castling_rook)
+
+        self.state.changed_pieces.append(piece)
+
+        LOGGER.info(
+            "Moved %s %s %s", piece.piece_colour.value, piece.piece_type.value, move
+        )
+        return MoveResult(
+            move, piece, captured, castling_rook, promoted=bool(move.promotion)
+        )
+
+    def undo(self) -> Optional[chess.Move]:
+        """
+        Take back the last move, None if there is none
+        """
+        if not self.board.move_stack:
+            return None
+
+        move = self.board.pop()
+        if self.journal:
+            self.journal.record_undo()
+        self.state.killed_pieces.clear()
+        self.place_pieces()
+        return move
+
+    def legal_squares(self, square: int) -> List[int]:
+        """
+        Squares the piece on square can move to
+        """
+        return [
+            move.to_square
+            for move in self.board.legal_moves
+            if move.from_square == square
+        ]
@@ -1,27 +1,24 @@
 """
-The piece class to capture the state of the chess pieces.
+The piece class to draw the chess pieces. The rules for moving them are in
+knightfight.model.
 """
 
 import pygame
-import chess
-from dataclasses import dataclass
 from helpers.conversions import (
     grid_position_to_square,
     square_to_position,
-    grid_pos_to_move,
 )
-from helpers.log import LOGGER
 from typing import Tuple, Any
 from config import config
-from ai.validation import is_move_valid
-from knightfight.state import BoardState, PieceColour, PieceType
-from knightfight.types import GridPosition
+from knightfight.assets import ASSETS
+from knightfight.model import PieceModel
+from knightfight.types import GridPosition, PieceColour, PieceType
 
 
 def get_piece_from_strip(
     image_file: str, piece_type: PieceType
 ) -> Tuple[pygame.Surface, Any]:
-    strip_image = pygame.image.load(f"assets/images/{image_file}")
+    strip_image = ASSETS.image(image_file)
     piece_width = int(strip_image.get_width() / 6)
     piece_height = int(strip_image.get_height())
 
@@ -47,8 +44,11 @@ def get_piece_from_strip(
     return piece_image, piece_mask
 
 
-@dataclass
-class Piece:
+class Piece(PieceModel):
+    """
+    A piece with its sprite, the pygame view of a PieceModel
+    """
+
     def __init__(
         self,
         window_surface,
@@ -59,23 +59,20 @@ class Piece:
         grid_pos: GridPosition,
         square: int,  # chess engine square
     ) -> None:
-        size_x = config.APP_CONFIG["piece"]["size_x"]
-        size_y = config.APP_CONFIG["piece"]["size_y"]
+        super().__init__(piece_type, piece_colour, grid_pos, square)
+        size_x = config.APP_CONFIG.piece.size_x
+        size_y = config.APP_CONFIG.piece.size_y
         self.window_surface = window_surface
-        self.piece_type = piece_type
-        self.piece_colour = piece_colour
         self.piece_pos_x = piece_pos_x
         self.piece_pos_y = piece_pos_y
-        self.grid_pos = grid_pos
-        self.square = square
 
         if piece_colour == PieceColour.White:
             self.piece_image, _ = get_piece_from_strip(
-                config.APP_CONFIG["board"]["white_pieces"], piece_type
+                config.APP_CONFIG.board.white_pieces, piece_type
             )
         else:
             self.piece_image, _ = get_piece_from_strip(
-                config.APP_CONFIG["board"]["black_pieces"], piece_type
+                config.APP_CONFIG.board.black_pieces, piece_type
             )
 
         self.piece_image = pygame.transform.scale(self.piece_image, (size_x, size_y))
@@ -84,62 +81,18 @@ class Piece:
         self.piece_rect.left = piece_pos_x
         self.piece_rect.top = piece_pos_y
 
-    def __eq__(self, other):
+    def place(self, square: int) -> None:
         """
-        Check if two pieces are equal
+        Put the piece on a square and move the sprite there
         """
-        return (
-            self.piece_type == other.piece_type
-            and self.piece_colour == other.piece_colour
-            and self.grid_pos == other.grid_pos
-        )
-
-    def move_to(
-        self, new_grid_pos: GridPosition, board_state: BoardState, animate: bool = False
-    ) -> bool:
-        if new_grid_pos is None or new_grid_pos.row is None or new_grid_pos.col is None:
-            return False
-
-        if new_grid_pos.row == -1 or new_grid_pos.col == -1:
-            return False
-
-        # check if move is valid
-        if not is_move_valid(
-            self.grid_pos,
-            new_grid_pos,
-            board_state.engine_state,
-        ):
-            # update position
-            self.piece_rect.topleft = square_to_position(self.square)
-
-            return False
-        else:
-            # check if castling
-            # if castling, move rook
-            # king will be moved by code below castling check
-            if board_state.engine_state.is_castling(
-                grid_pos_to_move(self.grid_pos, new_grid_pos)
-            ):
-                self.handle_castling(new_grid_pos, board_state)
-
-            # show piece animation
-            if animate:
-                self.animate_piece(
-                    self.grid_pos, new_grid_pos, self.window_surface, self.piece_image
-                )
-
-            # update grid position
-            self.grid_pos = new_grid_pos
-
-            # update chess engine square
-            self.square = grid_position_to_square(self.grid_pos)
+        super().place(square)
+        self.piece_rect.topleft = square_to_position(square)
 
-            # update position
-            self.piece_rect.topleft = square_to_position(self.square)
-
-            return True
-
-    import pygame
+    def reset_position(self) -> None:
+        """
+        Move the sprite back to the piece's square, e.g. after an invalid drop
+        """
+        self.piece_rect.topleft = square_to_position(self.square)
 
     def animate_piece(
         self,
@@ -173,84 +126,5 @@ class Piece:
             # update display
             pygame.display.update()
 
-    def handle_castling(self, new_grid_pos: GridPosition, board_state: BoardState):
-        """
-        Handle castling
-        """
-        rook_piece = self.is_castling(self.grid_pos, new_grid_pos, board_state)
-
-        if rook_piece:
-            rook_pos_new = self.get_rook_new_pos_after_castling(
-                rook_piece, self.grid_pos, new_grid_pos, board_state
-            )
-
-            # update rook position
-            rook_piece.grid_pos = rook_pos_new
-            rook_piece.square = grid_position_to_square(rook_pos_new)
-            rook_piece.piece_rect.topleft = square_to_position(rook_piece.square)
-
     def render(self) -> None:
         self.window_surface.blit(self.piece_image, self.piece_rect)
-
-    def is_castling(
-        self, oldpos: GridPosition, newpos: GridPosition, board_state: BoardState
-    ) -> Any:
-        """
-        Check if castling is happening
-        """
-        # only kings can castle
-        if self.piece_type != PieceType.King:
-            return None
-
-        if board_state.engine_state.is_kingside_castling(
-            grid_pos_to_move(oldpos, newpos)
-        ):
-            if self.piece_colour == PieceColour.White:
-                return self.get_piece_from_square(board_state, chess.H1)
-            else:
-                return self.get_piece_from_square(board_state, chess.H8)
-
-        if board_state.engine_state.is_queenside_castling(
-            grid_pos_to_move(oldpos, newpos)
-        ):
-            if self.piece_colour == PieceColour.White:
-                return self.get_piece_from_square(board_state, chess.A1)
-            else:
-                return self.get_piece_from_square(board_state, chess.A8)
-
-        return None
-
-    def get_piece_from_square(self, board_state: BoardState, square: int) -> Any:
-        """
-        Get piece from square
-        """
-        for piece in board_state.pieces:
-            if piece.square == square:
-                return piece
-
-        return None
-
-    def get_rook_new_pos_after_castling(
-        self,
-        rook_piece: "Piece",
-        oldpos: GridPosition,
-        newpos: GridPosition,
-        board_state: BoardState,
-    ) -> GridPosition:
-        """
-        Get the new position of the rook after castling
-        """
-        if rook_piece is None:
-            return GridPosition(-1, -1)
-
-        if board_state.engine_state.is_kingside_castling(
-            grid_pos_to_move(oldpos, newpos)
-        ):
-            return GridPosition(oldpos.row, oldpos.col + 1)
-
-        if board_state.engine_state.is_queenside_castling(
-            grid_pos_to_move(oldpos, newpos)
-        ):
-            return GridPosition(oldpos.row, oldpos.col - 1)
-
-        return GridPosition(-1, -1)
@@ -73,6 +73,17 @@ class Engine(abc.ABC):
     def quit(self) -> None:
         raise NotImplementedError
 
+    def new_game(self) -> None:
+        """
+        Forget the previous game, called before the engine is reused
+        """
+
+    def ping(self) -> bool:
+        """
+        Return False if the engine no longer responds
+        """
+        return True
+
 
 class TitleChoice(Enum):
     New = "Start a new game."
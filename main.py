@@ -2,24 +2,40 @@
 Knight Fight is a Chess game written using pygame.
 """
 
+import argparse
 import os
 import sys
 import traceback
+from typing import TYPE_CHECKING, Optional
+from helpers import startup
+
+# before the other imports, so they are timed too
+if "--profile-startup" in sys.argv:
+    startup.enable()
+
 import pygame
 import chess
 
-from helpers.conversions import grid_pos_to_move, grid_position_to_label
-from ai.lookup import CHESS_SQUARE_TO_POS
+from helpers.conversions import grid_position_to_label
 
+from knightfight.assets import ASSETS
 from knightfight.board import Board
 from knightfight.state import BoardState
 from config import config
 from knightfight.types import GridPosition, PieceColour, PieceType, TitleChoice
-from helpers.log import LOGGER
+from helpers import metrics, profiling
+from helpers.log import LOGGER, setup_logging
 from sound.playback import play_game_music, play_sound, play_tense_music
 from ai.player import AIPlayer
+from ai.cache import MoveCache
+from ai.engines.piece_squares2 import SearchOptions
+from ai.engines import tablebase
 from screens.mainmenu import main_menu
 
+# backends and the game database are imported when they are used
+if TYPE_CHECKING:
+    from knightfight.database import GameDatabase
+
 
 BOARD_BK_COLOUR = (255, 255, 255)
 BOARD_BK_COLOUR_BLACK = (0, 0, 0)
@@ -36,12 +52,22 @@ if os.name == "nt":
 
 
 class KnightFight:
-    def __init__(self):
+    def __init__(self, profile: bool = False):
+        self.profile = profile
         self.dragged_piece = None
         self.drag_offset = None
         self._tense_mode = False
         self.board = None
         self.screen = None
+        self.ai_players = {}
+        self.move_cache = None
+        self.openai_cache = None
+        self.openai_client = None
+        self.engine_pool = None
+        self.game_db: Optional["GameDatabase"] = None
+        self.game_id: Optional[int] = None
+        self.players = ("human", "cpu")
+        self.game_settings: dict = {}
 
     @property
     def tense_mode(self) -> bool:
@@ -70,16 +96,45 @@ class KnightFight:
         return openai_api_key
 
     def run(self):
-        # initialize pygame and load config
+        # load config, a broken config stops here rather than mid game
+        try:
+            config.read_config()
+        except config.ConfigError as e:
+            sys.exit(f"Invalid config: {e}")
+
+        # file logging is done off the game thread when log_queue is set
+        setup_logging(
+            config.APP_CONFIG.game.log_level,
+            config.APP_CONFIG.game.log_file,
+            config.APP_CONFIG.game.log_queue,
+        )
+
+        # counters and timings for unattended matches, off unless a path is set
+        if config.APP_CONFIG.game.metrics_path:
+            metrics.enable(
+                config.APP_CONFIG.game.metrics_path,
+                config.APP_CONFIG.game.metrics_format,
+                config.APP_CONFIG.game.metrics_interval,
+            )
+
+        # per phase loop timings and profiles of slow cpu moves
+        if self.profile or config.APP_CONFIG.game.profile:
+            profiling.enable(
+                config.APP_CONFIG.game.profile_dir,
+                config.APP_CONFIG.game.profile_threshold,
+                config.APP_CONFIG.game.profile_interval,
+            )
+        startup.mark("imports and config")
+
+        # initialize pygame
         pygame.init()
-        config.read_config()
 
         # set up sound volume
-        music_vol = config.APP_CONFIG["game"]["music_vol"]
-        sound_vol = config.APP_CONFIG["game"]["sound_vol"]
+        music_vol = config.APP_CONFIG.game.music_vol
+        sound_vol = config.APP_CONFIG.game.sound_vol
 
         # set up the window
-        board_size = config.APP_CONFIG["board"]["size"]
+        board_size = config.APP_CONFIG.board.size
         self.screen = pygame.display.set_mode((board_size, board_size))
         self.screen.fill(BOARD_BK_COLOUR)
 
@@ -87,48 +142,133 @@ class KnightFight:
         pygame.display.set_caption("KNIGHT FIGHT")
         pygame.mouse.set_visible(True)
 
+        # decode images and sounds while the title screen is shown
+        ASSETS.start(music=[config.APP_CONFIG.game.soundtrack])
+        startup.mark("pygame and window")
+
         # show splash screen
         # self.show_splash_screen(screen)
 
         # players
-        p1_type = config.APP_CONFIG["game"]["player1"].lower().strip()
-        p2_type = config.APP_CONFIG["game"]["player2"].lower().strip()
+        p1_type = config.APP_CONFIG.game.player1
+        p2_type = config.APP_CONFIG.game.player2
 
         # setup ai player and engines
         # max ai players = 2 cpu vs cpu
-        ai = config.APP_CONFIG["cpu"]["ai"]  # use basic / piece_squares ai
-        complexity = config.APP_CONFIG["cpu"]["complexity"]  # ai complexity
+        ai = config.APP_CONFIG.cpu.ai  # use basic / piece_squares ai
+        complexity = config.APP_CONFIG.cpu.complexity  # ai complexity
         engine_path = ""
         openai_api_key = ""
 
         if ai == "stockfish":
-            engine_path = config.APP_CONFIG["cpu"]["stockfish_path"]
+            from ai.engines import stockfish
+            from ai.engines.pool import EnginePool
+
+            engine_path = config.APP_CONFIG.cpu.stockfish_path
+            # engines are started once and shared by both players
+            self.engine_pool = EnginePool(
+                lambda: stockfish.StockFishEngine(engine_path),
+                config.APP_CONFIG.cpu.stockfish_pool_size,
+            )
 
         if ai == "openai":
+            from ai.openai.api import OpenAIAPIWrapper
+            from ai.openai.cache import ResponseCache
+
             openai_api_key = (
-                config.APP_CONFIG["cpu"]["openai_api_key"]
+                config.APP_CONFIG.cpu.openai_api_key
                 or self.get_openai_api_key_from_env()
             )
+            # replies are kept per position, across games if a path is set
+            self.openai_cache = ResponseCache(
+                config.APP_CONFIG.cpu.openai_cache_path,
+                config.APP_CONFIG.cpu.openai_cache_size,
+                config.APP_CONFIG.cpu.openai_cache_days * 24 * 3600,
+            )
+            # shared by both players, requests are bounded by the move budget
+            self.openai_client = OpenAIAPIWrapper(
+                openai_api_key,
+                config.APP_CONFIG.cpu.openai_api_base,
+                connect_timeout=config.APP_CONFIG.cpu.openai_connect_timeout,
+                read_timeout=config.APP_CONFIG.cpu.openai_timeout,
+                max_retries=config.APP_CONFIG.cpu.openai_retries,
+                move_budget=config.APP_CONFIG.cpu.openai_budget,
+                candidates=config.APP_CONFIG.cpu.openai_candidates,
+                model=config.APP_CONFIG.cpu.openai_model,
+                temperature=config.APP_CONFIG.cpu.openai_temperature,
+                cache=self.openai_cache,
+            )
+
+        # search enhancements for piece_squares2
+        search_options = SearchOptions(
+            pvs=config.APP_CONFIG.cpu.pvs,
+            null_move=config.APP_CONFIG.cpu.null_move,
+            lmr=config.APP_CONFIG.cpu.lmr,
+        )
+
+        # moves already found for a position are reused, shared by both players
+        if config.APP_CONFIG.cpu.cache:
+            self.move_cache = MoveCache(
+                config.APP_CONFIG.cpu.cache_size,
+                config.APP_CONFIG.cpu.cache_path,
+            )
+
+        # think on the opponent's time, only against a human player
+        ponder = config.APP_CONFIG.cpu.ponder
 
         ai_white = AIPlayer(
-            chess.WHITE, sound_vol, ai, complexity, engine_path, openai_api_key
+            chess.WHITE,
+            sound_vol,
+            ai,
+            complexity,
+            engine_path,
+            openai_api_key,
+            search_options,
+            ponder and p2_type == "human",
+            self.move_cache,
+            self.openai_client,
+            self.engine_pool,
         )
         ai_black = AIPlayer(
-            chess.BLACK, sound_vol, ai, complexity, engine_path, openai_api_key
+            chess.BLACK,
+            sound_vol,
+            ai,
+            complexity,
+            engine_path,
+            openai_api_key,
+            search_options,
+            ponder and p1_type == "human",
+            self.move_cache,
+            self.openai_client,
+            self.engine_pool,
         )
         AI_PLAYERS = {
             PieceColour.White: ai_white,
             PieceColour.Black: ai_black,
         }
-        cpu_delay = config.APP_CONFIG["cpu"]["delay"]  # delay between moves
+        self.ai_players = AI_PLAYERS
+        cpu_delay = config.APP_CONFIG.cpu.delay  # delay between moves
+
+        # endgame tablebases, probing is disabled if no tables are found
+        tablebase.open_tablebase(config.APP_CONFIG.cpu.syzygy_path)
 
-        # setup board
-        self.board = Board(self.screen)
+        # played games are stored for later analysis, if a database is set
+        database_path = config.APP_CONFIG.game.database
+        if database_path:
+            from knightfight.database import GameDatabase
+
+            self.game_db = GameDatabase(database_path)
+        self.players = (
+            "human" if p1_type == "human" else f"cpu ({ai})",
+            "human" if p2_type == "human" else f"cpu ({ai})",
+        )
+        self.game_settings = {"complexity": complexity, **vars(search_options)}
+        startup.mark("players and database")
 
         # track turn
         turn = PieceColour.White
 
-        # show main menu
+        # show main menu, the board is set up by the choice made
         choice = main_menu(config.APP_CONFIG, save_game_func=self.save_game)
         self.handle_menu_choice(self.board, choice)
 
@@ -136,14 +276,13 @@ class KnightFight:
         play_game_music()
 
         # check if undo is available
-        undo_last_move_allowed = (
-            config.APP_CONFIG["game"]["undo_last_move_allowed"] or False
-        )
+        undo_last_move_allowed = config.APP_CONFIG.game.undo_last_move_allowed
 
         try:
             # main loop
             # check if game is over
             game_over_flag = False
+            profiling.reset_lap()
             while True:
                 for event in pygame.event.get():
                     if event.type == pygame.QUIT:
@@ -220,6 +359,7 @@ class KnightFight:
                                 save_game_func=self.save_game,
                             )
                             self.handle_menu_choice(self.board, choice)
+                            profiling.reset_lap()
                         elif event.type == pygame.KEYDOWN:
                             # undo move
                             if (
@@ -228,6 +368,7 @@ class KnightFight:
                             ):
                                 if undo_last_move_allowed:
                                     # undo last move user pressed ctrl+z
+                                    self.cancel_pondering()
                                     self.board.undo_last_move()
                                     # change turn
                                     turn = (
@@ -237,6 +378,7 @@ class KnightFight:
                                     )
                                 else:
                                     play_sound("invalid_move.mp3", sound_vol)
+                profiling.lap("events")
 
                 # check if game is over
                 if (
@@ -254,9 +396,11 @@ class KnightFight:
                         # final game over screen after 10 seconds
                         pygame.time.set_timer(pygame.USEREVENT, 10000)
                         game_over(self.screen, self.board.state, True)
+                        self.record_game()
 
                     # set game over flag
                     game_over_flag = True
+                profiling.lap("game over")
 
                 # if either player is cpu, make a move
                 if (
@@ -266,6 +410,7 @@ class KnightFight:
                 ):
                     self.board.set_status_text("CPU is thinking...", cpu_delay)
                     self.board.render()
+                    profiling.lap("cpu delay")
 
                     # get random move from list of legal moves
                     ai_moved = AI_PLAYERS[turn].move(self.board)
@@ -281,44 +426,112 @@ class KnightFight:
                             moved_pos,
                             ai_moved,
                         )
+                    profiling.lap("ai")
 
                 # update the display
                 if not game_over_flag:
                     self.board.render()
+                    profiling.lap("render")
                     pygame.display.update()
+                    profiling.lap("flip")
 
         except Exception as exc:
             # show stack trace
-            LOGGER.error(f"Error: {exc} Stack trace: {traceback.format_exc()}")
+            LOGGER.error("Error: %s Stack trace: %s", exc, traceback.format_exc())
+        finally:
+            # quitting closes it too, this covers leaving on an error
+            self.close_game_db()
 
     def save_game(self):
         """
-        Save the current game state to the config file
+        Save the current game. Moves are journaled as they are played, so
+        this only makes sure the last ones are on disk.
         """
-        # get last fen and save to config
-        if self.board:
+        if self.board and self.board.model.journal:
             LOGGER.info("Saving game state...")
-            fen = self.board.state.engine_state.fen()
-            config.APP_CONFIG["state"]["last_fen"] = str(fen)
-            config.save_config()
+            self.board.model.journal.sync()
+        self.record_game()
+
+    def record_game(self):
+        """
+        Store the current game in the game database, or update it
+        """
+        if not self.game_db or not self.board:
+            return
+        engine_state = self.board.state.engine_state
+        if not engine_state.move_stack:
+            return
+
+        journal = self.board.model.journal
+        source = journal.path if journal else None
+        if self.game_id is None and source:
+            self.game_id = self.game_db.game_by_source(source)
+
+        if self.game_id is None:
+            self.game_id = self.game_db.add_game(
+                engine_state,
+                *self.players,
+                self.game_settings,
+                source=source,
+            )
+        else:
+            self.game_db.update_game(self.game_id, engine_state)
+
+    def close_game_db(self):
+        if self.game_db:
+            self.game_db.close()
+            self.game_db = None
+
+    def cancel_pondering(self):
+        """
+        Stop any background search of the cpu players
+        """
+        for ai_player in self.ai_players.values():
+            ai_player.cancel_pondering()
 
     def handle_menu_choice(self, board, choice):
         """
         Handle the menu choice
         """
+        self.cancel_pondering()
         if choice == TitleChoice.Quit:
             LOGGER.info("Quitting game")
+            self.record_game()
+            self.close_game_db()
+            if self.move_cache:
+                LOGGER.info(
+                    "Move cache hit ratio %.0f%%", self.move_cache.hit_ratio * 100
+                )
+                self.move_cache.close()
+            if self.openai_client:
+                self.openai_client.close()
+            if self.openai_cache:
+                self.openai_cache.close()
+            if self.engine_pool:
+                self.engine_pool.close()
             if self.board:
-                pygame.quit()
-                sys.exit()
+                self.board.close_journal()
+            metrics.disable()
+            profiling.disable()
+            pygame.quit()
+            sys.exit()
         elif choice == TitleChoice.Load:
             # load last saved game
             LOGGER.info("Loading last saved game")
-            board.load_last_game()
+            self.record_game()
+            self.game_id = None
+            if not self.board and self.screen:
+                self.board = Board(self.screen)
+            if self.board:
+                self.board.load_last_game()
         else:
             # start new game
             LOGGER.info("Starting new game")
+            self.record_game()
+            self.game_id = None
             if self.screen:
+                if self.board:
+                    self.board.close_journal()
                 self.board = Board(self.screen)
 
     def handle_piece_moved(
@@ -332,7 +545,7 @@ class KnightFight:
         """
         Handle the piece moved event
         """
-        sound_vol = config.APP_CONFIG["game"]["sound_vol"]
+        sound_vol = config.APP_CONFIG.game.sound_vol
 
         if piece_moved and original_pos != moved_pos:
             frompos = grid_position_to_label(original_pos)
@@ -345,7 +558,7 @@ class KnightFight:
             board.clear_highlight_squares()
             board_copy = board.state.engine_state.copy()
             board_copy.pop()  # get rid of last move from copy so we can see if check on last move
-            move = grid_pos_to_move(original_pos, moved_pos)
+            move = board.state.engine_state.peek()
 
             # See if move gives check
             try:
@@ -355,12 +568,12 @@ class KnightFight:
                     )
             except AssertionError:
                 # move is not legal
-                LOGGER.info(f"Invalid move {frompos} -> {topos}!")
+                LOGGER.info("Invalid move %s -> %s!", frompos, topos)
 
             # See if move gives checkmate
             if board.state.engine_state.is_checkmate():
                 play_sound("check_mate.mp3", sound_vol)
-                LOGGER.info(f"Checkmate from move {frompos} -> {topos}! GAME OVER!")
+                LOGGER.info("Checkmate from move %s -> %s! GAME OVER!", frompos, topos)
                 board.state.game_over = True
 
             # change turn
@@ -400,7 +613,7 @@ class KnightFight:
         if king_square:
             board.add_highlight_square(king_square)
 
-        LOGGER.info(f"King is in check from move {frompos} -> {topos}")
+        LOGGER.info("King is in check from move %s -> %s", frompos, topos)
 
 
 def game_over(screen: pygame.surface.Surface, state: BoardState, initial: bool = False):
@@ -408,10 +621,10 @@ def game_over(screen: pygame.surface.Surface, state: BoardState, initial: bool =
     Display game over screen
     """
     # set up font
-    font_name = config.APP_CONFIG["game"]["font_name"]
-    font = pygame.font.Font(f"assets/fonts/{font_name}", 72)
-    board_size = config.APP_CONFIG["board"]["size"]
-    sound_vol = config.APP_CONFIG["game"]["sound_vol"]
+    font_name = config.APP_CONFIG.game.font_name
+    font = ASSETS.font(font_name, 72)
+    board_size = config.APP_CONFIG.board.size
+    sound_vol = config.APP_CONFIG.game.sound_vol
 
     winner_piece = None
     for piece in state.pieces:
@@ -430,7 +643,7 @@ def game_over(screen: pygame.surface.Surface, state: BoardState, initial: bool =
 
     # set up font
     win_text = "White" if state.winner == PieceColour.White else "Black"
-    font2 = pygame.font.Font(f"assets/fonts/{font_name}", 48)
+    font2 = ASSETS.font(font_name, 48)
     text2 = font2.render(f"{win_text} wins!", True, (255, 255, 255))
     text_rect2 = text2.get_rect()
     text_rect2.center = (
@@ -460,7 +673,20 @@ def game_over(screen: pygame.surface.Surface, state: BoardState, initial: bool =
 
 
 def start():
-    chess = KnightFight()
+    parser = argparse.ArgumentParser(description="Knight Fight chess game")
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="report import and load times when the title screen is shown",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="time each phase of the game loop and save profiles of slow cpu moves",
+    )
+    args = parser.parse_args()
+
+    chess = KnightFight(profile=args.profile)
     chess.run()
 
 
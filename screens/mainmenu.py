@@ -4,13 +4,16 @@ from screens.settings import settings_screen
 
 from sound.playback import play_game_music, play_title_music
 from knightfight.types import TitleChoice
+from config.config import AppConfig
+from helpers import startup
+from knightfight.assets import ASSETS
 
 
-def main_menu(config: dict, **kwargs: Any) -> TitleChoice:
+def main_menu(config: AppConfig, **kwargs: Any) -> TitleChoice:
     BLACK = (0, 0, 0)
     WHITE = (255, 255, 255)
 
-    board_size = config["board"]["size"]
+    board_size = config.board.size
     pygame.init()
     screen = pygame.display.set_mode((board_size, board_size))
     pygame.display.set_caption("KNIGHT FIGHT")
@@ -19,7 +22,7 @@ def main_menu(config: dict, **kwargs: Any) -> TitleChoice:
     save_game_func = kwargs.get("save_game_func", None)
 
     # load splash screen image
-    splash_image = pygame.image.load("assets/images/logo.png")
+    splash_image = ASSETS.image("logo.png")
 
     # play title music
     play_title_music()
@@ -43,10 +46,10 @@ def main_menu(config: dict, **kwargs: Any) -> TitleChoice:
     pygame.display.update()
 
     # draw menu options
-    font_name = config["game"]["font_name"]
-    font = pygame.font.Font(f"assets/fonts/{font_name}", 32)
-    status_font = pygame.font.Font(f"assets/fonts/{font_name}", 15)
-    game_name_font = pygame.font.Font(f"assets/fonts/{font_name}", 84)
+    font_name = config.game.font_name
+    font = ASSETS.font(font_name, 32)
+    status_font = ASSETS.font(font_name, 15)
+    game_name_font = ASSETS.font(font_name, 84)
 
     # status text
     status_text = status_font.render("", True, WHITE)
@@ -169,6 +172,12 @@ def main_menu(config: dict, **kwargs: Any) -> TitleChoice:
         if status_text:
             screen.blit(status_text, status_rect)
 
+        # the game's assets are loaded in the background meanwhile
+        if ASSETS.loading:
+            loaded, total = ASSETS.progress()
+            loading_text = status_font.render(f"Loading {loaded}/{total}", True, WHITE)
+            screen.blit(loading_text, loading_text.get_rect(topleft=(10, 60)))
+
         # Change the color of the text every 200 milliseconds
         if pygame.time.get_ticks() - color_time > 200:
             color_index = (color_index + 1) % len(colors)
@@ -184,6 +193,7 @@ def main_menu(config: dict, **kwargs: Any) -> TitleChoice:
         )
 
         pygame.display.flip()
+        startup.first_frame()
         clock.tick(60)
 
         pygame.display.update()
@@ -2,10 +2,12 @@ import sys
 import pygame
 import json
 import pygame
+from config.config import AppConfig, ConfigError, config_dict, reload_config
+from helpers.log import LOGGER
 
 
-def settings_screen(screen: pygame.surface.Surface, config: dict):
-    BOARD_SIZE = config["board"]["size"]
+def settings_screen(screen: pygame.surface.Surface, config: AppConfig):
+    BOARD_SIZE = config.board.size
     TRANSPARENT_BLACK = (0, 0, 0, 128)
     WHITE = (255, 255, 255)
     BLACK = (0, 0, 0)
@@ -24,7 +26,7 @@ def settings_screen(screen: pygame.surface.Surface, config: dict):
         (BOARD_SIZE // 2 - BOARD_SIZE // 2, BOARD_SIZE // 2 - BOARD_SIZE // 2),
     )
 
-    config_text = json.dumps(config, indent=4)
+    config_text = json.dumps(config_dict(), indent=4)
     lines = config_text.split("\n")
     y = font_height
     for line in lines:
@@ -38,12 +40,13 @@ def settings_screen(screen: pygame.surface.Surface, config: dict):
     pygame.draw.rect(screen, BLACK, edit_button)
     text = edit_font.render("Edit", True, (WHITE))
     draw_edit_test(screen, text, edit_button)
+    edited = False
 
     while True:
         for event in pygame.event.get():
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE or event.key == pygame.K_RETURN:
-                    return
+                    return reload_edited_config(edited)
             elif event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
@@ -56,6 +59,7 @@ def settings_screen(screen: pygame.surface.Surface, config: dict):
                     draw_edit_test(screen, text, edit_button)
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 if edit_button.collidepoint(event.pos):
+                    edited = True
                     # get working directory
                     import os
 
@@ -70,7 +74,7 @@ def settings_screen(screen: pygame.surface.Surface, config: dict):
                         os.system(f"open {cwd}/config.yml")
                 else:
                     # user clicked outside of the edit button
-                    return
+                    return reload_edited_config(edited)
 
         pygame.display.update()
 
@@ -83,3 +87,15 @@ def draw_edit_test(screen, text, edit_button):
             edit_button.centery - text.get_height() // 2,
         ),
     )
+
+
+def reload_edited_config(edited: bool) -> None:
+    """
+    Pick up changes made in the editor, a broken file keeps the current config
+    """
+    if not edited:
+        return
+    try:
+        reload_config()
+    except ConfigError as e:
+        LOGGER.error("Config not reloaded: %s", e)
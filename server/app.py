@@ -0,0 +1,340 @@
+"""
+Headless game server, hosts many concurrent games without pygame.
+
+Each game is a BoardState with no pieces or surfaces, only the chess.Board.
+Clients create games, submit moves, ask a cpu engine to move and follow a
+game over a websocket, which receives the game state after every move.
+
+    POST   /games                 {"fen": optional}       create a game
+    GET    /games/{id}                                    game state
+    DELETE /games/{id}                                    end a game
+    POST   /games/{id}/move       {"move": "e2e4"}        play a move
+    POST   /games/{id}/ai         {"ai": "piece_squares2", "depth": 2}
+    GET    /games/{id}/ws                                 state stream, accepts
+                                                          the move and ai bodies
+    GET    /stats                                         server counters
+
+Bad requests are answered with a 4xx status and {"error": reason}.
+
+The piece squares searches keep their state in module globals, so they run in
+a pool of worker processes, one search per process at a time. Stockfish runs
+as async engines on the server's event loop.
+
+Usage: python -m server.app [--port 8080] [--workers N] [--stockfish PATH]
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Set
+import chess
+from aiohttp import WSMsgType, web
+from ai.engines.stockfish import AsyncStockFishEngine
+from helpers.log import LOGGER
+from knightfight.state import BoardState
+
+AI_BACKENDS = ["random", "piece_squares", "piece_squares2", "stockfish"]
+DEFAULT_AI = "piece_squares2"
+DEFAULT_DEPTH = 2
+MAX_DEPTH = 5
+
+
+@web.middleware
+async def json_errors(request: web.Request, handler) -> web.StreamResponse:
+    """
+    Send errors as {"error": reason}, as the websocket does
+    """
+    try:
+        return await handler(request)
+    except web.HTTPException as e:
+        if e.status < 400:
+            raise
+        return web.json_response({"error": e.reason}, status=e.status)
+
+
+async def read_body(request: web.Request) -> dict:
+    """
+    The JSON object sent with the request, empty if there is no body
+    """
+    if not request.can_read_body:
+        return {}
+    try:
+        body = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(reason="Invalid JSON body")
+    return check_body(body)
+
+
+def check_body(body: object) -> dict:
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(reason="Body should be a JSON object")
+    return body
+
+
+def search_move(fen: str, ai: str, depth: int) -> Optional[str]:
+    """
+    Find a move in a worker process, returns the move as UCI
+    """
+    from ai.engines import piece_squares, piece_squares2
+
+    board = chess.Board(fen)
+    if ai == "piece_squares":
+        move = piece_squares.get_informed_move(board, depth)
+    else:
+        move = piece_squares2.get_informed_move(board, depth)
+    return move.uci() if move else None
+
+
+class Game:
+    def __init__(self, game_id: str, fen: Optional[str] = None) -> None:
+        self.id = game_id
+        self.state = BoardState()
+        if fen:
+            self.state.engine_state = chess.Board(fen)
+            self.update_game_over()
+        self.lock = asyncio.Lock()
+        self.listeners: Set[web.WebSocketResponse] = set()
+
+    @property
+    def board(self) -> chess.Board:
+        return self.state.engine_state
+
+    def to_json(self) -> dict:
+        board = self.board
+        outcome = board.outcome()
+        return {
+            "id": self.id,
+            "fen": board.fen(),
+            "turn": "white" if board.turn == chess.WHITE else "black",
+            "moves": [move.uci() for move in board.move_stack],
+            "check": board.is_check(),
+            "game_over": self.state.game_over,
+            "result": outcome.result() if outcome else None,
+        }
+
+    def push(self, move: chess.Move) -> None:
+        self.board.push(move)
+        self.update_game_over()
+
+    def update_game_over(self) -> None:
+        if self.board.is_game_over():
+            self.state.game_over = True
+            outcome = self.board.outcome()
+            self.state.winner = outcome.winner if outcome else None
+
+
+class GameServer:
+    def __init__(
+        self, workers: Optional[int] = None, stockfish_path: Optional[str] = None
+    ) -> None:
+        self.games: Dict[str, Game] = {}
+        self.ids = itertools.count(1)
+        self.workers = workers or os.cpu_count() or 1
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.stockfish_path = stockfish_path
+        self.stockfish: "asyncio.Queue[AsyncStockFishEngine]" = asyncio.Queue()
+        self.started = time.monotonic()
+        self.moves = 0
+        self.ai_moves = 0
+
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares=[json_errors])
+        app.add_routes(
+            [
+                web.post("/games", self.create_game),
+                web.get("/games/{id}", self.get_game),
+                web.delete("/games/{id}", self.delete_game),
+                web.post("/games/{id}/move", self.post_move),
+                web.post("/games/{id}/ai", self.post_ai_move),
+                web.get("/games/{id}/ws", self.stream_game),
+                web.get("/stats", self.get_stats),
+            ]
+        )
+        app.on_startup.append(self.start)
+        app.on_cleanup.append(self.stop)
+        return app
+
+    async def start(self, app: web.Application) -> None:
+        self.executor = ProcessPoolExecutor(self.workers)
+        if self.stockfish_path:
+            # one engine per worker is enough to keep the cpu busy
+            for _ in range(self.workers):
+                engine = await AsyncStockFishEngine.open(self.stockfish_path)
+                self.stockfish.put_nowait(engine)
+        LOGGER.info("Game server started with %d search workers", self.workers)
+
+    async def stop(self, app: web.Application) -> None:
+        for game in self.games.values():
+            for ws in list(game.listeners):
+                await ws.close()
+        while not self.stockfish.empty():
+            await self.stockfish.get_nowait().quit()
+        if self.executor:
+            self.executor.shutdown(cancel_futures=True)
+
+    def find_game(self, request: web.Request) -> Game:
+        game = self.games.get(request.match_info["id"])
+        if not game:
+            raise web.HTTPNotFound(reason="No such game")
+        return game
+
+    async def create_game(self, request: web.Request) -> web.Response:
+        body = await read_body(request)
+        fen = body.get("fen")
+        if fen is not None and not isinstance(fen, str):
+            raise web.HTTPBadRequest(reason="Invalid fen")
+        game_id = str(next(self.ids))
+        try:
+            game = Game(game_id, fen)
+        except ValueError as e:
+            raise web.HTTPBadRequest(reason=f"Invalid fen: {e}")
+        self.games[game_id] = game
+        return web.json_response(game.to_json(), status=201)
+
+    async def get_game(self, request: web.Request) -> web.Response:
+        return web.json_response(self.find_game(request).to_json())
+
+    async def delete_game(self, request: web.Request) -> web.Response:
+        game = self.find_game(request)
+        del self.games[game.id]
+        for ws in list(game.listeners):
+            await ws.close()
+        return web.Response(status=204)
+
+    async def post_move(self, request: web.Request) -> web.Response:
+        game = self.find_game(request)
+        body = await read_body(request)
+        state = await self.play_move(game, body.get("move", ""))
+        return web.json_response(state)
+
+    async def post_ai_move(self, request: web.Request) -> web.Response:
+        game = self.find_game(request)
+        body = await read_body(request)
+        state = await self.play_ai_move(
+            game, body.get("ai", DEFAULT_AI), body.get("depth", DEFAULT_DEPTH)
+        )
+        return web.json_response(state)
+
+    async def play_move(self, game: Game, uci: str) -> dict:
+        async with game.lock:
+            if game.state.game_over:
+                raise web.HTTPConflict(reason="Game is over")
+            try:
+                move = chess.Move.from_uci(uci)
+            except (ValueError, TypeError):
+                raise web.HTTPBadRequest(reason=f"Invalid move '{uci}'")
+            if not game.board.is_legal(move):
+                raise web.HTTPBadRequest(reason=f"Illegal move '{uci}'")
+            game.push(move)
+            self.moves += 1
+            state = game.to_json()
+        await self.broadcast(game, state)
+        return state
+
+    async def play_ai_move(self, game: Game, ai: str, depth: int) -> dict:
+        if ai not in AI_BACKENDS:
+            raise web.HTTPBadRequest(reason=f"Unknown ai '{ai}'")
+        if ai == "stockfish" and not self.stockfish_path:
+            raise web.HTTPBadRequest(reason="Stockfish is not configured")
+        try:
+            depth = max(1, min(int(depth), MAX_DEPTH))
+        except (ValueError, TypeError, OverflowError):
+            raise web.HTTPBadRequest(reason=f"Invalid depth '{depth}'")
+
+        async with game.lock:
+            if game.state.game_over:
+                raise web.HTTPConflict(reason="Game is over")
+            move = await self.find_move(game.board.copy(), ai, depth)
+            if not move or not game.board.is_legal(move):
+                raise web.HTTPInternalServerError(reason="No move found")
+            game.push(move)
+            self.moves += 1
+            self.ai_moves += 1
+            state = game.to_json()
+        await self.broadcast(game, state)
+        return state
+
+    async def find_move(
+        self, board: chess.Board, ai: str, depth: int
+    ) -> Optional[chess.Move]:
+        if ai == "random":
+            return random.choice(list(board.legal_moves))
+        if ai == "stockfish":
+            engine = await self.stockfish.get()
+            try:
+                return await engine.get_informed_move(board)
+            finally:
+                self.stockfish.put_nowait(engine)
+
+        loop = asyncio.get_running_loop()
+        uci = await loop.run_in_executor(
+            self.executor, search_move, board.fen(), ai, depth
+        )
+        return chess.Move.from_uci(uci) if uci else None
+
+    async def broadcast(self, game: Game, state: dict) -> None:
+        for ws in list(game.listeners):
+            try:
+                await ws.send_json(state)
+            except ConnectionResetError:
+                game.listeners.discard(ws)
+
+    async def stream_game(self, request: web.Request) -> web.WebSocketResponse:
+        game = self.find_game(request)
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        game.listeners.add(ws)
+        try:
+            await ws.send_json(game.to_json())
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                try:
+                    body = check_body(msg.json())
+                    if "move" in body:
+                        await self.play_move(game, body["move"])
+                    elif "ai" in body:
+                        await self.play_ai_move(
+                            game, body["ai"], body.get("depth", DEFAULT_DEPTH)
+                        )
+                except web.HTTPException as e:
+                    await ws.send_json({"error": e.reason})
+                except ValueError:
+                    await ws.send_json({"error": "Invalid message"})
+        finally:
+            game.listeners.discard(ws)
+        return ws
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        uptime = time.monotonic() - self.started
+        return web.json_response(
+            {
+                "games": len(self.games),
+                "moves": self.moves,
+                "ai_moves": self.ai_moves,
+                "moves_per_sec": self.moves / uptime if uptime else 0.0,
+                "uptime": uptime,
+            }
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Headless KnightFight server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--workers", type=int, default=None, help="search processes (default: cpus)"
+    )
+    parser.add_argument("--stockfish", default=None, help="path to stockfish")
+    args = parser.parse_args()
+
+    server = GameServer(args.workers, args.stockfish)
+    web.run_app(server.make_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Load test for the headless game server.
+
+Plays many games at once against a running server, each client submitting
+random legal moves and, optionally, asking the cpu for every other move. The
+latency of every request is measured and the throughput and latency
+percentiles are printed at the end.
+
+Usage: python -m server.loadtest [--url http://127.0.0.1:8080] [--games 50]
+       [--moves 40] [--ai piece_squares2 --depth 1]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from typing import List, Optional
+import aiohttp
+import chess
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def play_game(
+    session: aiohttp.ClientSession,
+    url: str,
+    moves: int,
+    ai: Optional[str],
+    depth: int,
+    latencies: List[float],
+) -> int:
+    """
+    Play one game, return the number of moves played
+    """
+    async with session.post(f"{url}/games") as resp:
+        state = await resp.json()
+    game_url = f"{url}/games/{state['id']}"
+    board = chess.Board(state["fen"])
+
+    played = 0
+    while played < moves and not board.is_game_over():
+        start = time.perf_counter()
+        if ai and board.turn == chess.BLACK:
+            request = session.post(f"{game_url}/ai", json={"ai": ai, "depth": depth})
+        else:
+            move = random.choice(list(board.legal_moves))
+            request = session.post(f"{game_url}/move", json={"move": move.uci()})
+        async with request as resp:
+            resp.raise_for_status()
+            state = await resp.json()
+        latencies.append(time.perf_counter() - start)
+        board = chess.Board(state["fen"])
+        played += 1
+
+    async with session.delete(game_url):
+        pass
+    return played
+
+
+async def run(args: argparse.Namespace) -> None:
+    latencies: List[float] = []
+    connector = aiohttp.TCPConnector(limit=args.games)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        start = time.perf_counter()
+        played = await asyncio.gather(
+            *(
+                play_game(session, args.url, args.moves, args.ai, args.depth, latencies)
+                for _ in range(args.games)
+            )
+        )
+        elapsed = time.perf_counter() - start
+
+    total = sum(played)
+    print(f"{args.games} games, {total} moves in {elapsed:.2f}s")
+    print(f"moves/sec {total / elapsed:.1f}")
+    print(
+        f"latency p50 {percentile(latencies, 50) * 1000:.1f}ms "
+        f"p90 {percentile(latencies, 90) * 1000:.1f}ms "
+        f"p99 {percentile(latencies, 99) * 1000:.1f}ms "
+        f"max {max(latencies, default=0) * 1000:.1f}ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the game server")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--games", type=int, default=50, help="concurrent games")
+    parser.add_argument("--moves", type=int, default=40, help="moves per game")
+    parser.add_argument(
+        "--ai", default=None, help="cpu backend playing black, random moves if unset"
+    )
+    parser.add_argument("--depth", type=int, default=1, help="cpu search depth")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
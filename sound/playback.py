@@ -4,6 +4,7 @@ Playback module for the sound package.
 
 import pygame
 from config import config
+from knightfight.assets import ASSETS
 
 
 def play_sound(sound_file: str, volume: float = 1.0) -> None:
@@ -11,10 +12,12 @@ def play_sound(sound_file: str, volume: float = 1.0) -> None:
     Play a sound from the assets folder
     """
 
-    if config.APP_CONFIG["game"]["sound"] == False:
+    if config.APP_CONFIG.game.sound == False:
         return
 
-    sound = pygame.mixer.Sound(f"assets/sounds/{sound_file}")
+    sound = ASSETS.sound(sound_file)
+    if sound is None:
+        return
     sound.set_volume(volume)
     sound.play()
 
@@ -23,10 +26,10 @@ def play_music(music_file: str, volume: float = 1.0) -> None:
     """
     Play a music from the assets folder
     """
-    if config.APP_CONFIG["game"]["music"] == False:
+    if config.APP_CONFIG.game.music == False:
         return
 
-    pygame.mixer.music.load(f"assets/sounds/{music_file}")
+    pygame.mixer.music.load(ASSETS.music(music_file), music_file)
     pygame.mixer.music.set_volume(volume)
     pygame.mixer.music.play(-1)
 
@@ -35,8 +38,8 @@ def play_game_music() -> None:
     """
     Play the game music
     """
-    ost = config.APP_CONFIG["game"]["soundtrack"]
-    volume = config.APP_CONFIG["game"]["music_vol"]
+    ost = config.APP_CONFIG.game.soundtrack
+    volume = config.APP_CONFIG.game.music_vol
     play_music(ost, volume)
 
 
@@ -44,7 +47,7 @@ def play_tense_music() -> None:
     """
     Play the tense music
     """
-    volume = config.APP_CONFIG["game"]["music_vol"]
+    volume = config.APP_CONFIG.game.music_vol
     play_music("tense.mp3", volume)
 
 
@@ -52,5 +55,22 @@ def play_title_music() -> None:
     """
     Play the title music
     """
-    volume = config.APP_CONFIG["game"]["music_vol"]
+    volume = config.APP_CONFIG.game.music_vol
     play_music("title.mp3", volume)
+
+
+def on_config_changed(old: config.AppConfig, new: config.AppConfig) -> None:
+    """
+    Apply music setting changes to the music that is playing
+    """
+    if old.game == new.game or not pygame.mixer.get_init():
+        return
+    if not new.game.music:
+        pygame.mixer.music.stop()
+    elif not old.game.music or old.game.soundtrack != new.game.soundtrack:
+        play_game_music()
+    else:
+        pygame.mixer.music.set_volume(new.game.music_vol)
+
+
+config.subscribe(on_config_changed)
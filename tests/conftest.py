@@ -0,0 +1,93 @@
+import asyncio
+import threading
+import time
+from typing import Any, List, Tuple
+import pytest
+from aiohttp import web
+
+
+class CompletionStub:
+    """
+    Local stand-in for the OpenAI completions endpoint. Each request takes the
+    next reply from replies, or default once they run out:
+
+        ("choices", ["e2e4", "e7e5"])  a completion with these texts
+        ("status", 500)                an error response
+        ("sleep", 2.0)                 no response for this many seconds
+    """
+
+    def __init__(self) -> None:
+        self.replies: List[Tuple[str, Any]] = []
+        self.default: Tuple[str, Any] = ("status", 500)
+        self.requests: List[Tuple[float, dict]] = []
+        # client address of each request, the same for a reused connection
+        self.peers: List[Tuple[str, int]] = []
+        self.loop = asyncio.new_event_loop()
+        self.runner: web.AppRunner
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.api_base = ""
+
+    async def completions(self, request: web.Request) -> web.Response:
+        self.requests.append((time.monotonic(), await request.json()))
+        self.peers.append(request.transport.get_extra_info("peername"))
+        kind, value = self.replies.pop(0) if self.replies else self.default
+        if kind == "sleep":
+            try:
+                await asyncio.wait_for(self.closing.wait(), value)
+            except asyncio.TimeoutError:
+                pass
+            kind, value = "choices", []
+        if kind == "status":
+            return web.json_response(
+                {"error": {"message": f"stub error {value}", "type": "server_error"}},
+                status=value,
+            )
+        return web.json_response(
+            {
+                "id": "cmpl-stub",
+                "object": "text_completion",
+                "created": int(time.time()),
+                "model": "stub",
+                "choices": [
+                    {
+                        "text": text,
+                        "index": i,
+                        "logprobs": None,
+                        "finish_reason": "stop",
+                    }
+                    for i, text in enumerate(value)
+                ],
+            }
+        )
+
+    async def setup(self) -> None:
+        # ends sleeping requests, so the server stops straight away
+        self.closing = asyncio.Event()
+        app = web.Application()
+        app.router.add_post("/v1/completions", self.completions)
+        app.router.add_post("/v1/engines/{engine}/completions", self.completions)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        self.api_base = f"http://127.0.0.1:{port}/v1"
+
+    def start(self) -> None:
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.setup(), self.loop).result()
+
+    def stop(self) -> None:
+        self.loop.call_soon_threadsafe(self.closing.set)
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+@pytest.fixture
+def completion_stub():
+    stub = CompletionStub()
+    stub.start()
+    yield stub
+    stub.stop()
@@ -0,0 +1,57 @@
+import chess
+from ai.engines import analysis, piece_squares2
+
+PGN = """[Event "Test"]
+[White "A"]
+[Black "B"]
+[Result "*"]
+
+1. e4 e5 2. Qh5 Nc6 3. Bc4 Nf6 4. Qxf7# *
+
+"""
+
+
+def test_restricted_search_plays_the_given_move():
+    board = chess.Board()
+    move = chess.Move.from_uci("a2a3")
+    found, _ = piece_squares2.search(board, 2, root_moves=[move])
+    assert found == move
+
+
+def test_played_move_scored_at_the_same_depth():
+    # black to move, Nf6 walks into mate
+    board = chess.Board(
+        "r1bqkbnr/pppp1ppp/2n5/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR b KQkq - 3 3"
+    )
+    best, best_score, played_score = analysis.analyse_position(board.fen(), "g8f6")
+    assert chess.Move.from_uci(best) in board.legal_moves
+    assert best != "g8f6"
+    assert best_score - played_score >= analysis.BLUNDER
+
+    # playing the best move loses nothing
+    _, _, played_score = analysis.analyse_position(board.fen(), best)
+    assert played_score == best_score
+
+
+def test_output_is_appended_to(tmp_path):
+    pgn_path = tmp_path / "games.pgn"
+    pgn_path.write_text(PGN)
+    output_path = tmp_path / "annotated.pgn"
+    output_path.write_text("existing\n\n")
+
+    assert analysis.run_analysis(str(pgn_path), str(output_path), depth=1, workers=1)
+    text = output_path.read_text()
+    assert text.startswith("existing\n\n")
+    assert "Qxf7#" in text
+
+
+def test_partial_output_is_dropped_on_resume(tmp_path):
+    output_path = tmp_path / "annotated.pgn"
+    progress_path = str(output_path) + ".progress"
+    output_path.write_text("existing\n")
+
+    assert analysis.load_progress(progress_path, str(output_path)) == (0, 0)
+    with open(output_path, "a") as output:
+        output.write("half a game")
+    assert analysis.load_progress(progress_path, str(output_path)) == (0, 0)
+    assert output_path.read_text() == "existing\n"
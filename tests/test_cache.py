@@ -0,0 +1,43 @@
+import time
+import chess
+from ai.cache import MoveCache
+
+
+def board_after(*moves):
+    board = chess.Board()
+    for move in moves:
+        board.push_san(move)
+    return board
+
+
+def test_disk_hit_is_recently_used(tmp_path):
+    path = str(tmp_path / "moves.db")
+    start, e4, d4 = board_after(), board_after("e4"), board_after("d4")
+
+    cache = MoveCache(path=path, max_disk_entries=2)
+    cache.put(start, "piece_squares2", "", chess.Move.from_uci("e2e4"))
+    time.sleep(0.01)
+    cache.put(e4, "piece_squares2", "", chess.Move.from_uci("e7e5"))
+    cache.close()
+
+    # a new cache only finds the start position on disk
+    cache = MoveCache(path=path, max_disk_entries=2)
+    assert cache.get(start, "piece_squares2", "") == chess.Move.from_uci("e2e4")
+    time.sleep(0.01)
+    cache.put(d4, "piece_squares2", "", chess.Move.from_uci("d7d5"))
+    cache.close()
+
+    cache = MoveCache(path=path, max_disk_entries=2)
+    assert cache.get(start, "piece_squares2", "") is not None
+    assert cache.get(d4, "piece_squares2", "") is not None
+    assert cache.get(e4, "piece_squares2", "") is None
+    cache.close()
+
+
+def test_illegal_move_is_a_miss():
+    cache = MoveCache()
+    board = board_after()
+    cache.put(board, "piece_squares2", "", chess.Move.from_uci("e2e4"))
+    assert cache.get(board, "stockfish", "") is None
+    assert cache.get(board_after("e4"), "piece_squares2", "") is None
+    assert cache.hits == 0 and cache.misses == 2
@@ -0,0 +1,38 @@
+import asyncio
+import chess
+from ai.openai.api import OpenAIAPIWrapper
+
+START_MOVES = list(chess.Board().legal_moves)
+
+
+def ask(stub, candidates=3):
+    client = OpenAIAPIWrapper("test-key", stub.api_base, candidates=candidates)
+    return asyncio.run(
+        client.aget_next_chess_move(START_MOVES, chess.Board().fen(), chess.WHITE)
+    )
+
+
+def test_asks_for_n_candidates(completion_stub):
+    completion_stub.replies = [("choices", ["e2e4", "d2d4", "g1f3", "c2c4"])]
+    assert ask(completion_stub, candidates=4) == chess.Move.from_uci("e2e4")
+    _, body = completion_stub.requests[0]
+    assert body["n"] == 4
+
+
+def test_skips_illegal_and_malformed_candidates(completion_stub):
+    completion_stub.replies = [
+        ("choices", ["e2e5", "I would play the knight", "zz99", "g1f3", "d2d4"])
+    ]
+    assert ask(completion_stub, candidates=5) == chess.Move.from_uci("g1f3")
+    assert len(completion_stub.requests) == 1
+
+
+def test_move_in_a_sentence(completion_stub):
+    completion_stub.replies = [("choices", ["The best move is d2d4."])]
+    assert ask(completion_stub, candidates=1) == chess.Move.from_uci("d2d4")
+
+
+def test_no_legal_candidate(completion_stub):
+    completion_stub.replies = [("choices", ["e7e5", "", "resign"])]
+    assert ask(completion_stub) is None
+    assert len(completion_stub.requests) == 1
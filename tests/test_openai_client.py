@@ -0,0 +1,128 @@
+import time
+import chess
+import pytest
+from ai.cache import MoveCache
+from ai.openai import api
+from ai.openai.api import OpenAIAPIWrapper
+from ai.player import AIPlayer
+
+START_MOVES = list(chess.Board().legal_moves)
+
+
+@pytest.fixture
+def make_client(completion_stub):
+    clients = []
+
+    def make(**kwargs):
+        options = dict(read_timeout=5.0, max_retries=2, backoff=0.05, move_budget=10.0)
+        options.update(kwargs)
+        clients.append(
+            OpenAIAPIWrapper("test-key", completion_stub.api_base, **options)
+        )
+        return clients[-1]
+
+    yield make
+    for client in clients:
+        client.close()
+
+
+def next_move(client):
+    return client.get_next_chess_move(START_MOVES, chess.Board().fen(), chess.WHITE)
+
+
+def test_read_timeout(completion_stub, make_client):
+    completion_stub.replies = [("sleep", 3.0)]
+    client = make_client(read_timeout=0.3, max_retries=0)
+    start = time.monotonic()
+    assert next_move(client) is None
+    assert time.monotonic() - start < 2.0
+    assert len(completion_stub.requests) == 1
+
+
+def test_timed_out_request_is_retried(completion_stub, make_client):
+    completion_stub.replies = [("sleep", 3.0), ("choices", ["e2e4"])]
+    client = make_client(read_timeout=0.3, max_retries=1)
+    assert next_move(client) == chess.Move.from_uci("e2e4")
+    assert len(completion_stub.requests) == 2
+
+
+def test_retries_with_backoff(completion_stub, make_client, monkeypatch):
+    # the jitter always picks the longest delay
+    monkeypatch.setattr(api.random, "uniform", lambda low, high: high)
+    completion_stub.replies = [
+        ("status", 500),
+        ("status", 429),
+        ("choices", ["d2d4"]),
+    ]
+    client = make_client(backoff=0.2)
+    assert next_move(client) == chess.Move.from_uci("d2d4")
+
+    times = [when for when, _ in completion_stub.requests]
+    assert len(times) == 3
+    assert times[1] - times[0] >= 0.2
+    assert times[2] - times[1] >= 0.4
+
+
+def test_retries_are_bounded(completion_stub, make_client):
+    completion_stub.default = ("status", 503)
+    client = make_client(max_retries=2)
+    assert next_move(client) is None
+    assert len(completion_stub.requests) == 3
+
+
+def test_client_errors_are_not_retried(completion_stub, make_client):
+    completion_stub.default = ("status", 401)
+    client = make_client()
+    assert next_move(client) is None
+    assert len(completion_stub.requests) == 1
+
+
+def test_budget_falls_back_to_piece_squares2(completion_stub, make_client):
+    completion_stub.default = ("sleep", 5.0)
+    client = make_client(move_budget=0.5, max_retries=5)
+    player = AIPlayer(chess.WHITE, ai="openai", complexity=1, openai_client=client)
+
+    board = chess.Board()
+    start = time.monotonic()
+    move = player.choose_move(board)
+    assert time.monotonic() - start < 3.0
+    assert move in board.legal_moves
+
+
+def test_fallback_move_is_not_cached(completion_stub, make_client):
+    completion_stub.default = ("status", 401)
+    cache = MoveCache()
+    client = make_client()
+    player = AIPlayer(
+        chess.WHITE, ai="openai", complexity=1, openai_client=client, move_cache=cache
+    )
+
+    board = chess.Board()
+    assert player.choose_move(board) in board.legal_moves
+    assert player.fell_back
+    assert cache.get(board, "openai", player.cache_limits()) is None
+
+
+def test_openai_moves_cached_per_model_and_temperature(completion_stub, make_client):
+    completion_stub.default = ("choices", ["g1f3"])
+    cache = MoveCache()
+    board = chess.Board()
+    for temperature in [0.0, 1.0]:
+        client = make_client(temperature=temperature)
+        player = AIPlayer(
+            chess.WHITE, ai="openai", openai_client=client, move_cache=cache
+        )
+        assert player.choose_move(board) == chess.Move.from_uci("g1f3")
+
+    # one request per temperature, the second player did not reuse the first move
+    assert len(completion_stub.requests) == 2
+    assert cache.get(board, "openai", player.cache_limits()) is not None
+
+
+def test_connections_are_reused(completion_stub, make_client):
+    completion_stub.default = ("choices", ["e2e4"])
+    client = make_client()
+    for _ in range(3):
+        assert next_move(client) == chess.Move.from_uci("e2e4")
+    assert len(completion_stub.requests) == 3
+    assert len(set(completion_stub.peers)) == 1
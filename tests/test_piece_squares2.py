@@ -0,0 +1,10 @@
+import chess
+from ai.engines import piece_squares2
+
+
+def test_mate_in_one_at_depth_one():
+    board = chess.Board("k7/8/1K6/8/8/8/8/6Q1 w - - 0 1")
+    move, stats = piece_squares2.search(board, 1)
+    board.push(move)
+    assert board.is_checkmate()
+    assert stats.score >= piece_squares2.MATE_SCORE - piece_squares2.MAX_PLY
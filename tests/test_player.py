@@ -0,0 +1,32 @@
+import chess
+from ai.player import AIPlayer
+
+
+def test_ponder_hit_plays_the_full_depth_move():
+    player = AIPlayer(chess.BLACK, ai="piece_squares2", complexity=3, ponder=True)
+    board = chess.Board(
+        "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/2N2N2/PPPP1PPP/R1BQKB1R b KQkq - 3 3"
+    )
+    board.push(player.find_move(board, list(board.legal_moves)))
+    player.start_pondering(board)
+    assert player.ponder_predicted
+
+    # the predicted reply is played straight away, before the search is done
+    board.push(player.last_stats.pv[1])
+    move = player.take_ponder_move(board)
+    assert move in board.legal_moves
+    assert player.last_stats.depth == 3
+
+
+def test_ponder_miss_searches_again():
+    player = AIPlayer(chess.BLACK, ai="piece_squares2", complexity=2, ponder=True)
+    board = chess.Board(
+        "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/2N2N2/PPPP1PPP/R1BQKB1R b KQkq - 3 3"
+    )
+    board.push(player.find_move(board, list(board.legal_moves)))
+    player.start_pondering(board)
+
+    predicted = player.last_stats.pv[1]
+    board.push(next(move for move in board.legal_moves if move != predicted))
+    assert player.take_ponder_move(board) is None
+    assert player.ponder_thread is None
@@ -0,0 +1,58 @@
+import logging
+from typing import Optional
+import chess
+import chess.engine
+from ai import player
+from ai.engines.pool import EnginePool
+from ai.player import AIPlayer
+from knightfight.types import Engine
+
+
+class FakeEngine(Engine):
+    def __init__(self, error: Optional[Exception] = None) -> None:
+        self.error = error
+        self.last_stats = None
+
+    def get_informed_move(self, board: chess.Board) -> chess.Move:
+        if self.error:
+            raise self.error
+        return next(iter(board.legal_moves))
+
+    def quit(self) -> None:
+        pass
+
+
+def test_busy_pool_falls_back_to_piece_squares2(monkeypatch):
+    monkeypatch.setattr(player, "ENGINE_CHECKOUT_TIMEOUT", 0.01)
+    pool = EnginePool(FakeEngine, size=1)
+    cpu = AIPlayer(chess.WHITE, ai="stockfish", complexity=1, engine_pool=pool)
+    board = chess.Board()
+
+    with pool.engine():
+        move = cpu.find_move(board, list(board.legal_moves))
+    assert move in board.legal_moves
+    assert cpu.fell_back
+    assert pool.get_stats().timeouts == 1
+    pool.close()
+
+
+def test_failed_engine_falls_back_and_is_replaced():
+    pool = EnginePool(
+        lambda: FakeEngine(chess.engine.EngineTerminatedError("crashed")), size=1
+    )
+    cpu = AIPlayer(chess.WHITE, ai="stockfish", complexity=1, engine_pool=pool)
+    board = chess.Board()
+
+    assert cpu.find_move(board, list(board.legal_moves)) in board.legal_moves
+    assert cpu.fell_back
+    assert pool.get_stats().replaced == 1
+    pool.close()
+
+
+def test_stats_are_logged_while_in_use(caplog):
+    pool = EnginePool(FakeEngine, size=1, stats_interval=0)
+    with caplog.at_level(logging.INFO, logger="helpers.log"):
+        with pool.engine():
+            pass
+    assert "Engine pool: " in caplog.text
+    pool.close()
@@ -0,0 +1,93 @@
+import asyncio
+from aiohttp.test_utils import TestClient, TestServer
+from server.app import GameServer
+
+
+def run_with_client(test):
+    async def run():
+        client = TestClient(TestServer(GameServer(workers=1).make_app()))
+        await client.start_server()
+        try:
+            await test(client)
+        finally:
+            await client.close()
+
+    asyncio.run(run())
+
+
+async def create_game(client) -> str:
+    resp = await client.post("/games")
+    assert resp.status == 201
+    return (await resp.json())["id"]
+
+
+async def assert_bad_request(resp, error: str) -> None:
+    assert resp.status == 400
+    assert (await resp.json())["error"].startswith(error)
+
+
+def test_malformed_json():
+    async def test(client):
+        game_id = await create_game(client)
+        for path in ["/games", f"/games/{game_id}/move", f"/games/{game_id}/ai"]:
+            resp = await client.post(path, data="{not json")
+            await assert_bad_request(resp, "Invalid JSON body")
+            resp = await client.post(path, json=["e2e4"])
+            await assert_bad_request(resp, "Body should be a JSON object")
+
+    run_with_client(test)
+
+
+def test_invalid_values():
+    async def test(client):
+        game_id = await create_game(client)
+        resp = await client.post(f"/games/{game_id}/ai", json={"depth": "deep"})
+        await assert_bad_request(resp, "Invalid depth")
+        resp = await client.post(f"/games/{game_id}/ai", json={"depth": None})
+        await assert_bad_request(resp, "Invalid depth")
+        # json.loads reads 1e999 as inf, which int() cannot convert
+        resp = await client.post(
+            f"/games/{game_id}/ai",
+            data='{"depth": 1e999}',
+            headers={"Content-Type": "application/json"},
+        )
+        await assert_bad_request(resp, "Invalid depth")
+        resp = await client.post(f"/games/{game_id}/move", json={"move": 42})
+        await assert_bad_request(resp, "Invalid move")
+        resp = await client.post(f"/games/{game_id}/move", json={"move": "e2e5"})
+        await assert_bad_request(resp, "Illegal move")
+        resp = await client.post("/games", json={"fen": 1})
+        await assert_bad_request(resp, "Invalid fen")
+
+    run_with_client(test)
+
+
+def test_moves():
+    async def test(client):
+        game_id = await create_game(client)
+        resp = await client.post(f"/games/{game_id}/move", json={"move": "e2e4"})
+        assert resp.status == 200
+        resp = await client.post(f"/games/{game_id}/ai", json={"ai": "random"})
+        assert resp.status == 200
+        assert len((await resp.json())["moves"]) == 2
+
+        resp = await client.get("/games/nope")
+        assert resp.status == 404
+        assert (await resp.json())["error"] == "No such game"
+
+    run_with_client(test)
+
+
+def test_websocket_errors():
+    async def test(client):
+        game_id = await create_game(client)
+        async with client.ws_connect(f"/games/{game_id}/ws") as ws:
+            await ws.receive_json()
+            await ws.send_str("{not json")
+            assert (await ws.receive_json())["error"] == "Invalid message"
+            await ws.send_json(["e2e4"])
+            assert (await ws.receive_json())["error"].startswith("Body should")
+            await ws.send_json({"ai": "random", "depth": "deep"})
+            assert (await ws.receive_json())["error"].startswith("Invalid depth")
+
+    run_with_client(test)
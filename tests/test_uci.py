@@ -0,0 +1,122 @@
+import io
+import sys
+import time
+from pathlib import Path
+import chess
+import chess.engine
+import pytest
+from ai.engines import piece_squares2
+from ai.engines.uci import DEFAULT_HASH_MB, UCIEngine
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture
+def engine():
+    engine = chess.engine.SimpleEngine.popen_uci(
+        [sys.executable, "-m", "ai.engines.uci"], cwd=ROOT
+    )
+    yield engine
+    engine.quit()
+
+
+def test_play_depth(engine):
+    board = chess.Board()
+    result = engine.play(board, chess.engine.Limit(depth=2))
+    assert result.move in board.legal_moves
+    assert result.ponder is None
+
+
+def test_play_movetime(engine):
+    board = chess.Board(
+        "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3"
+    )
+    start = time.perf_counter()
+    result = engine.play(board, chess.engine.Limit(time=0.3))
+    assert result.move in board.legal_moves
+    assert time.perf_counter() - start < 2.0
+
+
+def test_stop_infinite(engine):
+    board = chess.Board()
+    with engine.analysis(board) as analysis:
+        for info in analysis:
+            if info.get("depth", 0) >= 2:
+                break
+        # leaving the block sends stop
+    best = analysis.wait()
+    assert best.move in board.legal_moves
+
+
+def test_configure_hash(engine):
+    engine.configure({"Hash": 16})
+    board = chess.Board()
+    result = engine.play(board, chess.engine.Limit(depth=2))
+    assert result.move in board.legal_moves
+
+
+def test_hash_resized_after_search():
+    output = io.StringIO()
+    uci = UCIEngine(output)
+    try:
+        uci.handle("go infinite")
+        uci.handle("setoption name Hash value 1")
+        assert piece_squares2.TT_MAX_ENTRIES == (
+            DEFAULT_HASH_MB * piece_squares2.TT_ENTRIES_PER_MB
+        )
+        uci.handle("stop")
+        assert piece_squares2.TT_MAX_ENTRIES == piece_squares2.TT_ENTRIES_PER_MB
+        assert output.getvalue().splitlines()[-1].startswith("bestmove ")
+    finally:
+        uci.stop()
+        piece_squares2.set_hash_size(DEFAULT_HASH_MB)
+
+
+def test_bad_input_is_ignored():
+    output = io.StringIO()
+    uci = UCIEngine(output)
+    try:
+        uci.handle("position startpos moves e2e4")
+        for line in [
+            "setoption name Hash value abc",
+            "position fen not a fen",
+            "position startpos moves e2e4 e2e4",
+            "go depth deep",
+        ]:
+            assert uci.handle(line)
+            uci.stop()
+        assert uci.handle("isready")
+        assert output.getvalue().splitlines()[-1] == "readyok"
+        assert uci.board.move_stack == [chess.Move.from_uci("e2e4")]
+    finally:
+        uci.stop()
+        piece_squares2.set_hash_size(DEFAULT_HASH_MB)
+
+
+def test_infinite_holds_bestmove_until_stop():
+    output = io.StringIO()
+    uci = UCIEngine(output)
+    try:
+        # depth 1 finishes at once, bestmove still waits for stop
+        uci.handle("go infinite depth 1")
+        time.sleep(0.3)
+        assert "bestmove" not in output.getvalue()
+        uci.handle("stop")
+        assert output.getvalue().splitlines()[-1].startswith("bestmove ")
+    finally:
+        uci.stop()
+
+
+def test_ponder_holds_bestmove_until_ponderhit():
+    output = io.StringIO()
+    uci = UCIEngine(output)
+    try:
+        uci.handle("position startpos moves e2e4")
+        uci.handle("go ponder depth 1 wtime 1000 btime 1000")
+        time.sleep(0.3)
+        assert "bestmove" not in output.getvalue()
+        uci.handle("ponderhit")
+        uci.search_thread.join(timeout=5)
+        assert output.getvalue().splitlines()[-1].startswith("bestmove ")
+    finally:
+        uci.stop()